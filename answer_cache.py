@@ -0,0 +1,161 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Load tests point this at a scratch file so fake answers never reach the real cache
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", os.path.join("data", "answer_cache.sqlite3"))
+# Cosine similarity above which a cached answer is reused for a new question
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+# Entries older than this many seconds are never served (default: 7 days)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+# Maximum entries kept per namespace; least recently used ones are evicted first
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+def _unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    # Answers keyed by question embedding, shared across sessions, processes and restarts.
+    # Namespaces keep languages and tabs apart, e.g. "hi:urgent".
+    def __init__(self, path=ANSWER_CACHE_DB, threshold=ANSWER_CACHE_THRESHOLD,
+                 ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                context TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS answers_namespace ON answers (namespace, created_at);
+            CREATE TABLE IF NOT EXISTS stats (
+                namespace TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self._conn.commit()
+
+    def lookup(self, namespace, embedding):
+        # Returns (answer, context_docs, similarity) for the closest fresh entry, or None
+        query = _unit_vector(embedding)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM answers WHERE namespace = ? AND created_at >= ? AND length(embedding) > 0",
+                (namespace, now - self.ttl),
+            ).fetchall()
+            best_id, best_score = None, -1.0
+            if rows:
+                matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                best_id, best_score = rows[best][0], float(scores[best])
+
+            if best_id is not None and best_score >= self.threshold:
+                answer, context = self._conn.execute(
+                    "SELECT answer, context FROM answers WHERE id = ?", (best_id,)
+                ).fetchone()
+                self._conn.execute(
+                    "UPDATE answers SET hits = hits + 1, last_used_at = ? WHERE id = ?", (now, best_id)
+                )
+                self._count(namespace, "hits")
+                self._conn.commit()
+                return answer, json.loads(context), best_score
+
+            self._count(namespace, "misses")
+            self._conn.commit()
+            return None
+
+    def lookup_text(self, namespace, question):
+        # Like lookup, for callers that do not embed questions: only an entry stored
+        # under exactly this question text matches
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, answer, context FROM answers WHERE namespace = ? AND question = ? AND created_at >= ?"
+                " ORDER BY created_at DESC LIMIT 1",
+                (namespace, question, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE answers SET hits = hits + 1, last_used_at = ? WHERE id = ?", (now, row[0])
+                )
+            self._count(namespace, "hits" if row is not None else "misses")
+            self._conn.commit()
+        return (row[1], json.loads(row[2]), 1.0) if row is not None else None
+
+    def put(self, namespace, question, embedding, answer, context_docs):
+        # An entry stored without an embedding is only found by lookup_text
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (namespace, question, embedding, answer, context, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, question, _unit_vector(embedding).tobytes() if embedding is not None else b"", answer,
+                 json.dumps(context_docs, ensure_ascii=False), now, now),
+            )
+            self._evict(namespace, now)
+            self._conn.commit()
+
+    def clear(self):
+        # Drops every stored answer, e.g. once the books they were built from changed;
+        # returns how many there were
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM answers").rowcount
+            self._conn.commit()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT namespace, hits, misses FROM stats").fetchall()
+            sizes = dict(self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM answers GROUP BY namespace"
+            ).fetchall())
+        result = {}
+        for namespace, hits, misses in rows:
+            total = hits + misses
+            result[namespace] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": sizes.get(namespace, 0),
+            }
+        return result
+
+    def _count(self, namespace, column):
+        self._conn.execute("INSERT OR IGNORE INTO stats (namespace) VALUES (?)", (namespace,))
+        self._conn.execute(f"UPDATE stats SET {column} = {column} + 1 WHERE namespace = ?", (namespace,))
+
+    def _evict(self, namespace, now):
+        self._conn.execute(
+            "DELETE FROM answers WHERE namespace = ? AND created_at < ?", (namespace, now - self.ttl)
+        )
+        self._conn.execute(
+            "DELETE FROM answers WHERE id IN ("
+            " SELECT id FROM answers WHERE namespace = ?"
+            " ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (namespace, self.max_entries),
+        )
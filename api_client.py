@@ -0,0 +1,49 @@
+import json
+
+import requests
+
+
+class SahayakApiClient:
+    # Thin client for api_server.py, used by the Streamlit app and other front ends
+    def __init__(self, base_url: str, timeout: float = 120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # One session keeps the connection to the API alive between questions
+        self.session = requests.Session()
+
+    def health(self):
+        response = self.session.get(f"{self.base_url}/health", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def retrieve(self, queries: list, top_k: int):
+        response = self.session.post(
+            f"{self.base_url}/retrieve", json={"queries": queries, "top_k": top_k}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def answer(self, question: str, language: str, tab: str, top_k: int, user: str = None):
+        # `user` identifies the asker for the per-user rate limit; the client address is used without it
+        response = self.session.post(
+            f"{self.base_url}/answer",
+            json={"question": question, "language": language, "tab": tab, "top_k": top_k, "user": user},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def stream_answer(self, question: str, language: str, tab: str, top_k: int, user: str = None):
+        # Yields the NDJSON events of a streamed answer as they arrive
+        with self.session.post(
+            f"{self.base_url}/answer",
+            json={"question": question, "language": language, "tab": tab, "top_k": top_k, "stream": True,
+                  "user": user},
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    yield json.loads(line)
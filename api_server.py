@@ -0,0 +1,373 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import backend
+from answer_cache import AnswerCache
+from context_builder import CONTEXT_CANDIDATES, build_context
+from fast_path import FastPath
+from index_build import IndexBuilder
+from metrics import TRACER
+from single_flight import FLIGHTS, RATE_LIMITER
+
+API_HOST = os.getenv("SAHAYAK_API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("SAHAYAK_API_PORT", "8000"))
+# Requests arriving within this window share one encode and one Chroma query
+MICRO_BATCH_WINDOW_MS = float(os.getenv("MICRO_BATCH_WINDOW_MS", "5"))
+MICRO_BATCH_MAX = int(os.getenv("MICRO_BATCH_MAX", "32"))
+# Threads waiting on Cerebras answers; most of them only read a shared stream,
+# and the LLM client itself caps the calls in flight at CEREBRAS_CONCURRENCY
+LLM_THREADS = int(os.getenv("LLM_THREADS", "64"))
+# How often to check whether a background index build has finished
+INDEX_POLL_SECONDS = 5
+# Keyword-only retrieval never embeds questions: the embedding model is not loaded, the
+# fast path matches typed text only and answers are cached by question text
+TEXT_ONLY = backend.RETRIEVAL_MODE == "lexical"
+
+
+class MicroBatcher:
+    # Collects concurrent submissions and runs them through `run_batch` together
+    def __init__(self, run_batch, executor, window_ms=MICRO_BATCH_WINDOW_MS, max_batch=MICRO_BATCH_MAX):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.run_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def make_retrieval_batch(app):
+    def run_batch(items):
+        # items are (query, top_k, topics); returns (query_embedding, docs, stage timings, context info) per
+        # item. query_embedding is None when keyword-only retrieval needs no forward pass.
+        queries = [query for query, _, _ in items]
+        vector_store = app["vector_store"]
+        timings = {}
+        embeddings = [None] * len(queries)
+        if backend.needs_query_embeddings(vector_store) if vector_store else not TEXT_ONLY:
+            start = time.perf_counter()
+            embeddings = query_embedding_cache(app).embed(queries)
+            timings["query_embedding"] = time.perf_counter() - start
+        if not vector_store:
+            return [(embedding, [], timings, {}) for embedding in embeddings]
+        start = time.perf_counter()
+        # One vector query per distinct topic filter in the batch
+        groups = {}
+        for i, (_, _, topics) in enumerate(items):
+            groups.setdefault(topics, []).append(i)
+        hits = [None] * len(items)
+        for topics, members in groups.items():
+            group_hits = backend.search_hits(
+                vector_store, [embeddings[i] for i in members],
+                max(CONTEXT_CANDIDATES, *(items[i][1] for i in members)), list(topics),
+                queries=[queries[i] for i in members],
+            )
+            for i, query_hits in zip(members, group_hits):
+                hits[i] = query_hits
+        timings["vector_query"] = time.perf_counter() - start
+        results = []
+        for embedding, query_hits, (_, k, _) in zip(embeddings, hits, items):
+            docs, info = build_context(query_hits, embedding, k)
+            results.append((embedding, docs, timings, info))
+        return results
+    return run_batch
+
+
+def query_embedding_cache(app):
+    # In keyword-only mode a store without a keyword index still searches by vector,
+    # so the embedder is then loaded on first use, on the encode worker
+    if app["query_cache"] is None:
+        app["query_cache"] = backend.QueryEmbeddingCache(backend.load_embedder())
+    return app["query_cache"]
+
+
+def request_topics(body):
+    # Book topics a request is limited to; RETRIEVAL_TOPICS when the request names none
+    topics = body.get("topics")
+    return tuple(sorted(topics)) if topics is not None else tuple(backend.RETRIEVAL_TOPICS)
+
+
+async def retrieve(app, trace, question, top_k, topics=()):
+    # Waits for the micro-batch holding this question and records its stage timings
+    with trace.span("retrieval"):
+        embedding, docs, timings, info = await app["retriever"].submit((question, top_k, topics))
+    for stage, seconds in timings.items():
+        trace.add_span(stage, seconds)
+    for name, value in info.items():
+        trace.value(f"context_{name}", value)
+    return embedding, docs
+
+
+async def iterate_in_thread(executor, generator):
+    # Drives a blocking generator on a worker thread and yields its items here
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def pump():
+        try:
+            for item in generator:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    # The copied context carries the request trace into the worker thread
+    pumping = loop.run_in_executor(executor, contextvars.copy_context().run, pump)
+    while True:
+        item = await queue.get()
+        if item is done:
+            break
+        yield item
+    await pumping
+
+
+async def handle_health(request):
+    # Always 200 so the service keeps taking traffic in degraded mode; "index"
+    # reports build progress until the vector store is open
+    app = request.app
+    return web.json_response({
+        "status": "ok" if app["vector_store"] is not None else "degraded",
+        "vector_store": type(app["vector_store"]).__name__ if app["vector_store"] else None,
+        "llm": app["client"] is not None,
+        "llm_breaker": app["client"].breaker.state if app["client"] else None,
+        "index": app["index_builder"].status(),
+    })
+
+
+async def wait_for_index(app):
+    # Builds the index in the background if needed and opens the vector store once it is complete
+    loop = asyncio.get_running_loop()
+    builder = app["index_builder"]
+    # Books added since the last build are ingested even when the store is ready
+    builder.ensure_started()
+    while not builder.is_ready():
+        builder.ensure_started()
+        await asyncio.sleep(INDEX_POLL_SECONDS)
+    app["vector_store"] = await loop.run_in_executor(app["io_pool"], backend.open_vector_store)
+
+
+async def handle_metrics(request):
+    return web.Response(text=TRACER.prometheus(), content_type="text/plain")
+
+
+async def handle_metrics_json(request):
+    return web.json_response(TRACER.summary())
+
+
+async def handle_retrieve(request):
+    body = await request.json()
+    queries = body.get("queries") or []
+    top_k = int(body.get("top_k", backend.TOP_K))
+    topics = request_topics(body)
+    with TRACER.request(body.get("tab", "retrieve"), body.get("language", "-")) as trace:
+        results = await asyncio.gather(*(
+            retrieve(request.app, trace, q, top_k, topics) for q in queries if q and q.strip()
+        ))
+    docs = iter(results)
+    return web.json_response({
+        "results": [next(docs)[1] if q and q.strip() else [] for q in queries]
+    })
+
+
+async def handle_answer(request):
+    # JSON answer, or NDJSON events when "stream" is true:
+    # {"context": [...], "cached": bool} then {"token": "..."}* then {"done": true, "ok": bool, "stats": {...}}
+    body = await request.json()
+    question = (body.get("question") or "").strip()
+    if not question:
+        return web.json_response({"error": "empty question"}, status=400)
+    language = body.get("language", "en")
+    tab = body.get("tab", "learning")
+    with TRACER.request(tab, language) as trace:
+        return await answer_question(request, body, question, language, tab, trace)
+
+
+async def answer_question(request, body, question, language, tab, trace):
+    app = request.app
+    topics = request_topics(body)
+    namespace = backend.cache_namespace(language, tab, topics)
+    top_k = int(body.get("top_k", backend.TOP_K))
+    loop = asyncio.get_running_loop()
+
+    fast_path = app["fast_path"]
+    fast = fast_path.match_text(question, language) if fast_path else None
+    if not fast:
+        embedding, docs = await retrieve(app, trace, question, top_k, topics)
+        if fast_path:
+            with trace.span("fast_path"):
+                fast = fast_path.match(question, embedding, language)
+    trace.flag("fast_path", fast[2] if fast else ("miss" if fast_path else "disabled"))
+    if fast:
+        # "vetted" is false for a prepared answer that has not been reviewed by a clinician
+        answer, docs, intent, _, vetted = fast
+        if not body.get("stream"):
+            return web.json_response({"answer": answer, "context": docs, "cached": True, "ok": True,
+                                      "intent": intent, "vetted": vetted})
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for event in ({"context": docs, "cached": True, "intent": intent, "vetted": vetted}, {"token": answer},
+                      {"done": True, "ok": True, "stats": {}}):
+            await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    answer_cache = app["answer_cache"]
+    cached = None
+    # Without a question vector, answers are cached by the normalized question text
+    cache_text = backend.normalize_query(question) if embedding is None else question
+    if answer_cache:
+        with trace.span("answer_cache_lookup"):
+            if embedding is None:
+                cached = await loop.run_in_executor(app["io_pool"], answer_cache.lookup_text, namespace, cache_text)
+            else:
+                cached = await loop.run_in_executor(app["io_pool"], answer_cache.lookup, namespace, embedding)
+    trace.flag("answer_cache", "hit" if cached else ("miss" if answer_cache else "disabled"))
+
+    if not cached:
+        # Only questions that reach Cerebras count against the user's rate
+        wait = RATE_LIMITER.acquire(body.get("user") or request.remote or "-")
+        if wait:
+            trace.flag("rate_limited", True)
+            return web.json_response({"error": "rate limited", "retry_after": round(wait, 1)}, status=429,
+                                     headers={"Retry-After": str(max(1, round(wait)))})
+    # The same question asked while its answer is being generated shares that answer
+    flight_key = ("answer", namespace, backend.normalize_query(question), top_k)
+
+    if not body.get("stream"):
+        if cached:
+            answer, docs, _ = cached
+            return web.json_response({"answer": answer, "context": docs, "cached": True, "ok": True})
+        with trace.span("llm"):
+            (answer, ok), shared = await loop.run_in_executor(
+                app["llm_pool"], contextvars.copy_context().run, FLIGHTS.do, flight_key,
+                backend.ask_cerebras, app["client"], question, docs, backend.MESSAGES, tab,
+            )
+        trace.flag("llm_ok", ok)
+        trace.flag("coalesced", shared)
+        if ok and not shared and answer_cache and app["vector_store"]:
+            await loop.run_in_executor(app["io_pool"], answer_cache.put, namespace, cache_text, embedding, answer, docs)
+        return web.json_response({"answer": answer, "context": docs, "cached": False, "ok": ok})
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    async def send(event):
+        await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    if cached:
+        answer, docs, _ = cached
+        await send({"context": docs, "cached": True})
+        await send({"token": answer})
+        await send({"done": True, "ok": True, "stats": {}})
+    else:
+        await send({"context": docs, "cached": False})
+        parts = []
+        with trace.span("llm"):
+            chunks, stats, shared = FLIGHTS.stream(flight_key, lambda stats: backend.stream_cerebras(
+                app["client"], question, docs, stats, backend.MESSAGES, tab
+            ))
+            async for text in iterate_in_thread(app["llm_pool"], chunks):
+                parts.append(text)
+                await send({"token": text})
+        if stats.get("ttft") is not None:
+            trace.add_span("llm_first_token", stats["ttft"])
+        trace.flag("llm_ok", bool(stats.get("ok")))
+        trace.flag("coalesced", shared)
+        if stats.get("ok") and not shared and answer_cache and app["vector_store"]:
+            await loop.run_in_executor(
+                app["io_pool"], answer_cache.put, namespace, cache_text, embedding, "".join(parts), docs
+            )
+        await send({"done": True, "ok": bool(stats.get("ok")), "stats": stats})
+    await response.write_eof()
+    return response
+
+
+async def on_startup(app):
+    loop = asyncio.get_running_loop()
+    app["io_pool"] = ThreadPoolExecutor(max_workers=4)
+    app["llm_pool"] = ThreadPoolExecutor(max_workers=LLM_THREADS)
+
+    # Load the model before the first request arrives; the vector store is opened
+    # now if the index exists, otherwise as soon as its background build finishes
+    app["index_builder"] = IndexBuilder()
+    app["vector_store"] = None
+    client, embedder = await loop.run_in_executor(
+        app["io_pool"], functools.partial(backend.load_models, with_embedder=not TEXT_ONLY)
+    )
+    app["client"] = client
+    app["index_task"] = asyncio.create_task(wait_for_index(app))
+    try:
+        app["answer_cache"] = AnswerCache()
+    except Exception as e:
+        print(f"Answer cache disabled: {e}")
+        app["answer_cache"] = None
+    try:
+        app["fast_path"] = FastPath()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Fast path disabled: {e}")
+        app["fast_path"] = None
+
+    app["query_cache"] = backend.QueryEmbeddingCache(embedder) if embedder else None
+    # A single encode worker keeps batches from competing for the CPU
+    app["encode_pool"] = ThreadPoolExecutor(max_workers=1)
+    app["retriever"] = MicroBatcher(make_retrieval_batch(app), app["encode_pool"])
+    app["batcher_task"] = asyncio.create_task(app["retriever"].run())
+
+
+async def on_cleanup(app):
+    app["batcher_task"].cancel()
+    app["index_task"].cancel()
+    for pool in ("encode_pool", "io_pool", "llm_pool"):
+        app[pool].shutdown(wait=False)
+
+
+def create_app():
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get("/health", handle_health)
+    app.router.add_post("/retrieve", handle_retrieve)
+    app.router.add_post("/answer", handle_answer)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/metrics.json", handle_metrics_json)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=API_HOST, port=API_PORT)
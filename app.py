@@ -1,40 +1,33 @@
+import functools
+import math
 import os
-import sys
-import subprocess
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
 
 st.set_page_config(page_title="Sahayak - ASHA Worker Assistant", page_icon="👩‍⚕️", layout="wide")
 load_dotenv()
-VECTOR_FLAG_FILE = "vector_initialized.flag"
-
-if not os.path.exists(VECTOR_FLAG_FILE):
-    with st.spinner("Initializing vector embeddings for the first time... ⏳"):
-        try:
-            subprocess.run([sys.executable, "vector_embedding.py"], check=True)
-            # Create a flag file so next users skip this step
-            with open(VECTOR_FLAG_FILE, "w") as f:
-                f.write("done")
-            st.success("Vector embeddings initialized successfully ✅")
-        except subprocess.CalledProcessError:
-            st.error("Failed to initialize vector embeddings ❌")
-#Cerebras
-try:
-    from cerebras.cloud.sdk import Cerebras
-    CEREBRAS_AVAILABLE = True
-except ImportError:
-    CEREBRAS_AVAILABLE = False
+# When set, questions go to api_server.py instead of loading the model in this process
+SAHAYAK_API_URL = os.getenv("SAHAYAK_API_URL")
+
+import backend
+from backend import TOP_K, CEREBRAS_AVAILABLE
+from answer_cache import AnswerCache
+from api_client import SahayakApiClient
+from fast_path import FAST_PATH_STORE, FastPath
+from index_build import IndexBuilder
+from llm_client import LLMError
+from metrics import TRACER, METRICS_PORT, current_trace, span, start_metrics_server
+from single_flight import FLIGHTS, RATE_LIMITER
+
+if not SAHAYAK_API_URL and not CEREBRAS_AVAILABLE:
     st.warning("Cerebras SDK not installed. Please install it with: pip install cerebras-cloud-sdk")
 
-import chromadb
-from sentence_transformers import SentenceTransformer
-
-load_dotenv()
-
-CHROMA_DB = os.path.join("data", "chroma.sqlite3")
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-CEREBRAS_MODEL_NAME = "llama-4-scout-17b-16e-instruct"
-TOP_K = 1
+# Show answers token by token as Cerebras generates them
+CEREBRAS_STREAMING = os.getenv("CEREBRAS_STREAMING", "1") == "1"
+# Keyword-only retrieval never embeds questions: the embedding model is not loaded, the
+# fast path matches typed text only and answers are cached by question text
+TEXT_ONLY = backend.RETRIEVAL_MODE == "lexical"
 
 translations = {
     "en": {
@@ -53,6 +46,11 @@ translations = {
         "no_collection": "No collection found and could not create 'asha_temp'.",
         "chroma_query_error": "Chroma query failed: {}",
         "api_call_error": "Error calling Cerebras API: {}",
+        "llm_unavailable": "The AI assistant is not responding right now. The most relevant passages from the books are shown below.",
+        "numpy_index_error": "NumPy index unavailable ({}); falling back to Chroma.",
+        "quantized_index_error": "Quantized index unavailable ({}); falling back to Chroma.",
+        "snapshot_error": "Index snapshot refused ({}); using the local vector store.",
+        "lexical_index_error": "Keyword index unavailable ({}); using vector search only.",
         "language_selector": "Select Language / भाषा चुनें",
         "english": "English",
         "hindi": "Hindi",
@@ -62,6 +60,14 @@ translations = {
         "urgent_help_tab": "🚨 Urgent Help",
         "learning_placeholder": "Ask a question to learn about health topics...",
         "urgent_placeholder": "Ask for immediate help with a health emergency...",
+        "cache_hit_rate": "Answer cache hit rate: {:.0%} of {} questions",
+        "stream_stats": "First words in {:.1f}s · {:.0f} tokens/s",
+        "loading_model": "Loading the language model...",
+        "rate_limited": "You are asking questions very quickly. Please wait {} seconds and ask again.",
+        "index_building": "The health library is being prepared ({} of {} books done). Answers will not use the books until it is ready.",
+        "index_pending": "The health library is being prepared. Answers will not use the books until it is ready.",
+        "index_failed": "Preparing the health library failed ({}). It will be retried shortly; answers will not use the books meanwhile.",
+        "fast_path_unreviewed": "This prepared answer has not yet been reviewed by a clinician. Check it against the book passages below and your training.",
     },
     "hi": {
         "title": "अशा कार्यकर्ता सहायक",
@@ -79,6 +85,11 @@ translations = {
         "no_collection": "कोई संग्रह नहीं मिला और 'asha_temp' नहीं बना सका।",
         "chroma_query_error": "क्रोमा क्वेरी विफल: {}",
         "api_call_error": "सीरेब्रास एपीआई को कॉल करने में त्रुटि: {}",
+        "llm_unavailable": "एआई सहायक अभी जवाब नहीं दे रहा है। पुस्तकों के सबसे प्रासंगिक अंश नीचे दिखाए गए हैं।",
+        "numpy_index_error": "NumPy इंडेक्स उपलब्ध नहीं है ({}); क्रोमा का उपयोग किया जा रहा है।",
+        "quantized_index_error": "क्वांटाइज़्ड इंडेक्स उपलब्ध नहीं है ({}); क्रोमा का उपयोग किया जा रहा है।",
+        "snapshot_error": "इंडेक्स स्नैपशॉट अस्वीकार किया गया ({}); स्थानीय वेक्टर स्टोर का उपयोग किया जा रहा है।",
+        "lexical_index_error": "कीवर्ड इंडेक्स उपलब्ध नहीं है ({}); केवल वेक्टर खोज का उपयोग किया जा रहा है।",
         "language_selector": "भाषा चुनें",
         "english": "अंग्रेज़ी",
         "hindi": "हिंदी",
@@ -88,116 +99,402 @@ translations = {
         "urgent_help_tab": "🚨 तत्काल सहायता",
         "learning_placeholder": "स्वास्थ्य विषयों के बारे में जानने के लिए प्रश्न पूछें...",
         "urgent_placeholder": "स्वास्थ्य आपातकाल के साथ तत्काल सहायता के लिए पूछें...",
+        "cache_hit_rate": "उत्तर कैश हिट दर: {1} प्रश्नों में से {0:.0%}",
+        "stream_stats": "पहले शब्द {:.1f} सेकंड में · {:.0f} टोकन/सेकंड",
+        "loading_model": "भाषा मॉडल लोड हो रहा है...",
+        "rate_limited": "आप बहुत जल्दी-जल्दी प्रश्न पूछ रहे हैं। कृपया {} सेकंड रुककर फिर से पूछें।",
+        "index_building": "स्वास्थ्य पुस्तकालय तैयार किया जा रहा है ({1} में से {0} पुस्तकें पूरी)। तैयार होने तक उत्तरों में पुस्तकों का उपयोग नहीं होगा।",
+        "index_pending": "स्वास्थ्य पुस्तकालय तैयार किया जा रहा है। तैयार होने तक उत्तरों में पुस्तकों का उपयोग नहीं होगा।",
+        "index_failed": "स्वास्थ्य पुस्तकालय तैयार करना विफल रहा ({})। इसे जल्द ही फिर से आज़माया जाएगा; तब तक उत्तरों में पुस्तकों का उपयोग नहीं होगा।",
+        "fast_path_unreviewed": "इस तैयार उत्तर की अभी किसी चिकित्सक ने समीक्षा नहीं की है। इसे नीचे दिए गए पुस्तक अंशों और अपने प्रशिक्षण से जाँच लें।",
     }
 }
 
 @st.cache_resource
-def initialize_backend():
-    # Cerebras client
-    api_key = os.environ.get("CEREBRAS_API_KEY")
-    if not api_key:
-        st.error(translations["en"]["api_key_error"])
-        return None, None, None
-
-    if CEREBRAS_AVAILABLE:
-        client = Cerebras(api_key=api_key)
-    else:
-        client = None
+def get_index_builder():
+    return IndexBuilder()
+
+
+@st.cache_resource
+def start_model_loading():
+    # Loads the embedder and Cerebras client once per process without blocking the page
+    return backend.BackgroundLoader(functools.partial(backend.load_models, with_embedder=not TEXT_ONLY),
+                                    translations["en"])
+
+
+@st.cache_resource
+def start_vector_store_loading():
+    # Opens the snapshot, Chroma or the NumPy index on a background thread, like the models
+    return backend.BackgroundLoader(backend.open_vector_store, translations["en"], with_warnings=True)
+
+
+@st.cache_resource
+def get_api_client():
+    return SahayakApiClient(SAHAYAK_API_URL)
+
+
+@st.cache_resource
+def get_metrics_server():
+    # One exporter per process, shared by all sessions
+    return start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+
+
+get_metrics_server()
 
-    # Embedding model
-    embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-    # Chroma persistent client
-    chroma_path = CHROMA_DB if os.path.isdir(CHROMA_DB) else os.path.dirname(CHROMA_DB)
-    db = chromadb.PersistentClient(path=chroma_path)
+# Initialize backend components
+if SAHAYAK_API_URL:
+    api_client = get_api_client()
+    model_loader, vector_store_loader = None, None
+    index_status = {"state": "ready"}
+else:
+    api_client = None
+    # The index is built in the background under a lock; the app serves without
+    # book context meanwhile instead of stalling the first visitor
+    index_builder = get_index_builder()
+    index_builder.ensure_started()
+    index_status = index_builder.status()
+    model_loader = start_model_loading()
+    # A half-built store is never opened, so it never gets cached either
+    vector_store_loader = start_vector_store_loading() if index_status["state"] == "ready" else None
+    for loader in (model_loader, vector_store_loader):
+        if loader and loader.ready():
+            for message in loader.errors:
+                st.error(message)
+            for message in loader.warnings:
+                st.warning(message)
+
+
+def get_models():
+    # Returns (cerebras_client, embedder), waiting only if the model is still loading
+    if not model_loader:
+        return None, None
+    try:
+        return model_loader.result()
+    except Exception as e:
+        st.error(str(e))
+        return None, None
 
-    # Find an existing collection
+
+def get_vector_store():
+    # Returns the vector store, waiting if it is still opening; None while the index is built
+    if not vector_store_loader:
+        return None
     try:
-        cols = db.list_collections()
+        return vector_store_loader.result()
     except Exception as e:
-        st.error(translations["en"]["chroma_error"].format(e))
-        return client, embedder, None
-
-    collection = None
-    if cols:
-        first = cols[0]
-        if hasattr(first, "name"):
-            name = first.name
-        elif isinstance(first, dict) and "name" in first:
-            name = first["name"]
-        elif isinstance(first, str):
-            name = first
-        else:
-            name = str(first)
+        st.error(str(e))
+        return None
 
-        try:
-            collection = db.get_collection(name=name)
-        except Exception:
-            try:
-                collection = db.get_or_create_collection(name=name)
-            except Exception as e:
-                st.warning(translations["en"]["collection_error"].format(name, e))
-                collection = None
-    else:
-        # Create new collection
-        try:
-            collection = db.get_or_create_collection(name="asha_temp")
-        except Exception:
-            st.warning(translations["en"]["no_collection"])
-            collection = None
 
-    return client, embedder, collection
+@st.cache_resource
+def load_fallback_embedder():
+    return backend.load_embedder(translations["en"], st.error)
+
+
+def get_embedding_model():
+    # In keyword-only mode a store without a keyword index still searches by vector,
+    # so the embedder is then loaded on first use
+    embedding_model = get_models()[1]
+    if embedding_model is None and TEXT_ONLY:
+        embedding_model = load_fallback_embedder()
+    return embedding_model
 
-# Initialize backend components
-cerebras_client, embedding_model, collection = initialize_backend()
 
-@st.cache_data(ttl=300)  
+@st.cache_resource
+def get_query_embedding_cache(_embedder):
+    return backend.QueryEmbeddingCache(_embedder)
+
+
+def get_relevant_docs_for_queries(queries: list, top_k: int = TOP_K):
+    # One embedding pass and one vector query for the whole batch of questions; each
+    # question's context is then filtered and packed into the prompt token budget.
+    # Failures raise, so st.cache_data keeps nothing and the next ask retries.
+    live = [q for q in queries if q and q.strip()]
+    if not live:
+        return [[] for _ in queries]
+    if api_client:
+        docs = api_client.retrieve(live, top_k)
+    else:
+        vector_store = get_vector_store()
+        if not vector_store:
+            raise RuntimeError("the vector store is not open")
+        query_embeddings = None
+        if backend.needs_query_embeddings(vector_store):
+            embedding_model = get_embedding_model()
+            if not embedding_model:
+                raise RuntimeError("the embedding model is not loaded")
+            with span("query_embedding"):
+                query_embeddings = get_query_embedding_cache(embedding_model).embed(live)
+        with span("vector_query"):
+            contexts = backend.retrieve_context(vector_store, query_embeddings, top_k, queries=live)
+        docs = [context_docs for context_docs, _ in contexts]
+        trace = current_trace()
+        if trace is not None and len(contexts) == 1:
+            for name, value in contexts[0][1].items():
+                trace.value(f"context_{name}", value)
+    docs_by_query = dict(zip(live, docs))
+    return [docs_by_query.get(q, []) for q in queries]
+
+
+@st.cache_data(ttl=300)
 def get_relevant_docs_via_chroma(query: str, top_k: int = TOP_K):
-    if not collection:
-        return []
-    if not query or not query.strip():
-        return []
+    # st.cache_data does not coalesce misses, so sessions asking the same question
+    # at the same time share one retrieval through FLIGHTS
+    docs, _ = FLIGHTS.do(("retrieve", backend.normalize_query(query), top_k),
+                         get_relevant_docs_for_queries, [query], top_k)
+    return docs[0]
+
+
+def answer_flight_key(question: str, tab: str, language: str):
+    return ("answer", backend.cache_namespace(language, tab, backend.RETRIEVAL_TOPICS),
+            backend.normalize_query(question), TOP_K)
+
+
+@st.cache_data(ttl=300) 
+def ask_cerebras(_client, question: str, context_docs: list, tab: str, language: str):
+    (answer, ok), _ = FLIGHTS.do(answer_flight_key(question, tab, language), backend.ask_cerebras,
+                                 _client, question, context_docs, translations[language], tab)
+    if not ok:
+        # st.cache_data keeps nothing from a call that raises, so the next ask retries
+        raise LLMError(answer)
+    return answer
+
+
+@st.cache_resource
+def load_fast_path(_mtime: float):
+    try:
+        return FastPath()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Fast path disabled: {e}")
+        return None
+
+
+def get_fast_path():
+    # Keyed on the store's mtime so a rebuild after re-ingesting is picked up
+    try:
+        return load_fast_path(os.path.getmtime(FAST_PATH_STORE))
+    except OSError:
+        return None
+
+
+@st.cache_resource
+def get_answer_cache():
     try:
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"],
-        )
-        docs_for_query = results.get("documents", [[]])[0]
-        return [d for d in docs_for_query if d and isinstance(d, str)]
+        return AnswerCache()
     except Exception as e:
-        st.warning(translations["en"]["chroma_query_error"].format(e))
-        return []
+        st.warning(f"Answer cache disabled: {e}")
+        return None
 
-@st.cache_data(ttl=300) 
-def ask_cerebras(_client, question: str, context_docs: list):
-    if not CEREBRAS_AVAILABLE or not _client:
-        return "Cerebras API is not available. Please install the SDK and set up your API key."
-    
-    context = "\n\n".join(context_docs) if context_docs else ""
-    system_msg = "You are an ASHA worker assistant. Answer succinctly and clearly for a community health worker."
-    user_msg = f"Context:\n{context}\n\nQuestion:\n{question}" if context else question
 
-    messages = [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": user_msg},
-    ]
+def render_response_header(t: dict):
+    st.markdown(f"<h2 class='section-header'>{t['response_header']}</h2>", unsafe_allow_html=True)
+
+
+def render_context(docs: list, t: dict):
+    st.markdown(f"<h2 class='section-header'>{t['context_header']}</h2>", unsafe_allow_html=True)
+    st.markdown("<div class='context-card card'>", unsafe_allow_html=True)
+    if docs:
+        for i, d in enumerate(docs, 1):
+            st.markdown(f"**{i}.** {d}")
+    else:
+        st.info(t["no_context"])
+    st.markdown("</div>", unsafe_allow_html=True)
+
 
+def render_stream_stats(stats: dict, t: dict):
+    if stats.get("ok") and stats.get("ttft") is not None:
+        st.caption(t["stream_stats"].format(stats["ttft"], stats["tokens_per_sec"]))
+
+
+def render_remote_answer(query: str, tab: str, t: dict, trace):
+    # The API server owns retrieval, the answer cache and the Cerebras calls
+    language = st.session_state.language
     try:
-        completion = _client.chat.completions.create(messages=messages, model=CEREBRAS_MODEL_NAME)
-        try:
-            return completion.choices[0].message.content
-        except Exception:
-            try:
-                return completion.choices[0].message.get("content", str(completion))
-            except Exception:
-                return str(completion)
+        if not CEREBRAS_STREAMING:
+            with st.spinner(t["getting_answer"]), trace.span("api_answer"):
+                result = api_client.answer(query, language, tab, TOP_K, st.session_state.user_id)
+            trace.flag("answer_cache", "hit" if result.get("cached") else "miss")
+            with trace.span("render"):
+                render_response_header(t)
+                st.markdown("<div class='response-card card'>", unsafe_allow_html=True)
+                st.write(result["answer"])
+                st.markdown("</div>", unsafe_allow_html=True)
+                render_context(result["context"], t)
+            return
+
+        with st.spinner(t["searching_db"]), trace.span("api_first_event"):
+            events = api_client.stream_answer(query, language, tab, TOP_K, st.session_state.user_id)
+            first = next(events)
+        trace.flag("answer_cache", "hit" if first.get("cached") else "miss")
+        final = {}
+
+        def tokens():
+            for event in events:
+                if "token" in event:
+                    yield event["token"]
+                elif event.get("done"):
+                    final.update(event)
+
+        render_response_header(t)
+        st.markdown("<div class='response-card card'>", unsafe_allow_html=True)
+        with trace.span("llm"):
+            st.write_stream(tokens())
+        if final.get("stats", {}).get("ttft") is not None:
+            trace.add_span("llm_first_token", final["stats"]["ttft"])
+        render_stream_stats(final.get("stats", {}), t)
+        st.markdown("</div>", unsafe_allow_html=True)
+        with trace.span("render"):
+            render_context(first.get("context", []), t)
     except Exception as e:
-        return translations["en"]["api_call_error"].format(e)
+        trace.flag("error", type(e).__name__)
+        response = getattr(e, "response", None)
+        if getattr(response, "status_code", None) == 429:
+            st.warning(t["rate_limited"].format(response.headers.get("Retry-After", "60")))
+        else:
+            st.error(translations["en"]["api_call_error"].format(e))
+
+
+def render_fast_answer(fast: tuple, t: dict, trace):
+    answer, docs, intent, _, vetted = fast
+    trace.flag("fast_path", intent)
+    with trace.span("render"):
+        render_response_header(t)
+        st.markdown("<div class='response-card card'>", unsafe_allow_html=True)
+        if not vetted:
+            st.warning(t["fast_path_unreviewed"])
+        st.write(answer)
+        st.markdown("</div>", unsafe_allow_html=True)
+        render_context(docs, t)
+
+
+def render_local_answer(query: str, tab: str, t: dict, trace):
+    language = st.session_state.language
+    # Example and emergency questions typed exactly are answered without waiting for the model
+    fast_path = get_fast_path()
+    if fast_path:
+        with trace.span("fast_path"):
+            fast = fast_path.match_text(query, language)
+        if fast:
+            render_fast_answer(fast, t, trace)
+            return
+
+    with st.spinner(t["loading_model"]), trace.span("model_wait"):
+        cerebras_client, embedding_model = get_models()
+        vector_store = get_vector_store()
+    answer_cache = get_answer_cache()
+    namespace = backend.cache_namespace(language, tab, backend.RETRIEVAL_TOPICS)
+    query_embedding = None
+    cached = None
+    # A fast path with no servable intents has nothing to compare the embedding with
+    if embedding_model and (answer_cache or (fast_path and len(fast_path.vectors))):
+        with trace.span("query_embedding"):
+            query_embedding = get_query_embedding_cache(embedding_model).embed([query])[0]
+    if fast_path and query_embedding is not None:
+        with trace.span("fast_path"):
+            fast = fast_path.match(query, query_embedding, language)
+        if fast:
+            render_fast_answer(fast, t, trace)
+            return
+    trace.flag("fast_path", "miss" if fast_path else "disabled")
+
+    if answer_cache and query_embedding is not None:
+        with trace.span("answer_cache_lookup"):
+            cached = answer_cache.lookup(namespace, query_embedding)
+        trace.flag("answer_cache", "hit" if cached else "miss")
+    elif answer_cache and TEXT_ONLY:
+        with trace.span("answer_cache_lookup"):
+            cached = answer_cache.lookup_text(namespace, backend.normalize_query(query))
+        trace.flag("answer_cache", "hit" if cached else "miss")
+    else:
+        trace.flag("answer_cache", "disabled")
+
+    retrieved = True
+    if cached:
+        answer, docs, _ = cached
+    else:
+        # Only questions that reach Cerebras count against the user's rate
+        wait = RATE_LIMITER.acquire(st.session_state.user_id)
+        if wait:
+            trace.flag("rate_limited", True)
+            st.warning(t["rate_limited"].format(math.ceil(wait)))
+            return
+        with st.spinner(t["searching_db"]), trace.span("retrieval"):
+            # Skipped while the index is building so empty results are not cached
+            try:
+                docs = get_relevant_docs_via_chroma(query, TOP_K) if vector_store else []
+            except Exception as e:
+                # Answered without the books this time; nothing was cached, so the next ask retries
+                trace.flag("error", type(e).__name__)
+                st.warning(translations["en"]["chroma_query_error"].format(e))
+                docs, retrieved = [], False
+        # The vector query span is missing when st.cache_data served the result
+        trace.flag("retrieval_cache", "miss" if "vector_query" in trace.spans else "hit")
+
+    render_response_header(t)
+    st.markdown("<div class='response-card card'>", unsafe_allow_html=True)
+    shared = False
+    if cached:
+        with trace.span("render"):
+            st.write(answer)
+        ok = True
+    elif CEREBRAS_STREAMING:
+        # A session asking the same question while it streams for another reads the same stream
+        with trace.span("llm"):
+            chunks, stats, shared = FLIGHTS.stream(
+                answer_flight_key(query, tab, language),
+                lambda stats: backend.stream_cerebras(cerebras_client, query, docs, stats, t, tab),
+            )
+            answer = st.write_stream(chunks)
+        trace.flag("coalesced", shared)
+        ok = bool(stats.get("ok"))
+        if stats.get("ttft") is not None:
+            trace.add_span("llm_first_token", stats["ttft"])
+        render_stream_stats(stats, t)
+    else:
+        with st.spinner(t["getting_answer"]), trace.span("llm"):
+            try:
+                answer, ok = ask_cerebras(cerebras_client, query, docs, tab, st.session_state.language), True
+            except LLMError as e:
+                answer, ok = str(e), False
+        with trace.span("render"):
+            if ok:
+                st.write(answer)
+            else:
+                # The retrieved context below stands in for the answer
+                st.warning(answer)
+    st.markdown("</div>", unsafe_allow_html=True)
+    trace.flag("llm_ok", ok)
+
+    # Never persist fallback and error text, nor answers given without the books
+    # A session that read another's stream leaves storing the answer to that session
+    if answer_cache and not cached and not shared and ok and vector_store and retrieved:
+        if query_embedding is not None:
+            answer_cache.put(namespace, query, query_embedding, answer, docs)
+        elif TEXT_ONLY:
+            answer_cache.put(namespace, backend.normalize_query(query), None, answer, docs)
+
+    with trace.span("render"):
+        render_context(docs, t)
+
+
+def render_answer(query: str, tab: str, t: dict):
+    # Near-identical questions reuse a stored answer; otherwise the answer is
+    # streamed into the response card and cached once it is complete.
+    # Every stage is recorded as a span of this request's trace.
+    with TRACER.request(tab, st.session_state.language) as trace:
+        if api_client:
+            render_remote_answer(query, tab, t, trace)
+        else:
+            render_local_answer(query, tab, t, trace)
 
 if "language" not in st.session_state:
     st.session_state.language = "en"
 
+if "user_id" not in st.session_state:
+    # Identifies this session for the per-user rate limit
+    st.session_state.user_id = uuid.uuid4().hex
+
 if "recent_questions" not in st.session_state:
     st.session_state.recent_questions = []
 
@@ -420,9 +717,26 @@ with st.sidebar:
             st.markdown(f"- {q}")
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # In API mode the server keeps the cache
+    answer_cache = None if api_client else get_answer_cache()
+    if answer_cache:
+        cache_stats = answer_cache.stats()
+        hits = sum(ns["hits"] for ns in cache_stats.values())
+        lookups = hits + sum(ns["misses"] for ns in cache_stats.values())
+        if lookups:
+            st.caption(t["cache_hit_rate"].format(hits / lookups, lookups))
+
 col1, col2 = st.columns([5, 1])
 
 with col1:
+    if index_status["state"] == "building" and index_status.get("books_total"):
+        st.info(t["index_building"].format(index_status.get("books_done", 0), index_status["books_total"]))
+        st.progress(index_status.get("books_done", 0) / index_status["books_total"])
+    elif index_status["state"] == "failed":
+        st.warning(t["index_failed"].format(index_status.get("message", "")))
+    elif index_status["state"] != "ready":
+        st.info(t["index_pending"])
+
     # Create tabs for Learning and Urgent Help
     tab1, tab2 = st.tabs([t["learning_tab"], t["urgent_help_tab"]])
     
@@ -441,25 +755,7 @@ with col1:
                     if learning_query not in st.session_state.recent_questions:
                         st.session_state.recent_questions.append(learning_query)
                     
-                    with st.spinner(t["searching_db"]):
-                        docs = get_relevant_docs_via_chroma(learning_query, TOP_K)
-                    with st.spinner(t["getting_answer"]):
-                        answer = ask_cerebras(cerebras_client, learning_query, docs)
-
-                    st.markdown(f"<h2 class='section-header'>{t['response_header']}</h2>", unsafe_allow_html=True)
-                    st.markdown("<div class='response-card card'>", unsafe_allow_html=True)
-                    st.write(answer)
-                    st.markdown("</div>", unsafe_allow_html=True)
-
-                    # Display context in main content area
-                    st.markdown(f"<h2 class='section-header'>{t['context_header']}</h2>", unsafe_allow_html=True)
-                    st.markdown("<div class='context-card card'>", unsafe_allow_html=True)
-                    if docs:
-                        for i, d in enumerate(docs, 1):
-                            st.markdown(f"**{i}.** {d}")
-                    else:
-                        st.info(t["no_context"])
-                    st.markdown("</div>", unsafe_allow_html=True)
+                    render_answer(learning_query, "learning", t)
         st.markdown("</div>", unsafe_allow_html=True)
     
     with tab2:
@@ -476,25 +772,7 @@ with col1:
                     if urgent_query not in st.session_state.recent_questions:
                         st.session_state.recent_questions.append(urgent_query)
                     
-                    with st.spinner(t["searching_db"]):
-                        docs = get_relevant_docs_via_chroma(urgent_query, TOP_K)
-
-                    with st.spinner(t["getting_answer"]):
-                        answer = ask_cerebras(cerebras_client, urgent_query, docs)
-
-                    st.markdown(f"<h2 class='section-header'>{t['response_header']}</h2>", unsafe_allow_html=True)
-                    st.markdown("<div class='response-card card'>", unsafe_allow_html=True)
-                    st.write(answer)
-                    st.markdown("</div>", unsafe_allow_html=True)
-
-                    st.markdown(f"<h2 class='section-header'>{t['context_header']}</h2>", unsafe_allow_html=True)
-                    st.markdown("<div class='context-card card'>", unsafe_allow_html=True)
-                    if docs:
-                        for i, d in enumerate(docs, 1):
-                            st.markdown(f"**{i}.** {d}")
-                    else:
-                        st.info(t["no_context"])
-                    st.markdown("</div>", unsafe_allow_html=True)
+                    render_answer(urgent_query, "urgent", t)
         st.markdown("</div>", unsafe_allow_html=True)
 
 with col2:
@@ -0,0 +1,432 @@
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+# chromadb, sentence_transformers (torch) and the Cerebras SDK are imported where they
+# are first used, so the UI can render before they load. Checking for the SDK here
+# only looks it up on the path without importing it.
+try:
+    CEREBRAS_AVAILABLE = importlib.util.find_spec("cerebras.cloud.sdk") is not None
+except ImportError:
+    CEREBRAS_AVAILABLE = False
+
+from embedding_backends import EMBEDDING_BACKEND, ONNX_MODEL_DIR
+from index_snapshot import INDEX_SNAPSHOT, SnapshotBackend
+from lexical_index import open_lexical_index
+from context_builder import CONTEXT_CANDIDATES, build_context, estimate_tokens
+from llm_client import LLMUnavailable, create_llm_client
+from metrics import current_trace, timed, trace_logger
+from parent_store import PARENT_STORE_DB, ParentStore, attach_parents
+from vector_backends import (VECTOR_BACKEND, NUMPY_INDEX_DIR, QUANTIZED_INDEX_DIR, RETRIEVAL_MODE, SHARD_PREFIX,
+                             ChromaBackend, HybridBackend, NumpyBackend, QuantizedBackend, ShardedChromaBackend)
+
+load_dotenv()
+
+CHROMA_DB = os.path.join("data", "chroma.sqlite3")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+CEREBRAS_MODEL_NAME = "llama-4-scout-17b-16e-instruct"
+# Most chunks sent to Cerebras per question; fewer are sent when they are
+# far from the question, near-duplicates, or over the token budget
+TOP_K = int(os.getenv("TOP_K", "4"))
+# Number of query vectors kept in memory, keyed on normalized query text
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+# Comma-separated book topics searched by default, e.g. "maternal_child_health"; empty searches every book
+RETRIEVAL_TOPICS = [topic.strip() for topic in os.getenv("RETRIEVAL_TOPICS", "").split(",") if topic.strip()]
+# Overrides the Cerebras endpoint, e.g. to point at fake_cerebras.py for benchmarks
+CEREBRAS_BASE_URL = os.getenv("CEREBRAS_BASE_URL") or None
+
+CEREBRAS_UNAVAILABLE_MSG = "Cerebras API is not available. Please install the SDK and set up your API key."
+
+# English messages; the Streamlit app passes its own translations instead
+MESSAGES = {
+    "api_key_error": "CEREBRAS_API_KEY not set in environment (or .env).",
+    "chroma_error": "Failed to list Chroma collections: {}",
+    "collection_error": "Could not open collection '{}': {}",
+    "no_collection": "No collection found and could not create 'asha_temp'.",
+    "chroma_query_error": "Chroma query failed: {}",
+    "api_call_error": "Error calling Cerebras API: {}",
+    "llm_unavailable": "The AI assistant is not responding right now. The most relevant passages from the books are shown below.",
+    "numpy_index_error": "NumPy index unavailable ({}); falling back to Chroma.",
+    "quantized_index_error": "Quantized index unavailable ({}); falling back to Chroma.",
+    "snapshot_error": "Index snapshot refused ({}); using the local vector store.",
+    "lexical_index_error": "Keyword index unavailable ({}); using vector search only.",
+    "onnx_model_error": "ONNX embedding model unavailable ({}); run `python embedding_backends.py export`. Using PyTorch.",
+}
+
+
+def load_models(messages=MESSAGES, on_error=print, with_embedder=True):
+    # Returns (cerebras_client, embedder); retrieval keeps working without an API key.
+    # The embedder is None when with_embedder is False.
+    # Cerebras client
+    api_key = os.environ.get("CEREBRAS_API_KEY")
+    client = None
+    if not api_key:
+        on_error(messages["api_key_error"])
+    elif CEREBRAS_AVAILABLE:
+        client = create_llm_client(api_key, CEREBRAS_MODEL_NAME, CEREBRAS_BASE_URL)
+
+    # Embedding model
+    if not with_embedder:
+        return client, None
+    with timed("cold_start_embedder"):
+        embedder = load_embedder(messages, on_error)
+    return client, embedder
+
+
+def load_embedder(messages=MESSAGES, on_error=print):
+    if EMBEDDING_BACKEND == "onnx":
+        try:
+            from embedding_backends import OnnxEmbedder
+            return OnnxEmbedder(ONNX_MODEL_DIR)
+        except (OSError, ValueError, ImportError) as e:
+            on_error(messages.get("onnx_model_error", MESSAGES["onnx_model_error"]).format(e))
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def open_chroma():
+    import chromadb
+
+    chroma_path = CHROMA_DB if os.path.isdir(CHROMA_DB) else os.path.dirname(CHROMA_DB)
+    return chromadb.PersistentClient(path=chroma_path)
+
+
+def collection_name(entry):
+    # list_collections() returns collection objects in older Chroma releases and names in newer ones
+    if hasattr(entry, "name"):
+        return entry.name
+    if isinstance(entry, dict) and "name" in entry:
+        return entry["name"]
+    return entry if isinstance(entry, str) else str(entry)
+
+
+def open_shards(messages=MESSAGES, on_error=print, on_warning=print):
+    # Returns the per-book shard collections written by vector_embedding.py; empty
+    # for a store that still holds everything in one collection
+    db = open_chroma()
+    try:
+        names = sorted(collection_name(entry) for entry in db.list_collections())
+    except Exception as e:
+        on_error(messages["chroma_error"].format(e))
+        return []
+    shards = []
+    for name in names:
+        if not name.startswith(SHARD_PREFIX):
+            continue
+        try:
+            shards.append(db.get_collection(name=name, embedding_function=None))
+        except Exception as e:
+            on_warning(messages["collection_error"].format(name, e))
+    return shards
+
+
+def open_collection(messages=MESSAGES, on_error=print, on_warning=print):
+    # Chroma persistent client
+    db = open_chroma()
+
+    # Find an existing collection
+    try:
+        cols = db.list_collections()
+    except Exception as e:
+        on_error(messages["chroma_error"].format(e))
+        return None
+
+    collection = None
+    if cols:
+        name = collection_name(cols[0])
+
+        # Queries are embedded with our own SentenceTransformer, so Chroma must not
+        # load its default embedding model on the side
+        try:
+            collection = db.get_collection(name=name, embedding_function=None)
+        except Exception:
+            try:
+                collection = db.get_or_create_collection(name=name, embedding_function=None)
+            except Exception as e:
+                on_warning(messages["collection_error"].format(name, e))
+                collection = None
+    else:
+        # Create new collection
+        try:
+            collection = db.get_or_create_collection(name="asha_temp", embedding_function=None)
+        except Exception:
+            on_warning(messages["no_collection"])
+            collection = None
+
+    return collection
+
+
+def open_vector_store(messages=MESSAGES, on_error=print, on_warning=print):
+    # Returns the retrieval backend selected by VECTOR_BACKEND, or None
+    with timed("cold_start_vector_store"):
+        vector_store = _open_vector_store(messages, on_error, on_warning)
+        if vector_store is not None and RETRIEVAL_MODE != "vector":
+            vector_store = _add_lexical_index(vector_store, messages, on_warning)
+        return vector_store
+
+
+def _add_lexical_index(vector_store, messages, on_warning):
+    # The BM25 postings are built over the rows of the NumPy index or the snapshot;
+    # a Chroma store is paired with the NumPy index exported from it
+    try:
+        if isinstance(vector_store, SnapshotBackend):
+            rows, lexical = vector_store, vector_store.lexical_index()
+        elif isinstance(vector_store, NumpyBackend):
+            rows, lexical = vector_store, open_lexical_index(vector_store.index_dir)
+        else:
+            rows, lexical = NumpyBackend(NUMPY_INDEX_DIR), open_lexical_index(NUMPY_INDEX_DIR)
+    except (OSError, ValueError, KeyError) as e:
+        on_warning(messages.get("lexical_index_error", MESSAGES["lexical_index_error"]).format(e))
+        return vector_store
+    return HybridBackend(vector_store, lexical, rows)
+
+
+def _open_vector_store(messages, on_error, on_warning):
+    # A prebuilt snapshot takes precedence over whatever the local store holds
+    if os.path.exists(INDEX_SNAPSHOT):
+        try:
+            return SnapshotBackend(INDEX_SNAPSHOT)
+        except (OSError, ValueError, KeyError) as e:
+            on_warning(messages.get("snapshot_error", MESSAGES["snapshot_error"]).format(e))
+    if VECTOR_BACKEND == "numpy":
+        try:
+            return NumpyBackend(NUMPY_INDEX_DIR)
+        except (OSError, ValueError) as e:
+            on_warning(messages.get("numpy_index_error", MESSAGES["numpy_index_error"]).format(e))
+    if VECTOR_BACKEND == "quantized":
+        try:
+            return QuantizedBackend(QUANTIZED_INDEX_DIR)
+        except (OSError, ValueError) as e:
+            on_warning(messages.get("quantized_index_error", MESSAGES["quantized_index_error"]).format(e))
+    shards = open_shards(messages, on_error, on_warning)
+    if shards:
+        return ShardedChromaBackend(shards, reopen=lambda: open_shards(messages, on_error, on_warning))
+    collection = open_collection(messages, on_error, on_warning)
+    return ChromaBackend(collection) if collection is not None else None
+
+
+def initialize_backend(messages=MESSAGES, on_error=print, on_warning=print):
+    # Returns (cerebras_client, embedder, vector_store); problems are reported
+    # through the callbacks so both the UI and the API server can show them
+    client, embedder = load_models(messages, on_error)
+    return client, embedder, open_vector_store(messages, on_error, on_warning)
+
+
+class BackgroundLoader:
+    # Runs a slow initializer on a daemon thread so callers can render or serve meanwhile;
+    # messages it reports through on_error (and on_warning, if asked) are collected
+    def __init__(self, load, *args, with_warnings=False):
+        self.errors = []
+        self.warnings = []
+        self._value = None
+        self._exception = None
+        self._done = threading.Event()
+        callbacks = {"on_error": self.errors.append}
+        if with_warnings:
+            callbacks["on_warning"] = self.warnings.append
+        threading.Thread(target=self._run, args=(load, args, callbacks), daemon=True).start()
+
+    def _run(self, load, args, callbacks):
+        try:
+            self._value = load(*args, **callbacks)
+        except Exception as e:
+            self._exception = e
+        finally:
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Backend is still loading")
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+def normalize_query(query: str):
+    return " ".join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    # Bounded LRU of query vectors shared by every session in this process
+    def __init__(self, embedder, maxsize: int = QUERY_CACHE_SIZE):
+        self.embedder = embedder
+        self.maxsize = maxsize
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, queries: list):
+        keys = [normalize_query(q) for q in queries]
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._vectors:
+                    self._vectors.move_to_end(key)
+                    found[key] = self._vectors[key]
+        # All misses share a single forward pass
+        misses = list(dict.fromkeys(key for key in keys if key not in found))
+        if misses:
+            encoded = self.embedder.encode(misses, convert_to_numpy=True)
+            with self._lock:
+                for key, vector in zip(misses, encoded):
+                    found[key] = vector.tolist()
+                    self._vectors[key] = found[key]
+                    self._vectors.move_to_end(key)
+                while len(self._vectors) > self.maxsize:
+                    self._vectors.popitem(last=False)
+        return [found[key] for key in keys]
+
+
+def cache_namespace(language: str, tab: str, topics=()):
+    # Answers built from a subset of the books are cached apart from unfiltered ones
+    return f"{language}:{tab}" + (f":{','.join(sorted(topics))}" if topics else "")
+
+
+def needs_query_embeddings(vector_store):
+    # Lexical-only retrieval matches the question text, so no forward pass is needed
+    return not (isinstance(vector_store, HybridBackend) and vector_store.mode == "lexical")
+
+
+_parent_store = None
+_parent_store_lock = threading.Lock()
+
+
+def parent_lookup(vector_store):
+    # A snapshot carries its own passages; other stores share data/parents.sqlite3,
+    # which stores built before it existed do not need
+    store = vector_store.store if isinstance(vector_store, HybridBackend) else vector_store
+    if isinstance(store, SnapshotBackend):
+        return store.parent_texts
+    global _parent_store
+    with _parent_store_lock:
+        if _parent_store is None and os.path.exists(PARENT_STORE_DB):
+            _parent_store = ParentStore(PARENT_STORE_DB)
+    return _parent_store.get if _parent_store is not None else None
+
+
+def search_hits(vector_store, query_embeddings, top_k: int, topics, queries=None):
+    # query_hits with embeddings for MMR; a hybrid store also gets the question texts.
+    # Chunks cut from a larger passage get that passage as "parent" metadata.
+    if queries is not None and isinstance(vector_store, HybridBackend):
+        hits = vector_store.query_hits(query_embeddings, top_k, include_embeddings=True, topics=topics,
+                                       queries=queries)
+    else:
+        hits = vector_store.query_hits(query_embeddings, top_k, include_embeddings=True, topics=topics)
+    return attach_parents(hits, parent_lookup(vector_store))
+
+
+def retrieve_context(vector_store, query_embeddings, max_chunks: int = TOP_K, topics=None, queries=None):
+    # Returns (docs, info) per query; info has the candidate counts and context tokens.
+    # `topics` limits the search to books filed under them, RETRIEVAL_TOPICS by default.
+    # `queries` are the question texts, used by keyword search; query_embeddings may
+    # be None when needs_query_embeddings() is False.
+    hits = search_hits(vector_store, query_embeddings, max(CONTEXT_CANDIDATES, max_chunks),
+                       RETRIEVAL_TOPICS if topics is None else topics, queries)
+    if query_embeddings is None:
+        query_embeddings = [None] * len(hits)
+    return [build_context(query_hits, embedding, max_chunks)
+            for query_hits, embedding in zip(hits, query_embeddings)]
+
+
+def record_prompt_size(prompt, usage):
+    # Adds the estimated and, when reported, actual prompt tokens to the current request trace
+    trace = current_trace()
+    if trace is None:
+        return
+    trace.value("prompt_tokens_estimate", sum(estimate_tokens(m["content"]) for m in prompt))
+    if usage is not None and getattr(usage, "prompt_tokens", None):
+        trace.value("prompt_tokens", usage.prompt_tokens)
+
+
+def log_llm_error(error):
+    # One JSON line on the trace log, like the request traces
+    trace_logger.warning(json.dumps({"event": "llm_error", "ts": time.time(),
+                                     "error": MESSAGES["api_call_error"].format(error)}, ensure_ascii=False))
+
+
+def build_messages(question: str, context_docs: list):
+    context = "\n\n".join(context_docs) if context_docs else ""
+    system_msg = "You are an ASHA worker assistant. Answer succinctly and clearly for a community health worker."
+    user_msg = f"Context:\n{context}\n\nQuestion:\n{question}" if context else question
+
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg},
+    ]
+
+
+def ask_cerebras(client, question: str, context_docs: list, messages=MESSAGES, tab: str = "learning"):
+    # Returns (answer, ok); ok is False when the text is a fallback message
+    if not CEREBRAS_AVAILABLE or not client:
+        return CEREBRAS_UNAVAILABLE_MSG, False
+
+    prompt = build_messages(question, context_docs)
+    try:
+        completion = client.complete(prompt, tab)
+    except LLMUnavailable:
+        return messages["llm_unavailable"], False
+    except Exception as e:
+        log_llm_error(e)
+        return messages["llm_unavailable"], False
+    usage = getattr(completion, "usage", None)
+    record_prompt_size(prompt, usage)
+    try:
+        return completion.choices[0].message.content, True
+    except Exception:
+        try:
+            return completion.choices[0].message.get("content", str(completion)), True
+        except Exception:
+            return str(completion), True
+
+
+def stream_cerebras(client, question: str, context_docs: list, stats: dict, messages=MESSAGES,
+                    tab: str = "learning"):
+    # Yields answer text as it arrives and fills `stats` with timing for this request
+    start = time.perf_counter()
+    stats.update(ok=False, ttft=None, tokens=0, prompt_tokens=None, seconds=0.0, tokens_per_sec=0.0)
+    if not CEREBRAS_AVAILABLE or not client:
+        yield CEREBRAS_UNAVAILABLE_MSG
+        return
+
+    try:
+        prompt = build_messages(question, context_docs)
+        usage = None
+        for chunk in client.stream(prompt, tab):
+            usage = getattr(chunk, "usage", None) or usage
+            if usage and getattr(usage, "completion_tokens", None):
+                stats["tokens"] = usage.completion_tokens
+            if usage and getattr(usage, "prompt_tokens", None):
+                stats["prompt_tokens"] = usage.prompt_tokens
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if stats["ttft"] is None:
+                stats["ttft"] = time.perf_counter() - start
+            if not usage:
+                stats["tokens"] += 1
+            yield text
+        stats["ok"] = True
+        record_prompt_size(prompt, usage)
+    except Exception as e:
+        if not isinstance(e, LLMUnavailable):
+            log_llm_error(e)
+        # Falls back to the retrieved context, which callers show under the answer
+        yield ("\n\n" if stats["tokens"] else "") + messages["llm_unavailable"]
+    finally:
+        stats["seconds"] = time.perf_counter() - start
+        generating = stats["seconds"] - (stats["ttft"] or 0.0)
+        if stats["tokens"] and generating > 0:
+            stats["tokens_per_sec"] = stats["tokens"] / generating
+        trace = current_trace()
+        if trace is not None:
+            trace.value("completion_tokens", stats["tokens"])
+            trace.value("tokens_per_sec", round(stats["tokens_per_sec"], 1))
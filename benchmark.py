@@ -0,0 +1,560 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# Offline retrieval, ingest and answer benchmarks. Results are written as JSON under
+# benchmarks/results so runs before and after a change can be compared:
+#   python benchmark.py all
+#   python benchmark.py compare benchmarks/results/old.json benchmarks/results/new.json
+
+GOLD_QUESTIONS_FILE = os.path.join("benchmarks", "gold_questions.json")
+RESULTS_DIR = os.path.join("benchmarks", "results")
+RECALL_KS = (1, 3, 5, 10)
+
+
+def summarize(seconds):
+    # Latency distribution in milliseconds
+    if not seconds:
+        return {"count": 0}
+    values = sorted(s * 1000 for s in seconds)
+
+    def pct(q):
+        return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values),
+        "p50_ms": pct(0.5),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": values[-1],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_gold_questions(path=GOLD_QUESTIONS_FILE, language=None):
+    with open(path, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    return [q for q in questions if language in (None, q["language"])]
+
+
+def is_relevant(metadata, relevant):
+    source = os.path.basename(str((metadata or {}).get("source", "")))
+    page = (metadata or {}).get("page")
+    return any(source == r["source"] and page in r["pages"] for r in relevant)
+
+
+@lru_cache(maxsize=None)
+def open_retrieval():
+    # Shared by every suite in one run so the model loads once
+    import backend
+
+    _, embedder = backend.load_models()
+    vector_store = backend.open_vector_store()
+    if vector_store is None:
+        raise SystemExit("No vector store found; run vector_embedding.py first.")
+    return backend, embedder, vector_store
+
+
+def score_retrieval(questions, embeddings, all_hits, top_k):
+    # recall@k: share of questions with a relevant page in the top k; MRR of the first relevant hit;
+    # context_recall: share whose packed prompt context holds a relevant page
+    from context_builder import build_context
+
+    depth = max(RECALL_KS)
+    per_question = []
+    for question, embedding, hits in zip(questions, embeddings, all_hits):
+        rank = next((i + 1 for i, hit in enumerate(hits[:depth])
+                     if is_relevant(hit["metadata"], question["relevant"])), None)
+        # What the prompt would actually get after the distance cutoff, MMR and token budget
+        docs, info = build_context(hits, embedding, top_k)
+        in_context = [hit for hit in hits
+                      if any((hit["metadata"].get("parent") or hit["document"]).startswith(doc) for doc in docs)]
+        per_question.append({
+            "id": question["id"],
+            "language": question["language"],
+            "rank": rank,
+            "context_relevant": any(is_relevant(hit["metadata"], question["relevant"]) for hit in in_context),
+            "context_chunks": info["chunks"],
+            "context_tokens": info["context_tokens"],
+            "top_hits": [{"source": hit["metadata"].get("source"), "page": hit["metadata"].get("page"),
+                          "distance": hit["distance"]} for hit in hits[:3]],
+        })
+
+    def scores(rows):
+        result = {f"recall@{k}": sum(1 for r in rows if r["rank"] and r["rank"] <= k) / len(rows)
+                  for k in RECALL_KS}
+        result["mrr"] = sum(1.0 / r["rank"] for r in rows if r["rank"]) / len(rows)
+        result["context_recall"] = sum(1 for r in rows if r["context_relevant"]) / len(rows)
+        result["mean_context_chunks"] = statistics.fmean(r["context_chunks"] for r in rows)
+        result["mean_context_tokens"] = statistics.fmean(r["context_tokens"] for r in rows)
+        result["questions"] = len(rows)
+        return result
+
+    by_language = {}
+    for language in sorted({r["language"] for r in per_question}):
+        by_language[language] = scores([r for r in per_question if r["language"] == language])
+    return {"overall": scores(per_question), "by_language": by_language, "questions": per_question}
+
+
+def bench_retrieval(args):
+    from context_builder import CONTEXT_CANDIDATES
+
+    backend, embedder, vector_store = open_retrieval()
+    questions = load_gold_questions(args.gold, args.language)
+    texts = [q["question"] for q in questions]
+    query_cache = backend.QueryEmbeddingCache(embedder)
+    embeddings = query_cache.embed(texts)
+    # The question texts let a hybrid or lexical store run its keyword search and fusion
+    all_hits = backend.search_hits(vector_store, embeddings, max(max(RECALL_KS), CONTEXT_CANDIDATES), None,
+                                   queries=texts)
+    result = score_retrieval(questions, embeddings, all_hits, args.top_k)
+    print("Retrieval: " + ", ".join(f"{k}={v:.3f}" for k, v in result["overall"].items() if k != "questions"))
+    return result
+
+
+def bench_query_latency(args):
+    # Uncached single-question latency, the path a fresh question takes in the app
+    backend, embedder, vector_store = open_retrieval()
+    questions = [q["question"] for q in load_gold_questions(args.gold, args.language)]
+    embedder.encode(questions[:1])  # warm up
+    embed_times, search_times, total_times = [], [], []
+    for _ in range(args.repeat):
+        for question in questions:
+            start = time.perf_counter()
+            embedding = embedder.encode([question], convert_to_numpy=True).tolist()
+            embedded = time.perf_counter()
+            backend.retrieve_context(vector_store, embedding, args.top_k, queries=[question])
+            done = time.perf_counter()
+            embed_times.append(embedded - start)
+            search_times.append(done - embedded)
+            total_times.append(done - start)
+
+    # Batched encode, as the API server's micro-batcher does it
+    batch_times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        embeddings = embedder.encode(questions, convert_to_numpy=True).tolist()
+        backend.retrieve_context(vector_store, embeddings, args.top_k, queries=questions)
+        batch_times.append((time.perf_counter() - start) / len(questions))
+
+    result = {
+        "embed": summarize(embed_times),
+        "search": summarize(search_times),
+        "total": summarize(total_times),
+        "batched_per_question": summarize(batch_times),
+        "batch_size": len(questions),
+    }
+    print(f"Query latency: p50={result['total']['p50_ms']:.1f}ms p95={result['total']['p95_ms']:.1f}ms "
+          f"(embed p50={result['embed']['p50_ms']:.1f}ms, search p50={result['search']['p50_ms']:.1f}ms)")
+    return result
+
+
+def ingest_books_in_memory(books, chunker, embedding_model):
+    # Parses, splits and embeds the books into a throwaway in-memory collection,
+    # leaving data/ and the ingest manifest untouched; returns (collection, parent
+    # passages by id, result)
+    import chromadb
+    import vector_embedding
+
+    collection = chromadb.EphemeralClient().create_collection(
+        f"benchmark_{chunker.mode}_{os.getpid()}_{int(time.time())}"
+    )
+    workers = max(1, min(vector_embedding.INGEST_WORKERS, len(books)))
+
+    pages = chunks = 0
+    stored_bytes = {"vectors": 0, "documents": 0, "metadatas": 0, "parents": 0}
+    parents = {}
+    timings = {"parse_wait": 0.0, "split": 0.0, "embed": 0.0, "store": 0.0}
+    batch = []
+
+    def flush():
+        nonlocal chunks
+        if not batch:
+            return
+        start = time.perf_counter()
+        embeddings = embedding_model.embed_documents([doc.page_content for doc in batch])
+        timings["embed"] += time.perf_counter() - start
+        metadatas = [{k: v for k, v in doc.metadata.items() if v is not None} for doc in batch]
+        start = time.perf_counter()
+        collection.add(
+            ids=[f"{chunks + i}" for i in range(len(batch))],
+            embeddings=embeddings,
+            documents=[doc.page_content for doc in batch],
+            metadatas=metadatas,
+        )
+        timings["store"] += time.perf_counter() - start
+        stored_bytes["vectors"] += sum(len(e) for e in embeddings) * 4
+        stored_bytes["documents"] += sum(len(doc.page_content.encode("utf-8")) for doc in batch)
+        stored_bytes["metadatas"] += sum(len(json.dumps(m, ensure_ascii=False).encode("utf-8")) for m in metadatas)
+        chunks += len(batch)
+        batch.clear()
+
+    start_all = time.perf_counter()
+    wait_start = time.perf_counter()
+    for pdf, loaded, error in vector_embedding.iter_loaded_books(books, workers):
+        timings["parse_wait"] += time.perf_counter() - wait_start
+        if error is not None:
+            print(f"Error loading {pdf}: {error}")
+        else:
+            pages += len(loaded)
+            for page in loaded:
+                start = time.perf_counter()
+                docs, passages = chunker.split(page)
+                timings["split"] += time.perf_counter() - start
+                for parent_id, text in passages.items():
+                    if parent_id not in parents:
+                        parents[parent_id] = text
+                        stored_bytes["parents"] += len(text.encode("utf-8"))
+                batch.extend(docs)
+                if len(batch) >= vector_embedding.INGEST_BATCH_SIZE:
+                    flush()
+        wait_start = time.perf_counter()
+    flush()
+    seconds = time.perf_counter() - start_all
+
+    result = {
+        "chunking": chunker.signature,
+        "books": len(books),
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": seconds,
+        "pages_per_sec": pages / seconds if seconds else 0.0,
+        "chunks_per_sec": chunks / seconds if seconds else 0.0,
+        "stage_seconds": timings,
+        "stored_bytes": {**stored_bytes, "total": sum(stored_bytes.values())},
+        "workers": workers,
+        "batch_size": vector_embedding.INGEST_BATCH_SIZE,
+    }
+    return collection, parents, result
+
+
+def bench_ingest(args):
+    import vector_embedding
+
+    books = [pdf for pdf in (args.books or vector_embedding.pdf_files) if os.path.exists(pdf)]
+    embedding_model = vector_embedding.load_embedding_model()
+    chunker = vector_embedding.Chunker(args.chunking or vector_embedding.CHUNKING,
+                                       tokenizer=vector_embedding.load_chunk_tokenizer(embedding_model))
+    _, _, result = ingest_books_in_memory(books, chunker, embedding_model)
+    print(f"Ingest: {result['pages']} pages, {result['chunks']} chunks in {result['seconds']:.1f}s "
+          f"({result['pages_per_sec']:.1f} pages/s, {result['chunks_per_sec']:.1f} chunks/s)")
+    return result
+
+
+def bench_chunking(args):
+    # Both chunking modes side by side: how much of each chunk the model actually reads,
+    # what the index stores, how long ingest takes and the recall it buys
+    from context_builder import CONTEXT_CANDIDATES
+    from embedding_backends import EMBEDDING_MAX_TOKENS
+    from parent_store import attach_parents
+    from vector_backends import ChromaBackend
+    import vector_embedding
+
+    books = [pdf for pdf in (args.books or vector_embedding.pdf_files) if os.path.exists(pdf)]
+    embedding_model = vector_embedding.load_embedding_model()
+    tokenizer = vector_embedding.load_chunk_tokenizer(embedding_model)
+    questions = load_gold_questions(args.gold, args.language)
+    # Pages outside the ingested books cannot be found, so only their questions count
+    sources = {os.path.basename(pdf) for pdf in books}
+    questions = [q for q in questions if any(r["source"] in sources for r in q["relevant"])]
+    if not questions:
+        raise SystemExit("No gold question is answered by these books.")
+    query_embeddings = embedding_model.embed_documents([q["question"] for q in questions])
+
+    result = {}
+    for mode in ("characters", "tokens"):
+        chunker = vector_embedding.Chunker(mode, tokenizer=tokenizer)
+        collection, parents, ingest = ingest_books_in_memory(books, chunker, embedding_model)
+        documents = collection.get(include=["documents"])["documents"]
+        lengths = [len(tokenizer.encode(doc, add_special_tokens=False).ids) for doc in documents]
+        all_hits = attach_parents(
+            ChromaBackend(collection).query_hits(
+                query_embeddings, max(max(RECALL_KS), CONTEXT_CANDIDATES), include_embeddings=True
+            ),
+            lambda parent_ids: {parent_id: parents[parent_id] for parent_id in parent_ids if parent_id in parents},
+        )
+        retrieval = score_retrieval(questions, query_embeddings, all_hits, args.top_k)
+        result[mode] = {
+            "ingest": ingest,
+            "mean_chunk_tokens": statistics.fmean(lengths) if lengths else 0.0,
+            # Share of chunks longer than the model reads, whose tail is never embedded
+            "truncated_share": sum(1 for n in lengths if n > EMBEDDING_MAX_TOKENS - 2) / len(lengths)
+            if lengths else 0.0,
+            "retrieval": retrieval["overall"],
+        }
+        print(f"Chunking ({mode}): {ingest['chunks']} chunks, "
+              f"{ingest['stored_bytes']['total'] / 1e6:.1f} MB, {ingest['seconds']:.1f}s, "
+              f"truncated={result[mode]['truncated_share']:.1%}, "
+              f"recall@5={retrieval['overall']['recall@5']:.3f}, "
+              f"context_recall={retrieval['overall']['context_recall']:.3f}")
+    return result
+
+
+def bench_e2e(args):
+    # Retrieval plus an answer from a local fake Cerebras server with fixed latency
+    from fake_cerebras import FakeCerebrasConfig, FakeCerebrasServer
+
+    backend, embedder, vector_store = open_retrieval()
+    if not backend.CEREBRAS_AVAILABLE:
+        raise SystemExit("The Cerebras SDK is not installed.")
+    questions = [q["question"] for q in load_gold_questions(args.gold, args.language)]
+    config = FakeCerebrasConfig(latency_ms=args.llm_latency_ms, token_ms=args.llm_token_ms, seed=0)
+
+    blocking, streaming, first_token = [], [], []
+    failures = 0
+    with FakeCerebrasServer(config) as server:
+        client = backend.create_llm_client("benchmark", backend.CEREBRAS_MODEL_NAME, server.base_url)
+        for _ in range(args.repeat):
+            for question in questions:
+                start = time.perf_counter()
+                embedding = embedder.encode([question], convert_to_numpy=True).tolist()
+                docs = backend.retrieve_context(vector_store, embedding, args.top_k, queries=[question])[0][0]
+                answer, ok = backend.ask_cerebras(client, question, docs)
+                blocking.append(time.perf_counter() - start)
+                failures += not ok
+
+                stats = {}
+                start = time.perf_counter()
+                embedding = embedder.encode([question], convert_to_numpy=True).tolist()
+                docs = backend.retrieve_context(vector_store, embedding, args.top_k, queries=[question])[0][0]
+                retrieved = time.perf_counter() - start
+                for _ in backend.stream_cerebras(client, question, docs, stats):
+                    pass
+                streaming.append(time.perf_counter() - start)
+                if stats["ttft"] is not None:
+                    first_token.append(retrieved + stats["ttft"])
+                failures += not stats["ok"]
+
+    result = {
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_token_ms": args.llm_token_ms,
+        "blocking_answer": summarize(blocking),
+        "streaming_answer": summarize(streaming),
+        "time_to_first_token": summarize(first_token),
+        "failures": failures,
+    }
+    print(f"End to end: answer p50={result['blocking_answer']['p50_ms']:.1f}ms "
+          f"first token p50={result['time_to_first_token'].get('p50_ms', 0.0):.1f}ms failures={failures}")
+    return result
+
+
+def bench_resilience(args):
+    # The LLM client alone against a fake server that fails and stalls some requests,
+    # per tab so the tighter Urgent Help deadline shows up
+    import backend
+    from fake_cerebras import FakeCerebrasConfig, FakeCerebrasServer
+    from llm_client import LLMError
+
+    if not backend.CEREBRAS_AVAILABLE:
+        raise SystemExit("The Cerebras SDK is not installed.")
+    questions = [q["question"] for q in load_gold_questions(args.gold, args.language)]
+    config = FakeCerebrasConfig(latency_ms=args.llm_latency_ms, token_ms=args.llm_token_ms,
+                                error_rate=args.error_rate, slow_rate=args.slow_rate, seed=0)
+    result = {"error_rate": args.error_rate, "slow_rate": args.slow_rate}
+    with FakeCerebrasServer(config) as server:
+        for tab in ("learning", "urgent"):
+            client = backend.create_llm_client("benchmark", backend.CEREBRAS_MODEL_NAME, server.base_url)
+            latencies, failures, fast_failures = [], 0, 0
+            for _ in range(args.repeat):
+                for question in questions:
+                    start = time.perf_counter()
+                    try:
+                        client.complete(backend.build_messages(question, []), tab)
+                        latencies.append(time.perf_counter() - start)
+                    except LLMError:
+                        fast_failures += 1
+                    except Exception:
+                        failures += 1
+            total = len(latencies) + failures + fast_failures
+            result[tab] = {
+                "deadline_seconds": client.deadline(tab),
+                "success_rate": len(latencies) / total if total else 0.0,
+                "latency": summarize(latencies),
+                "failures": failures,
+                "deadline_or_breaker_failures": fast_failures,
+                "retries": client.retries,
+                "hedges": client.hedges,
+                "breaker_opened": client.breaker.opened,
+            }
+            print(f"Resilience ({tab}): success={result[tab]['success_rate']:.1%} "
+                  f"p99={result[tab]['latency'].get('p99_ms', 0.0):.0f}ms retries={client.retries} "
+                  f"hedges={client.hedges} breaker_opened={client.breaker.opened}")
+    return result
+
+
+def bench_quantization(args):
+    # The int8 index against the exact float16 NumPy index it is built from: memory per
+    # million chunks, how many exact neighbors survive quantization and rescoring, and
+    # the gold-question recall each one gets
+    import tempfile
+
+    from context_builder import CONTEXT_CANDIDATES
+    from vector_backends import NUMPY_INDEX_DIR, NumpyBackend, QuantizedBackend, export_quantized_index, resident_bytes
+
+    backend, embedder, _ = open_retrieval()
+    try:
+        exact = NumpyBackend(NUMPY_INDEX_DIR)
+    except OSError:
+        raise SystemExit("No NumPy index found; run vector_embedding.py first.")
+    questions = load_gold_questions(args.gold, args.language)
+    embeddings = backend.QueryEmbeddingCache(embedder).embed([q["question"] for q in questions])
+    depth = max(max(RECALL_KS), CONTEXT_CANDIDATES)
+
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        export_quantized_index(NUMPY_INDEX_DIR, tmp)
+        quantized = QuantizedBackend(tmp)
+        exact_rows = None
+        for name, store in (("float16", exact), ("int8", quantized)):
+            seconds = []
+            for _ in range(args.repeat):
+                for embedding in embeddings:
+                    start = time.perf_counter()
+                    store.search([embedding], depth)
+                    seconds.append(time.perf_counter() - start)
+            rows, _ = store.search(embeddings, depth)
+            if exact_rows is None:
+                exact_rows = rows
+            all_hits = backend.search_hits(store, embeddings, depth, None)
+            disk = sum(os.path.getsize(os.path.join(store.index_dir, f)) for f in os.listdir(store.index_dir))
+            if store is quantized:
+                # It rescores against the NumPy index's vectors, so those stay on disk too
+                disk += os.path.getsize(os.path.join(NUMPY_INDEX_DIR, "vectors.npy"))
+            # Bytes per chunk are megabytes per million chunks
+            result[name] = {
+                "resident_mb_per_million_chunks": resident_bytes(store) / max(1, len(store)),
+                "disk_mb_per_million_chunks": disk / max(1, len(store)),
+                "search": summarize(seconds),
+                # Share of the exact index's top k that this index also returns
+                "neighbor_recall": {
+                    f"@{k}": statistics.fmean(len(set(a[:k]) & set(b[:k])) / k for a, b in zip(exact_rows, rows))
+                    for k in RECALL_KS if k <= depth
+                },
+                "retrieval": score_retrieval(questions, embeddings, all_hits, args.top_k)["overall"],
+            }
+            print(f"Quantization ({name}): {result[name]['resident_mb_per_million_chunks']:.0f} MB resident "
+                  f"per million chunks, search p50={result[name]['search']['p50_ms']:.2f}ms, "
+                  f"neighbor recall@10={result[name]['neighbor_recall']['@10']:.3f}, "
+                  f"recall@5={result[name]['retrieval']['recall@5']:.3f}")
+        del quantized
+    result["recall_loss"] = {key: result["float16"]["retrieval"][key] - result["int8"]["retrieval"][key]
+                             for key in result["float16"]["retrieval"] if key != "questions"}
+    return result
+
+
+SUITES = {
+    "retrieval": bench_retrieval,
+    "query-latency": bench_query_latency,
+    "ingest": bench_ingest,
+    "chunking": bench_chunking,
+    "e2e": bench_e2e,
+    "resilience": bench_resilience,
+    "quantization": bench_quantization,
+}
+
+
+def flatten(value, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}, numbers only
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}{key}."))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix[:-1]: value}
+    return {}
+
+
+def compare(old_path, new_path):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = flatten(json.load(f)["results"])
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = flatten(json.load(f)["results"])
+    for key in sorted(set(old) & set(new)):
+        if old[key] == new[key]:
+            continue
+        change = f"{(new[key] - old[key]) / old[key]:+.1%}" if old[key] else "n/a"
+        print(f"{key}: {old[key]:.4g} -> {new[key]:.4g} ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sahayak retrieval and latency benchmarks")
+    parser.add_argument("suite", choices=[*SUITES, "all", "compare"])
+    parser.add_argument("files", nargs="*", help="for compare: the old and new result files")
+    parser.add_argument("--gold", default=GOLD_QUESTIONS_FILE)
+    parser.add_argument("--language", choices=["en", "hi"], help="only questions in this language")
+    parser.add_argument("--top-k", type=int, default=None, help="most chunks in the prompt context (default TOP_K)")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the questions for latency suites")
+    parser.add_argument("--books", nargs="*", help="PDFs for the ingest and chunking suites (default: every book)")
+    parser.add_argument("--chunking", choices=["tokens", "characters"], help="chunking mode of the ingest suite")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="fake Cerebras time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=15.0, help="fake Cerebras delay per token")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="fake Cerebras failure rate (resilience)")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="fake Cerebras stall rate (resilience)")
+    parser.add_argument("--online", action="store_true", help="allow model downloads from the Hugging Face Hub")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<time>-<suite>.json)")
+    args = parser.parse_args()
+
+    if args.suite == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs two result files")
+        compare(*args.files)
+        return 0
+
+    if not args.online:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    # Imported after the offline switches so the Hub client sees them
+    import backend
+
+    if args.top_k is None:
+        args.top_k = backend.TOP_K
+    suites = list(SUITES) if args.suite == "all" else [args.suite]
+    results = {}
+    for name in suites:
+        print(f"Running {name} benchmark...")
+        results[name] = SUITES[name](args)
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "embedding_model": backend.EMBEDDING_MODEL_NAME,
+            "embedding_backend": backend.EMBEDDING_BACKEND,
+            "vector_backend": backend.VECTOR_BACKEND,
+            "retrieval_mode": backend.RETRIEVAL_MODE,
+            "top_k": args.top_k,
+            "gold_questions": args.gold,
+            "language": args.language,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{args.suite}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
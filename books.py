@@ -0,0 +1,33 @@
+# Books ingested by vector_embedding.py; kept apart from it so the app can check
+# whether the index is up to date without importing the PDF loaders
+pdf_files = ["book-no-0.pdf",  # Added missing book 0
+             "book-no-1.pdf", 
+             "book-no-2.pdf",
+             "book-no-3.pdf",
+             "book-no-4.pdf", 
+             "book-no-5.pdf",
+             "book-no-6.pdf",
+             "book-no-7.pdf", 
+             "book-no-8.pdf",
+             "book-no-9.pdf",
+             "book-no-10.pdf", 
+             "book-no-11.pdf",
+             "book-no-12.pdf"]  # add your PDFs here
+
+# Topic each book is filed under; RETRIEVAL_TOPICS (or "topics" in an API request)
+# limits a search to the books of some topics
+BOOK_TOPICS = {
+    "book-no-0.pdf": "violence_against_women",
+    "book-no-1.pdf": "asha_role",
+    "book-no-2.pdf": "maternal_child_health",
+    "book-no-5.pdf": "asha_role",
+    "book-no-6.pdf": "maternal_child_health",
+    "book-no-7.pdf": "maternal_child_health",
+    "book-no-9.pdf": "maternal_child_health",
+    "book-no-12.pdf": "violence_against_women",
+}
+DEFAULT_TOPIC = "general"
+
+
+def book_topic(pdf):
+    return BOOK_TOPICS.get(pdf, DEFAULT_TOPIC)
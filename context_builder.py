@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+
+# Chunks fetched from the vector store before filtering; the prompt gets far fewer
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+# Candidates farther than this squared L2 distance between unit vectors (2 - 2 * cosine)
+# are dropped, except that the nearest CONTEXT_MIN_CHUNKS are always kept
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", "1.2"))
+CONTEXT_MIN_CHUNKS = int(os.getenv("CONTEXT_MIN_CHUNKS", "1"))
+# Relevance vs. diversity trade-off of maximal marginal relevance; 1.0 is pure relevance
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Candidates this similar to an already chosen chunk are overlap or duplicates
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.95"))
+# Approximate prompt tokens available for book passages
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Rough UTF-8 bytes per Llama token; Devanagari takes 3 bytes per character
+BYTES_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str):
+    return max(1, len(text.encode("utf-8")) // BYTES_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, tokens: int):
+    encoded = text.encode("utf-8")[:tokens * BYTES_PER_TOKEN]
+    return encoded.decode("utf-8", errors="ignore").rstrip()
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def select_mmr(query_embedding, embeddings, k, lambda_mult=CONTEXT_MMR_LAMBDA,
+               duplicate_similarity=CONTEXT_DUPLICATE_SIMILARITY):
+    # Indexes of up to k candidates, each maximizing
+    # lambda * sim(query, c) - (1 - lambda) * max sim(c, chosen)
+    if not len(embeddings) or k <= 0:
+        return []
+    candidates = _unit(embeddings)
+    relevance = candidates @ _unit(query_embedding)
+    similarity = candidates @ candidates.T
+    chosen = [int(np.argmax(relevance))]
+    redundancy = similarity[chosen[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[chosen[0]] = False
+    while len(chosen) < k:
+        available &= redundancy < duplicate_similarity
+        if not available.any():
+            break
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return chosen
+
+
+def build_context(hits: list, query_embedding, max_chunks: int, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  max_distance: float = CONTEXT_MAX_DISTANCE, min_chunks: int = CONTEXT_MIN_CHUNKS):
+    # hits are query_hits results with "embedding"; returns (docs, info) where docs
+    # are the chunk texts for the prompt, most relevant first. A chunk cut from a larger
+    # passage ("parent" metadata) is replaced by that passage, once per passage.
+    info = {"candidates": len(hits)}
+    hits = [hit for i, hit in enumerate(hits)
+            if i < min_chunks or hit["distance"] is None or hit["distance"] <= max_distance]
+    info["within_distance"] = len(hits)
+
+    if hits and all(hit.get("embedding") is not None for hit in hits):
+        order = select_mmr(query_embedding, [hit["embedding"] for hit in hits], max_chunks)
+    else:
+        order = range(min(max_chunks, len(hits)))
+    info["after_mmr"] = len(order)
+
+    docs = []
+    parents = set()
+    remaining = token_budget
+    for i in order:
+        metadata = hits[i].get("metadata") or {}
+        parent_id = metadata.get("parent_id")
+        if parent_id and parent_id in parents:
+            continue
+        text = metadata.get("parent") or hits[i]["document"]
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if docs:
+                # A shorter chunk further down may still fit
+                continue
+            # The best chunk alone is over budget; send as much of it as fits
+            text = truncate_to_tokens(text, remaining)
+            tokens = estimate_tokens(text)
+        docs.append(text)
+        if parent_id:
+            parents.add(parent_id)
+        remaining -= tokens
+    info["chunks"] = len(docs)
+    info["context_tokens"] = token_budget - remaining
+    return docs, info
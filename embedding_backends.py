@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# "torch" runs MiniLM through sentence-transformers; "onnx" runs the int8 export below
+# through ONNX Runtime, so torch is never imported by the app or the API server
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_MODEL_DIR = os.path.join("data", "onnx_minilm")
+# Tokens all-MiniLM-L6-v2 reads, [CLS] and [SEP] included; anything longer is cut off
+EMBEDDING_MAX_TOKENS = 256
+# Texts per ONNX Runtime call; inputs are sorted by length so padding stays small
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+# 0 lets ONNX Runtime use every core
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# The parity check fails when any text's int8 vector is less similar than this to the torch one
+ONNX_PARITY_MIN_COSINE = float(os.getenv("ONNX_PARITY_MIN_COSINE", "0.98"))
+
+
+class OnnxEmbedder:
+    # Drop-in for the parts of SentenceTransformer and HuggingFaceEmbeddings this repo
+    # uses: encode(), embed_documents() and embed_query(). Mean pooling and L2
+    # normalization match the sentence-transformers pipeline of all-MiniLM-L6-v2.
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=True, batch_size=ONNX_BATCH_SIZE, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.model_id = self.meta["model"]
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feed = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feed)[0]
+        mask = feed["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.meta.get("normalize", True):
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+    def encode(self, sentences, batch_size=None, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(texts), self.meta["dimension"]), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        size = batch_size or self.batch_size
+        for start in range(0, len(order), size):
+            rows = order[start:start + size]
+            vectors[rows] = self._encode_batch([texts[i] for i in rows])
+        return vectors[0] if single else vectors
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def export_onnx_model(model_dir=ONNX_MODEL_DIR, model_name=EMBEDDING_MODEL_ID):
+    # Needs torch and sentence-transformers; run once where they are installed and
+    # ship data/onnx_minilm with the serving image
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    os.makedirs(model_dir, exist_ok=True)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model_int8.onnx")
+
+    sample = model.tokenizer(["an example sentence"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    # Dynamic quantization: int8 weights, activations quantized on the fly per batch
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    model.tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        }, f, indent=2)
+    for path in (fp32_path, int8_path):
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+def parity_texts(samples):
+    # Gold benchmark questions plus stored chunks, so both short queries and long passages are covered
+    texts = []
+    gold_path = os.path.join("benchmarks", "gold_questions.json")
+    if os.path.exists(gold_path):
+        with open(gold_path, "r", encoding="utf-8") as f:
+            texts += [q["question"] for q in json.load(f)["questions"]]
+    try:
+        import backend
+
+        texts += sample_shard_texts(backend.open_shards(), samples)
+    except Exception as e:
+        print(f"Skipping stored chunks: {e}")
+    return texts or ["What are the danger signs during pregnancy?"]
+
+
+def sample_shard_texts(shards, samples):
+    # Up to `samples` stored chunks spread evenly over every book's shard and over each
+    # shard's rows, so every book and both scripts are represented
+    if not shards or samples <= 0:
+        return []
+    per_shard = -(-samples // len(shards))
+    texts = []
+    for shard in shards:
+        ids = shard.get(include=[])["ids"]
+        chosen = [ids[i * len(ids) // per_shard] for i in range(min(per_shard, len(ids)))]
+        if chosen:
+            texts += [doc for doc in shard.get(ids=chosen, include=["documents"])["documents"] if doc]
+    return texts[:samples]
+
+
+def check_parity(model_dir=ONNX_MODEL_DIR, samples=200, min_cosine=ONNX_PARITY_MIN_COSINE):
+    from sentence_transformers import SentenceTransformer
+
+    texts = parity_texts(samples)
+    reference_model = SentenceTransformer(EMBEDDING_MODEL_ID, device="cpu")
+    results = {"texts": len(texts)}
+    reference = None
+    for name, embedder in (("torch", reference_model),
+                           ("onnx_fp32", OnnxEmbedder(model_dir, quantized=False)),
+                           ("onnx_int8", OnnxEmbedder(model_dir))):
+        embedder.encode(texts[:2])  # warm up
+        start = time.perf_counter()
+        vectors = np.asarray(embedder.encode(texts, convert_to_numpy=True), dtype=np.float32)
+        seconds = time.perf_counter() - start
+        query_start = time.perf_counter()
+        for text in texts[:20]:
+            embedder.encode([text])
+        query_ms = (time.perf_counter() - query_start) * 1000 / min(20, len(texts))
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        entry = {"texts_per_sec": len(texts) / seconds, "query_ms": query_ms}
+        if reference is None:
+            reference = vectors
+        else:
+            cosine = (vectors * reference).sum(axis=1)
+            entry.update(min_cosine=float(cosine.min()), mean_cosine=float(cosine.mean()))
+        results[name] = entry
+        print(f"{name:<10} {entry['texts_per_sec']:8.1f} texts/s {query_ms:7.2f} ms/query"
+              + (f"  cosine vs torch min={entry['min_cosine']:.4f} mean={entry['mean_cosine']:.4f}"
+                 if "min_cosine" in entry else ""))
+    results["passed"] = results["onnx_int8"]["min_cosine"] >= min_cosine
+    print("Parity check " + ("passed" if results["passed"] else f"FAILED (minimum cosine {min_cosine})"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export MiniLM to int8 ONNX and check it against PyTorch")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--samples", type=int, default=200, help="stored chunks used by the parity check")
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx_model(args.model_dir)
+        return 0 if check_parity(args.model_dir, args.samples)["passed"] else 1
+    return 0 if check_parity(args.model_dir, args.samples)["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
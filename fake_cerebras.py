@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+# Local stand-in for the Cerebras chat completions endpoint, used by the benchmarks.
+# Point the SDK at it with CEREBRAS_BASE_URL=http://127.0.0.1:8100 and any API key.
+
+FAKE_ANSWER = (
+    "Based on the ASHA reading material: check for the danger signs, give first aid, "
+    "and refer the patient to the nearest health facility without delay."
+)
+
+
+class FakeCerebrasConfig:
+    def __init__(self, latency_ms=300.0, jitter_ms=50.0, token_ms=15.0, error_rate=0.0,
+                 error_status=503, slow_rate=0.0, slow_ms=5000.0, answer=FAKE_ANSWER, seed=None):
+        # latency_ms: delay before the first token; token_ms: delay between streamed tokens;
+        # error_rate: fraction of requests failed with error_status;
+        # slow_rate: fraction of requests whose first token takes slow_ms instead (tail latency)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_status = error_status
+        self.answer = answer
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+
+def _first_token_delay(config):
+    if config.random.random() < config.slow_rate:
+        return config.slow_ms / 1000.0
+    return max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000.0
+
+
+def _usage(messages, tokens):
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)}
+
+
+async def handle_chat_completions(request):
+    config = request.app["config"]
+    config.requests += 1
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    messages = body.get("messages", [])
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    await asyncio.sleep(_first_token_delay(config))
+    if config.random.random() < config.error_rate:
+        config.errors += 1
+        return web.json_response(
+            {"error": {"message": "injected failure", "type": "server_error"}}, status=config.error_status
+        )
+
+    tokens = [word + " " for word in config.answer.split()]
+    if not body.get("stream"):
+        await asyncio.sleep(config.token_ms * len(tokens) / 1000.0)
+        return web.json_response({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(messages, tokens),
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+
+    async def send(payload):
+        await response.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    for i, token in enumerate(tokens):
+        if i:
+            await asyncio.sleep(config.token_ms / 1000.0)
+        await send({
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        })
+    await send({
+        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": _usage(messages, tokens),
+    })
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def handle_stats(request):
+    config = request.app["config"]
+    return web.json_response({"requests": config.requests, "errors": config.errors})
+
+
+def create_app(config=None):
+    app = web.Application()
+    app["config"] = config or FakeCerebrasConfig()
+    app.router.add_post("/v1/chat/completions", handle_chat_completions)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+class FakeCerebrasServer:
+    # Runs the fake server on a background event loop, for use inside benchmark processes
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or FakeCerebrasConfig()
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        import threading
+
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(create_app(self.config))
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Cerebras chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="delay before the first token")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=15.0, help="delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=5000.0)
+    args = parser.parse_args()
+    web.run_app(create_app(FakeCerebrasConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_ms=args.token_ms,
+        error_rate=args.error_rate, error_status=args.error_status,
+        slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+    )), host=args.host, port=args.port)
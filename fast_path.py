@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from embedding_backends import EMBEDDING_MODEL_ID
+
+# Precomputed answers for the example questions and emergency intents, matched
+# before retrieval or any LLM call. `python fast_path.py build` (also run by
+# vector_embedding.py after the index changes) writes FAST_PATH_STORE.
+FAST_PATH_INTENTS = "fast_path_intents.json"
+FAST_PATH_STORE = os.path.join("data", "fast_answers.json")
+# Cosine similarity to one of an intent's phrasings needed to serve its answer
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.85"))
+# Answers without clinical sign-off (the intents' drafts and LLM drafts) are served under an
+# "unreviewed" notice; set this to 0 to serve vetted answers only
+FAST_PATH_SERVE_DRAFTS = os.getenv("FAST_PATH_SERVE_DRAFTS", "1") == "1"
+
+
+def normalize_text(text: str):
+    return " ".join(text.lower().split()).rstrip("?!.। ")
+
+
+def load_intents(path=FAST_PATH_INTENTS):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["intents"]
+
+
+def load_store(path=FAST_PATH_STORE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_fast_answers(embed, retrieve, model_id, ask=None, intents_path=FAST_PATH_INTENTS, store_path=FAST_PATH_STORE):
+    # embed(texts) -> vectors; retrieve(vector) -> context docs; ask(question, docs) -> (answer, ok)
+    # drafts answers that have neither vetted nor draft text. Drafts from the previous build are kept.
+    previous = {intent["id"]: intent for intent in (load_store(store_path) or {}).get("intents", [])}
+    intents = []
+    for intent in load_intents(intents_path):
+        phrasings = [(language, text) for language, texts in intent["phrasings"].items() for text in texts]
+        vectors = embed([text for _, text in phrasings])
+        # The books are in English, so the first English phrasing picks the context
+        canonical = next(i for i, (language, _) in enumerate(phrasings) if language == "en")
+        docs = retrieve(vectors[canonical])
+
+        answers = {}
+        old_answers = previous.get(intent["id"], {}).get("answers", {})
+        for language in intent["phrasings"]:
+            vetted = intent.get("answers", {}).get(language)
+            draft = intent.get("drafts", {}).get(language)
+            if vetted:
+                answers[language] = {"text": vetted, "vetted": True}
+            elif draft:
+                answers[language] = {"text": draft, "vetted": False}
+            elif old_answers.get(language) and not old_answers[language]["vetted"]:
+                answers[language] = old_answers[language]
+            elif ask is not None:
+                answer, ok = ask(intent["phrasings"][language][0], docs)
+                if ok:
+                    answers[language] = {"text": answer, "vetted": False}
+                    print(f"Drafted an unvetted {language} answer for '{intent['id']}'; review it and add it to {intents_path}")
+
+        intents.append({
+            "id": intent["id"],
+            "category": intent.get("category", "example"),
+            "phrasings": [{"language": language, "text": text, "embedding": [float(x) for x in vector]}
+                          for (language, text), vector in zip(phrasings, vectors)],
+            "answers": answers,
+            "context": docs,
+        })
+
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    tmp_path = store_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model_id, "built_at": time.time(), "intents": intents}, f, ensure_ascii=False)
+    os.replace(tmp_path, store_path)
+    return len(intents)
+
+
+class FastPath:
+    # Matches a question to a precomputed intent, by exact text first and then by
+    # embedding similarity; returns (answer, docs, intent_id, score, vetted) or None
+    def __init__(self, path=FAST_PATH_STORE, threshold=FAST_PATH_THRESHOLD, serve_drafts=FAST_PATH_SERVE_DRAFTS,
+                 model_id=EMBEDDING_MODEL_ID):
+        store = load_store(path)
+        if store is None:
+            raise OSError(f"{path} is missing or unreadable")
+        # Phrasing vectors from another model are not comparable with the query embeddings
+        if store["model"] != model_id:
+            raise ValueError(f"{path} was built with {store['model']}, not {model_id}; run fast_path.py build")
+        self.model = store["model"]
+        self.threshold = threshold
+        self.serve_drafts = serve_drafts
+        self.intents = store["intents"]
+        self._exact = {}
+        self._rows = []
+        vectors = []
+        for index, intent in enumerate(self.intents):
+            # An intent with nothing to serve is left out, so its phrasings never match
+            if not any(self._servable(answer) for answer in intent["answers"].values()):
+                continue
+            for phrasing in intent["phrasings"]:
+                self._exact.setdefault(normalize_text(phrasing["text"]), index)
+                self._rows.append(index)
+                vectors.append(phrasing["embedding"])
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1 if vectors else 0)
+        self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _servable(self, answer):
+        return bool(answer) and (answer["vetted"] or self.serve_drafts)
+
+    def _answer(self, index, language, score):
+        intent = self.intents[index]
+        for candidate in (language, "en"):
+            answer = intent["answers"].get(candidate)
+            if self._servable(answer):
+                return answer["text"], intent["context"], intent["id"], score, answer["vetted"]
+        return None
+
+    def match_text(self, question: str, language: str):
+        index = self._exact.get(normalize_text(question))
+        return None if index is None else self._answer(index, language, 1.0)
+
+    def match(self, question: str, embedding, language: str):
+        exact = self.match_text(question, language)
+        if exact or embedding is None or not len(self.vectors):
+            return exact
+        query = np.asarray(embedding, dtype=np.float32)
+        if query.shape[-1] != self.vectors.shape[1]:
+            return None
+        scores = self.vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self._answer(self._rows[best], language, float(scores[best]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute fast-path answers for example and emergency questions")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--draft-missing", action="store_true",
+                        help="ask Cerebras for unvetted drafts where an intent has no answer or draft")
+    args = parser.parse_args()
+
+    import backend
+
+    client, embedder, vector_store = backend.initialize_backend()
+    if vector_store is None:
+        print("No vector store found; run vector_embedding.py first.")
+        return 1
+    ask = (lambda question, docs: backend.ask_cerebras(client, question, docs)) if args.draft_missing else None
+    built = build_fast_answers(
+        lambda texts: embedder.encode(texts, convert_to_numpy=True).tolist(),
+        lambda vector: backend.retrieve_context(vector_store, [vector], topics=[])[0][0],
+        EMBEDDING_MODEL_ID,
+        ask,
+    )
+    print(f"Stored {built} fast-path intents in {FAST_PATH_STORE}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
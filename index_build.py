@@ -0,0 +1,169 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from books import book_topic, pdf_files
+from index_snapshot import snapshot_usable
+from ingest_manifest import MANIFEST_FILE, file_sha256, load_manifest, manifest_changes
+
+DATA_DIR = "data"
+VECTOR_FLAG_FILE = "vector_initialized.flag"
+BUILD_LOCK_FILE = os.path.join(DATA_DIR, "index_build.lock")
+BUILD_STATUS_FILE = os.path.join(DATA_DIR, "index_build_status.json")
+# The building process touches its lock this often; an untouched lock is abandoned
+BUILD_HEARTBEAT_SECONDS = 10
+BUILD_LOCK_STALE_SECONDS = float(os.getenv("BUILD_LOCK_STALE_SECONDS", "120"))
+# Wait this long before retrying a failed build
+BUILD_RETRY_SECONDS = float(os.getenv("BUILD_RETRY_SECONDS", "300"))
+# manifest_current verdicts by manifest path: (mtime and size of the manifest and books, current)
+_current = {}
+
+
+def write_status(state, **fields):
+    # state is one of "building", "ready" or "failed"
+    os.makedirs(DATA_DIR, exist_ok=True)
+    status = {"state": state, "updated_at": time.time(), **fields}
+    tmp_path = BUILD_STATUS_FILE + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, BUILD_STATUS_FILE)
+
+
+def read_status():
+    try:
+        with open(BUILD_STATUS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def acquire_build_lock():
+    # Only one process across all app workers may run the build
+    os.makedirs(DATA_DIR, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(BUILD_LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.path.getmtime(BUILD_LOCK_FILE)
+            except OSError:
+                continue
+            if age < BUILD_LOCK_STALE_SECONDS:
+                return False
+            # The previous builder died without cleaning up
+            try:
+                os.remove(BUILD_LOCK_FILE)
+            except OSError:
+                return False
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def manifest_current():
+    # True when the ingest manifest records every book on disk, with its content and
+    # topic, and none that has been removed since. The books are hashed again only once
+    # a file's mtime or size changes. Chunking settings are not compared; run
+    # vector_embedding.py by hand after changing them.
+    books = [pdf for pdf in pdf_files if os.path.exists(pdf)]
+    try:
+        key = tuple((path, stat.st_mtime_ns, stat.st_size)
+                    for path, stat in ((path, os.stat(path)) for path in [MANIFEST_FILE] + books))
+    except OSError:
+        return False
+    cached = _current.get(os.path.abspath(MANIFEST_FILE))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    manifest = load_manifest(MANIFEST_FILE)
+    current = manifest.get("layout") == "sharded" and manifest_changes(
+        manifest, {pdf: file_sha256(pdf) for pdf in books}, book_topic) == ([], [])
+    _current[os.path.abspath(MANIFEST_FILE)] = (key, current)
+    return current
+
+
+def keep_build_lock(stop):
+    # Touches the lock until `stop` is set, for holders that are not waiting on a process
+    while not stop.wait(BUILD_HEARTBEAT_SECONDS):
+        try:
+            os.utime(BUILD_LOCK_FILE)
+        except OSError:
+            return
+
+
+def release_build_lock():
+    try:
+        os.remove(BUILD_LOCK_FILE)
+    except OSError:
+        pass
+
+
+class IndexBuilder:
+    # Runs vector_embedding.py on a background thread under a cross-process lock
+    def __init__(self):
+        self._thread = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def is_ready(self):
+        # The store can be served: a deployed snapshot, or a local store that was built
+        # completely once. A snapshot that fails its checksums is ignored, so the local
+        # store gets built and SnapshotBackend's refusal falls back to it.
+        return os.path.exists(VECTOR_FLAG_FILE) or snapshot_usable()
+
+    def needs_build(self):
+        # A deployed snapshot needs no build; otherwise books added, changed, moved to
+        # another topic or removed since the last build are ingested, while the shards
+        # already built keep serving
+        if snapshot_usable():
+            return False
+        return not os.path.exists(VECTOR_FLAG_FILE) or not manifest_current()
+
+    def ensure_started(self):
+        with self._lock:
+            if not self.needs_build() or (self._thread and self._thread.is_alive()):
+                return
+            if self._failed_at and time.time() - self._failed_at < BUILD_RETRY_SECONDS:
+                return
+            if not acquire_build_lock():
+                return
+            self._thread = threading.Thread(target=self._build, daemon=True)
+            self._thread.start()
+
+    def _build(self):
+        try:
+            write_status("building")
+            process = subprocess.Popen([sys.executable, "vector_embedding.py"])
+            while True:
+                os.utime(BUILD_LOCK_FILE)
+                try:
+                    process.wait(timeout=BUILD_HEARTBEAT_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+            # The flag is only written once every book has been stored
+            if process.returncode == 0:
+                with open(VECTOR_FLAG_FILE, "w") as f:
+                    f.write("done")
+                write_status("ready")
+            else:
+                self._failed_at = time.time()
+                write_status("failed", message=f"vector_embedding.py exited with code {process.returncode}")
+        except Exception as e:
+            self._failed_at = time.time()
+            write_status("failed", message=str(e))
+        finally:
+            release_build_lock()
+
+    def status(self):
+        # {"state": "ready" | "building" | "failed" | "pending", "books_done", "books_total", ...}
+        if self.is_ready():
+            return {"state": "ready"}
+        status = read_status() or {"state": "pending"}
+        if status.get("state") == "ready":
+            status = {"state": "pending"}
+        return status
@@ -0,0 +1,259 @@
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+from contextlib import closing
+
+import chromadb
+
+from backend import collection_name
+from index_build import BUILD_LOCK_FILE, acquire_build_lock, keep_build_lock, read_status, release_build_lock
+from ingest_manifest import PERSIST_DIRECTORY, STAGING_PREFIX, normalized_text_sha256
+from vector_backends import (NUMPY_INDEX_DIR, QUANTIZED_INDEX_DIR, SHARD_PREFIX, export_numpy_index,
+                             export_quantized_index)
+
+CHROMA_SQLITE = os.path.join(PERSIST_DIRECTORY, "chroma.sqlite3")
+# A collection is copied into COMPACT_PREFIX + its name, then renamed back
+COMPACT_PREFIX = "compact-"
+# Rows read from or written to Chroma per call
+PAGE_SIZE = 1000
+# Chroma keeps each collection's HNSW index in a directory named after its segment id
+SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def collection_names(db):
+    return sorted(collection_name(entry) for entry in db.list_collections())
+
+
+def iter_rows(collection, include, page_size=PAGE_SIZE):
+    # Yields (id, {field: value}) for every row of a collection, one page at a time
+    for offset in range(0, collection.count(), page_size):
+        page = collection.get(limit=page_size, offset=offset, include=include)
+        for i, chunk_id in enumerate(page["ids"]):
+            yield chunk_id, {field: page[field][i] if page.get(field) is not None else None for field in include}
+
+
+def collection_stats(collection):
+    # Rows and rows whose text (ignoring case and whitespace) repeats an earlier row
+    hashes = set()
+    rows = 0
+    for _, row in iter_rows(collection, ["documents"]):
+        rows += 1
+        hashes.add(normalized_text_sha256(row["documents"] or ""))
+    duplicates = rows - len(hashes)
+    return {"name": collection.name, "rows": rows, "duplicates": duplicates,
+            "duplicate_ratio": duplicates / rows if rows else 0.0}, hashes
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def store_usage(persist_dir=PERSIST_DIRECTORY):
+    # Bytes held by the SQLite file and the HNSW segment directories; a segment
+    # directory no collection refers to was left behind by a deleted collection
+    sqlite_path = os.path.join(persist_dir, "chroma.sqlite3")
+    with closing(sqlite3.connect(sqlite_path)) as conn:
+        referenced = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    sqlite_bytes = sum(os.path.getsize(sqlite_path + suffix) for suffix in ("", "-wal")
+                       if os.path.exists(sqlite_path + suffix))
+    segment_bytes, orphaned = 0, []
+    for name in sorted(os.listdir(persist_dir)):
+        path = os.path.join(persist_dir, name)
+        if not os.path.isdir(path) or not SEGMENT_DIR.match(name):
+            continue
+        if name in referenced:
+            segment_bytes += _dir_bytes(path)
+        else:
+            orphaned.append((path, _dir_bytes(path)))
+    return {"sqlite_bytes": sqlite_bytes, "segment_bytes": segment_bytes, "orphaned": orphaned}
+
+
+def store_stats(db, persist_dir=PERSIST_DIRECTORY):
+    collections = [db.get_collection(name=name, embedding_function=None) for name in collection_names(db)]
+    stats, seen, shared = [], set(), 0
+    for collection in collections:
+        collection_row, hashes = collection_stats(collection)
+        stats.append(collection_row)
+        # A passage printed in several books lives in each book's shard; that is
+        # intended, as every shard must answer its own topic filter
+        shared += len(hashes & seen)
+        seen |= hashes
+    usage = store_usage(persist_dir)
+    rows = sum(row["rows"] for row in stats)
+    usage["bytes_per_vector"] = (usage["sqlite_bytes"] + usage["segment_bytes"]) / rows if rows else 0.0
+    return stats, shared, usage
+
+
+def compact_collection(db, collection):
+    # Copies the first row of every distinct text, with its stored vector, into a fresh
+    # collection, which gets a new HNSW index without the tombstones of deleted rows,
+    # and swaps it in. Returns (rows kept, duplicate rows removed).
+    name = collection.name
+    target_name = COMPACT_PREFIX + name
+    try:
+        db.delete_collection(name=target_name)
+    except Exception:
+        pass
+    target = db.create_collection(name=target_name, metadata=collection.metadata or None, embedding_function=None)
+
+    seen = set()
+    kept, removed = 0, 0
+    batch = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+
+    def flush():
+        if batch["ids"]:
+            target.add(**batch)
+            for values in batch.values():
+                values.clear()
+
+    for chunk_id, row in iter_rows(collection, ["embeddings", "documents", "metadatas"]):
+        digest = normalized_text_sha256(row["documents"] or "")
+        if digest in seen:
+            removed += 1
+            continue
+        seen.add(digest)
+        kept += 1
+        embedding = row["embeddings"]
+        batch["ids"].append(chunk_id)
+        batch["embeddings"].append(embedding.tolist() if hasattr(embedding, "tolist") else embedding)
+        batch["documents"].append(row["documents"])
+        batch["metadatas"].append(row["metadatas"] or None)
+        if len(batch["ids"]) >= PAGE_SIZE:
+            flush()
+    flush()
+
+    db.delete_collection(name=name)
+    target.modify(name=name)
+    return kept, removed
+
+
+def recover_interrupted(db):
+    # A run stopped between dropping a collection and renaming its copy leaves the copy
+    # as the only one; otherwise an unfinished copy is discarded
+    names = set(collection_names(db))
+    for name in names:
+        if not name.startswith(COMPACT_PREFIX):
+            continue
+        original = name[len(COMPACT_PREFIX):]
+        if original in names:
+            db.delete_collection(name=name)
+        else:
+            db.get_collection(name=name, embedding_function=None).modify(name=original)
+            print(f"Restored '{original}' from an interrupted compaction")
+
+
+def sqlite_in_use(sqlite_path=CHROMA_SQLITE):
+    # True when another connection holds a lock on the file or keeps its WAL from being
+    # checkpointed. An idle Chroma client in the app does neither, so this only catches
+    # processes that are reading or writing right now.
+    with closing(sqlite3.connect(sqlite_path, isolation_level=None, timeout=0)) as conn:
+        try:
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            conn.execute("BEGIN EXCLUSIVE")
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            return True
+    return bool(busy)
+
+
+def vacuum(sqlite_path=CHROMA_SQLITE):
+    # Returns the file's bytes before and after. VACUUM rewrites the whole file under
+    # Chroma clients that still have it open, so the app and the API server must be
+    # stopped first; raises sqlite3.OperationalError when the file is visibly in use.
+    if sqlite_in_use(sqlite_path):
+        raise sqlite3.OperationalError(f"{sqlite_path} is in use; stop the app and the API server first")
+    before = os.path.getsize(sqlite_path)
+    with closing(sqlite3.connect(sqlite_path, isolation_level=None, timeout=0)) as conn:
+        conn.execute("VACUUM")
+    return before, os.path.getsize(sqlite_path)
+
+
+def compact(db, vacuum_sqlite=False):
+    recover_interrupted(db)
+    removed_total = 0
+    for name in collection_names(db):
+        # Collections an ingest run is still filling are left alone
+        if name.startswith(STAGING_PREFIX):
+            continue
+        collection = db.get_collection(name=name, embedding_function=None)
+        if not collection_stats(collection)[0]["duplicates"]:
+            print(f"{name}: no duplicates, left as it is")
+            continue
+        kept, removed = compact_collection(db, collection)
+        removed_total += removed
+        print(f"{name}: kept {kept} rows, removed {removed} duplicates")
+    if removed_total and os.path.exists(NUMPY_INDEX_DIR):
+        shards = [db.get_collection(name=name, embedding_function=None)
+                  for name in collection_names(db) if name.startswith(SHARD_PREFIX)]
+        if shards:
+            print(f"Exported {export_numpy_index(shards)} vectors to {NUMPY_INDEX_DIR}")
+            if os.path.exists(QUANTIZED_INDEX_DIR):
+                print(f"Exported {export_quantized_index(NUMPY_INDEX_DIR)} int8 vectors to {QUANTIZED_INDEX_DIR}")
+    for path, size in store_usage()["orphaned"]:
+        shutil.rmtree(path)
+        print(f"Deleted orphaned segment {path} ({size / 1e6:.1f} MB)")
+    if vacuum_sqlite:
+        before, after = vacuum()
+        print(f"Vacuumed {CHROMA_SQLITE}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+
+def print_stats(db):
+    stats, shared, usage = store_stats(db)
+    for row in stats:
+        print(f"{row['name']}: {row['rows']} rows, {row['duplicates']} duplicates ({row['duplicate_ratio']:.1%})")
+    print(f"{shared} passages are stored in more than one shard")
+    print(f"SQLite {usage['sqlite_bytes'] / 1e6:.1f} MB, HNSW segments {usage['segment_bytes'] / 1e6:.1f} MB, "
+          f"{usage['bytes_per_vector']:.0f} bytes per vector")
+    for path, size in usage["orphaned"]:
+        print(f"Orphaned segment {path} ({size / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report on and compact the Chroma store in data/")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="rows, duplicate ratio, bytes per vector and orphaned segments")
+    compact_parser = subparsers.add_parser(
+        "compact", help="rebuild collections holding duplicate vectors without them and delete orphaned "
+                        "segments; stop the app and the API server first"
+    )
+    compact_parser.add_argument("--vacuum", action="store_true",
+                                help="also VACUUM the Chroma SQLite file; refused while it is in use")
+    args = parser.parse_args()
+
+    try:
+        db = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+        if args.command == "stats":
+            print_stats(db)
+            return 0
+
+        # Collections are swapped and SQLite vacuumed in place, so no ingest may run meanwhile
+        if not acquire_build_lock():
+            print(f"An index build holds {BUILD_LOCK_FILE}; run compact once it has finished")
+            return 1
+        stop = threading.Event()
+        threading.Thread(target=keep_build_lock, args=(stop,), daemon=True).start()
+        try:
+            status = read_status() or {}
+            if status.get("state") == "building":
+                print("The index build status shows a build in progress; if none is running, the last "
+                      "one was interrupted: run vector_embedding.py to finish it before compacting")
+                return 1
+            if args.vacuum and sqlite_in_use():
+                print(f"{CHROMA_SQLITE} is in use; stop the app and the API server before compacting with --vacuum")
+                return 1
+            compact(db, vacuum_sqlite=args.vacuum)
+        finally:
+            stop.set()
+            release_build_lock()
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Maintenance error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from embedding_backends import EMBEDDING_MODEL_ID
+from lexical_index import LexicalIndex
+from parent_store import PARENT_STORE_DB, ParentStore
+from vector_backends import NumpyBackend, export_numpy_index
+
+# A prebuilt, read-only index in one file. When it exists it is served instead of
+# the Chroma store, so a new node only needs this file to answer with book context.
+INDEX_SNAPSHOT = os.getenv("INDEX_SNAPSHOT", os.path.join("data", "index.snapshot"))
+SNAPSHOT_VERSION = 1
+# File layout: MAGIC, format version, sections, JSON footer, footer length, MAGIC.
+# Vectors and text offsets are raw little-endian arrays aligned for memory mapping;
+# chunk texts (one column of UTF-8 text), ids, metadata and the parent passages of
+# the chunks are zlib-compressed.
+# The BM25 postings are raw arrays as well, with a compressed vocabulary.
+SNAPSHOT_MAGIC = b"SAHAYAKIDX"
+SECTION_ALIGN = 64
+_TRAILER = struct.Struct("<Q")
+# Raw BM25 sections and their on-disk types
+BM25_ARRAYS = {"bm25_term_offsets": "<i8", "bm25_postings_rows": "<i4", "bm25_postings_tf": "<u2",
+               "bm25_doc_lengths": "<i4"}
+# snapshot_usable verdicts by path: ((mtime, size, model), usable)
+_usable = {}
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_snapshot(collections, path=INDEX_SNAPSHOT, model_id=EMBEDDING_MODEL_ID, parents_path=PARENT_STORE_DB):
+    # Writes the chunks of the given Chroma collections, and the passages in
+    # `parents_path` they were cut from, to `path`; returns the chunk count
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = os.path.join(tmp, "index")
+        export_numpy_index(collections, index_dir)
+        index = NumpyBackend(index_dir)
+        vectors = np.ascontiguousarray(index.vectors, dtype="<f2")
+        sections = {
+            "vectors": vectors.tobytes(),
+            "offsets": np.ascontiguousarray(index.offsets, dtype="<i8").tobytes(),
+            "texts": zlib.compress(bytes(index.texts), 6),
+            "ids": zlib.compress(json.dumps(index.ids).encode("utf-8"), 6),
+            "metadatas": zlib.compress(json.dumps(index.metadatas(), ensure_ascii=False).encode("utf-8"), 6),
+        }
+        parent_ids = {meta.get("parent_id") for meta in index.metadatas() if meta and meta.get("parent_id")}
+        parents = ParentStore(parents_path).get(parent_ids) if parent_ids and os.path.exists(parents_path) else {}
+        sections["parents"] = zlib.compress(json.dumps(parents, ensure_ascii=False).encode("utf-8"), 6)
+        with open(os.path.join(index_dir, "bm25_vocab.json"), "rb") as f:
+            sections["bm25_vocab"] = zlib.compress(f.read(), 6)
+        for name, dtype in BM25_ARRAYS.items():
+            array = np.load(os.path.join(index_dir, f"{name}.npy"))
+            sections[name] = np.ascontiguousarray(array, dtype=dtype).tobytes()
+        count = len(index)
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        del index, vectors
+
+    footer = {
+        "version": SNAPSHOT_VERSION,
+        "model": model_id,
+        "count": count,
+        "dim": dim,
+        "created_at": time.time(),
+        "sections": {},
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + struct.pack("<I", SNAPSHOT_VERSION))
+        for name, data in sections.items():
+            f.write(b"\0" * (-f.tell() % SECTION_ALIGN))
+            footer["sections"][name] = {"offset": f.tell(), "length": len(data), "sha256": _digest(data)}
+            f.write(data)
+        encoded = json.dumps(footer).encode("utf-8")
+        f.write(encoded + _TRAILER.pack(len(encoded)) + SNAPSHOT_MAGIC)
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_footer(path=INDEX_SNAPSHOT):
+    # Reads only the footer; raises ValueError for a file that is not a snapshot of this version
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an index snapshot")
+        f.seek(-(_TRAILER.size + len(SNAPSHOT_MAGIC)), os.SEEK_END)
+        (length,) = _TRAILER.unpack(f.read(_TRAILER.size))
+        if f.read() != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is truncated")
+        f.seek(-(length + _TRAILER.size + len(SNAPSHOT_MAGIC)), os.SEEK_END)
+        footer = json.loads(f.read(length).decode("utf-8"))
+    if footer.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} has snapshot format {footer.get('version')}, expected {SNAPSHOT_VERSION}")
+    return footer
+
+
+def check_model(footer, model_id=EMBEDDING_MODEL_ID):
+    # Vectors from another embedding model would silently return unrelated passages
+    if footer["model"] != model_id:
+        raise ValueError(f"snapshot was embedded with {footer['model']}, this app uses {model_id}")
+
+
+def snapshot_usable(path=INDEX_SNAPSHOT, model_id=EMBEDDING_MODEL_ID):
+    # True when SnapshotBackend would open the file. The checksums are read in full, so
+    # the verdict is kept until the file's mtime or size changes.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    key = (stat.st_mtime_ns, stat.st_size, model_id)
+    cached = _usable.get(os.path.abspath(path))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    try:
+        verify_snapshot(path, model_id)
+        usable = True
+    except (OSError, ValueError, KeyError):
+        usable = False
+    _usable[os.path.abspath(path)] = (key, usable)
+    return usable
+
+
+def verify_snapshot(path=INDEX_SNAPSHOT, model_id=EMBEDDING_MODEL_ID):
+    # Checks the format, the embedding model and every section checksum; returns the footer
+    footer = read_footer(path)
+    check_model(footer, model_id)
+    with open(path, "rb") as f:
+        for name, section in footer["sections"].items():
+            f.seek(section["offset"])
+            digest = hashlib.sha256()
+            remaining = section["length"]
+            while remaining:
+                block = f.read(min(remaining, 1 << 20))
+                if not block:
+                    raise ValueError(f"{path} is truncated in section '{name}'")
+                digest.update(block)
+                remaining -= len(block)
+            if digest.hexdigest() != section["sha256"]:
+                raise ValueError(f"checksum mismatch in section '{name}' of {path}")
+    return footer
+
+
+class SnapshotBackend(NumpyBackend):
+    # NumpyBackend search over a snapshot file: vectors are memory-mapped read-only
+    # straight from the file, the compressed columns are inflated once at open
+    def __init__(self, path=INDEX_SNAPSHOT, model_id=EMBEDDING_MODEL_ID):
+        footer = verify_snapshot(path, model_id)
+        self.index_dir = None
+        self.path = path
+        self.model = footer["model"]
+        self.footer = footer
+        sections = footer["sections"]
+        count, dim = footer["count"], footer["dim"]
+        if count:
+            self.vectors = np.memmap(path, dtype="<f2", mode="r", offset=sections["vectors"]["offset"],
+                                     shape=(count, dim))
+        else:
+            self.vectors = np.empty((0, dim), dtype=np.float16)
+        self.offsets = np.frombuffer(self._section(sections["offsets"]), dtype="<i8")
+        self.texts = np.frombuffer(zlib.decompress(self._section(sections["texts"])), dtype=np.uint8)
+        self.ids = json.loads(zlib.decompress(self._section(sections["ids"])).decode("utf-8"))
+        self._metadata_section = sections["metadatas"]
+        self._metadatas = None
+        self._parents = None
+        self._topic_rows = {}
+
+    def _section(self, section):
+        with open(self.path, "rb") as f:
+            f.seek(section["offset"])
+            return f.read(section["length"])
+
+    def metadatas(self):
+        if self._metadatas is None:
+            self._metadatas = json.loads(zlib.decompress(self._section(self._metadata_section)).decode("utf-8"))
+        return self._metadatas
+
+    def parent_texts(self, parent_ids):
+        # Same as ParentStore.get; snapshots written before passages were stored apart have none
+        if self._parents is None:
+            section = self.footer["sections"].get("parents")
+            self._parents = json.loads(zlib.decompress(self._section(section)).decode("utf-8")) if section else {}
+        return {parent_id: self._parents[parent_id] for parent_id in parent_ids if parent_id in self._parents}
+
+    def lexical_index(self):
+        # BM25 index over the snapshot's rows with the postings memory-mapped from the
+        # file; raises KeyError for a snapshot written before keyword search existed
+        sections = self.footer["sections"]
+        vocab = json.loads(zlib.decompress(self._section(sections["bm25_vocab"])).decode("utf-8"))
+        arrays = {}
+        for name, dtype in BM25_ARRAYS.items():
+            section = sections[name]
+            count = section["length"] // np.dtype(dtype).itemsize
+            if count:
+                arrays[name] = np.memmap(self.path, dtype=dtype, mode="r", offset=section["offset"], shape=(count,))
+            else:
+                arrays[name] = np.empty(0, dtype=dtype)
+        return LexicalIndex(vocab, arrays["bm25_term_offsets"], arrays["bm25_postings_rows"],
+                            arrays["bm25_postings_tf"], arrays["bm25_doc_lengths"])
+
+
+def install_snapshot(source, path=INDEX_SNAPSHOT, model_id=EMBEDDING_MODEL_ID):
+    # Verifies `source` and copies it into place; the running file is swapped in one step
+    footer = verify_snapshot(source, model_id)
+    if os.path.abspath(source) == os.path.abspath(path):
+        return footer
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, path)
+    return footer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, verify and install prebuilt index snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write the Chroma store to a snapshot file")
+    export_parser.add_argument("--out", default=INDEX_SNAPSHOT)
+    import_parser = subparsers.add_parser("import", help="verify a snapshot and install it for the app")
+    import_parser.add_argument("path")
+    verify_parser = subparsers.add_parser("verify", help="check a snapshot's format, model and checksums")
+    verify_parser.add_argument("path", nargs="?", default=INDEX_SNAPSHOT)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            import backend
+
+            collections = backend.open_shards()
+            if not collections:
+                collection = backend.open_collection()
+                collections = [collection] if collection is not None else []
+            if not collections:
+                print("No vector store found; run vector_embedding.py first.")
+                return 1
+            count = write_snapshot(collections, args.out)
+            print(f"Wrote {count} chunks to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
+        elif args.command == "import":
+            footer = install_snapshot(args.path)
+            print(f"Installed {footer['count']} chunks embedded with {footer['model']} at {INDEX_SNAPSHOT}")
+        else:
+            footer = verify_snapshot(args.path)
+            print(f"{args.path}: {footer['count']} chunks, {footer['dim']} dimensions, model {footer['model']}, OK")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Snapshot error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+
+# Records a content hash per book and per chunk so re-runs only touch what changed.
+# Kept free of the PDF and embedding libraries so tools that only read it stay light.
+PERSIST_DIRECTORY = "data"
+MANIFEST_FILE = os.path.join(PERSIST_DIRECTORY, "ingest_manifest.json")
+# A book is ingested into a staging collection and renamed to its shard when complete
+STAGING_PREFIX = "staging-"
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalized_text_sha256(text):
+    # Case and whitespace differences should not produce a second vector
+    return text_sha256(" ".join(text.lower().split()))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if not os.path.exists(path):
+        return {"layout": "sharded", "books": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {path}: {e}")
+        return {"layout": "sharded", "books": {}}
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write to a temp file first so a crash never leaves a half-written manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def manifest_changes(manifest, current_hashes, book_topic, signature=None, unrecorded_signature=None):
+    # Returns (new or changed books, removed books). A book moved to another topic or split
+    # with other chunking settings is re-ingested; books recorded before the chunking
+    # settings were stored count as split with `unrecorded_signature`. Without a
+    # `signature` the chunking settings are not compared.
+    books = manifest["books"]
+    removed = [pdf for pdf in books if pdf not in current_hashes]
+    changed = [pdf for pdf, sha in current_hashes.items()
+               if books.get(pdf, {}).get("sha256") != sha
+               or books[pdf].get("topic") != book_topic(pdf)
+               or (signature is not None and books[pdf].get("chunking", unrecorded_signature) != signature)]
+    return changed, removed
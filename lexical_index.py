@@ -0,0 +1,117 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Words are runs of letters and digits; the Devanagari block is listed so vowel signs
+# and viramas, which are not alphanumeric, stay inside their word
+TOKEN_PATTERN = re.compile(r"[\w\u0900-\u0963\u0966-\u097f]+")
+
+
+def tokenize(text: str):
+    # Lowercased words; single letters are dropped, single digits (doses, months) kept
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 or token.isdigit()]
+
+
+def write_lexical_index(index_dir):
+    # Builds BM25 postings over the chunk texts of a NumPy index directory. Postings are
+    # grouped by term in CSR form: rows and term frequencies of term i sit at
+    # term_offsets[i]:term_offsets[i + 1] of the two postings arrays.
+    offsets = np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")
+    texts_path = os.path.join(index_dir, "texts.bin")
+    texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else b""
+    postings = {}
+    doc_lengths = np.zeros(len(offsets) - 1, dtype=np.int32)
+    for row in range(len(offsets) - 1):
+        text = bytes(texts[int(offsets[row]):int(offsets[row + 1])]).decode("utf-8")
+        counts = Counter(tokenize(text))
+        doc_lengths[row] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, tf))
+
+    vocab = sorted(postings)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for i, term in enumerate(vocab):
+        term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+    rows = np.empty(term_offsets[-1], dtype=np.int32)
+    tfs = np.empty(term_offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(vocab):
+        entries = np.asarray(postings[term], dtype=np.int64).reshape(-1, 2)
+        rows[term_offsets[i]:term_offsets[i + 1]] = entries[:, 0]
+        tfs[term_offsets[i]:term_offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+
+    with open(os.path.join(index_dir, "bm25_vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    np.save(os.path.join(index_dir, "bm25_term_offsets.npy"), term_offsets)
+    np.save(os.path.join(index_dir, "bm25_postings_rows.npy"), rows)
+    np.save(os.path.join(index_dir, "bm25_postings_tf.npy"), tfs)
+    np.save(os.path.join(index_dir, "bm25_doc_lengths.npy"), doc_lengths)
+    return len(vocab)
+
+
+def open_lexical_index(index_dir):
+    # Memory-maps the postings of a NumPy index directory; raises OSError when it has none
+    with open(os.path.join(index_dir, "bm25_vocab.json"), "r", encoding="utf-8") as f:
+        vocab = json.load(f)
+    return LexicalIndex(
+        vocab,
+        np.load(os.path.join(index_dir, "bm25_term_offsets.npy"), mmap_mode="r"),
+        np.load(os.path.join(index_dir, "bm25_postings_rows.npy"), mmap_mode="r"),
+        np.load(os.path.join(index_dir, "bm25_postings_tf.npy"), mmap_mode="r"),
+        np.load(os.path.join(index_dir, "bm25_doc_lengths.npy")),
+    )
+
+
+class LexicalIndex:
+    # BM25 search over the postings written by write_lexical_index. Only the vocabulary
+    # and document lengths are held in memory; postings may be memory-mapped. Returns
+    # rows of the NumPy index, so callers look texts and vectors up there.
+    def __init__(self, vocab, term_offsets, rows, tfs, doc_lengths, k1=BM25_K1, b=BM25_B):
+        self.terms = {term: i for i, term in enumerate(vocab)}
+        self.term_offsets = term_offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_lengths = np.asarray(doc_lengths)
+        self.k1 = k1
+        self.b = b
+        self.average_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        # Per-row part of the BM25 denominator, fixed for the life of the index
+        self._norm = k1 * (1 - b + b * self.doc_lengths / max(self.average_length, 1e-9))
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def scores(self, query: str):
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.terms.get(term)
+            if i is None:
+                continue
+            start, end = int(self.term_offsets[i]), int(self.term_offsets[i + 1])
+            rows = np.asarray(self.rows[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[rows])
+        return scores
+
+    def search(self, queries: list, top_k: int, allowed=None):
+        # Returns, per query, (rows, scores) of the best matches with a positive score.
+        # `allowed` is an optional boolean row mask, e.g. of a topic filter.
+        results = []
+        for query in queries:
+            scores = self.scores(query)
+            if allowed is not None:
+                scores[~allowed] = 0.0
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) > top_k:
+                matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+            order = matched[np.argsort(-scores[matched], kind="stable")]
+            results.append((order, scores[order]))
+        return results
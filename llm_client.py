@@ -0,0 +1,284 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import current_trace, trace_logger
+
+# Seconds an answer may take to start, per tab; Urgent Help gets the tighter budget
+LLM_DEADLINES = {
+    "learning": float(os.getenv("LLM_DEADLINE_LEARNING", "30")),
+    "urgent": float(os.getenv("LLM_DEADLINE_URGENT", "10")),
+}
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Retry delays are drawn uniformly from [0, base * 2^attempt], capped at LLM_RETRY_MAX_SECONDS
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.25"))
+LLM_RETRY_MAX_SECONDS = 2.0
+# Send a second, identical request when the first has not answered after this long; unset disables hedging
+LLM_HEDGE_AFTER_MS = os.getenv("LLM_HEDGE_AFTER_MS")
+# Consecutive failed calls that open the circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Keep-alive connection pool shared by every session in the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+# Most Cerebras calls in flight at once across the process; a hedged call counts once
+CEREBRAS_CONCURRENCY = int(os.getenv("CEREBRAS_CONCURRENCY", "8"))
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMUnavailable(LLMError):
+    # The circuit is open, so the API was not called at all
+    pass
+
+
+class LLMDeadlineExceeded(LLMError):
+    pass
+
+
+def is_retryable(error):
+    # Only reached after a call failed, so the SDK is already loaded
+    from cerebras.cloud.sdk import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    # Timeouts and dropped connections
+    return isinstance(error, APIConnectionError)
+
+
+def _flag(name, value):
+    trace = current_trace()
+    if trace is not None:
+        trace.flag(name, value)
+
+
+def _log(event, **fields):
+    # One JSON line on the trace log, like the request traces
+    trace_logger.warning(json.dumps({"event": event, "ts": time.time(), **fields}, ensure_ascii=False))
+
+
+class CircuitBreaker:
+    # closed: calls go through; open: calls fail fast until reset_seconds pass;
+    # half_open: one trial call decides whether to close or open again
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                    _log("llm_breaker_open", failures=self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class _OpenStream:
+    # A streaming completion whose first chunk has already arrived, so hedged
+    # attempts race on time to first token
+    def __init__(self, stream):
+        self.stream = stream
+        self._chunks = iter(stream)
+        self.first = next(self._chunks, None)
+
+    def chunks(self):
+        if self.first is not None:
+            yield self.first
+        yield from self._chunks
+
+    def close(self):
+        close = getattr(self.stream, "close", None)
+        if close:
+            close()
+
+
+def _discard(future):
+    # Closes the result of a hedged attempt that lost the race
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), "close", None)
+        if close:
+            close()
+
+
+class LLMClient:
+    # Wraps the Cerebras client with per-tab deadlines, jittered retries, optional
+    # hedging and a circuit breaker. Errors are raised, never returned as text.
+    def __init__(self, client, model, deadlines=None, max_retries=LLM_MAX_RETRIES,
+                 hedge_after_ms=LLM_HEDGE_AFTER_MS, breaker=None, concurrency=CEREBRAS_CONCURRENCY):
+        self.client = client
+        self.model = model
+        self.deadlines = deadlines or LLM_DEADLINES
+        self.max_retries = max_retries
+        self.hedge_after = float(hedge_after_ms) / 1000.0 if hedge_after_ms else None
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+        self.hedges = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=2 * LLM_MAX_CONNECTIONS) if self.hedge_after else None
+
+    def deadline(self, tab):
+        return self.deadlines.get(tab, self.deadlines["learning"])
+
+    def _create(self, messages, timeout):
+        return self.client.chat.completions.create(messages=messages, model=self.model, timeout=timeout)
+
+    def _open_stream(self, messages, timeout):
+        return _OpenStream(self.client.chat.completions.create(
+            messages=messages, model=self.model, stream=True, timeout=timeout
+        ))
+
+    def _hedged(self, call, messages, timeout):
+        if not self.hedge_after or timeout <= self.hedge_after:
+            return call(messages, timeout)
+        end = time.monotonic() + timeout
+        pending = {self._hedge_pool.submit(call, messages, timeout)}
+        done, _ = wait(pending, timeout=self.hedge_after)
+        if not done:
+            self.hedges += 1
+            _flag("llm_hedged", True)
+            pending.add(self._hedge_pool.submit(call, messages, end - time.monotonic()))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.add_done_callback(_discard)
+                    return future.result()
+                error = future.exception()
+        for loser in pending:
+            loser.add_done_callback(_discard)
+        raise error or LLMDeadlineExceeded(f"no answer within {timeout:.1f}s")
+
+    def _with_retries(self, call, messages, tab):
+        deadline_at = time.monotonic() + self.deadline(tab)
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise LLMDeadlineExceeded(f"no answer within the {tab} deadline of {self.deadline(tab):.0f}s")
+            try:
+                return self._hedged(call, messages, remaining)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries or not is_retryable(e):
+                    raise
+                # Full jitter keeps retries from many sessions from arriving together
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+                if time.monotonic() + delay >= deadline_at:
+                    raise
+                self.retries += 1
+                _flag("llm_retried", True)
+                _log("llm_retry", attempt=attempt, delay_s=round(delay, 3), error=str(e))
+                time.sleep(delay)
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            _flag("llm_breaker", "open")
+            raise LLMUnavailable("circuit breaker is open")
+
+    def _acquire_slot(self, tab):
+        # Waits up to the tab deadline for one of the CEREBRAS_CONCURRENCY slots
+        start = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.deadline(tab))
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span("llm_queue", time.perf_counter() - start)
+        if not acquired:
+            self.rejected += 1
+            _flag("llm_queue", "full")
+            raise LLMUnavailable("too many Cerebras calls in flight")
+
+    def _start(self, tab):
+        # The slot is taken before asking the breaker, so a half-open trial call that the
+        # breaker lets through is always made and always records its outcome
+        self._acquire_slot(tab)
+        try:
+            self._check_breaker()
+        except LLMUnavailable:
+            self._slots.release()
+            raise
+
+    def complete(self, messages, tab="learning"):
+        # Returns the completion object
+        self._start(tab)
+        try:
+            completion = self._with_retries(self._create, messages, tab)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self._slots.release()
+        self.breaker.record_success()
+        return completion
+
+    def stream(self, messages, tab="learning"):
+        # Yields completion chunks. The deadline, retries and hedging cover the wait
+        # for the first chunk only, so text already shown is never repeated.
+        # The slot is held until the last chunk has been read
+        self._start(tab)
+        try:
+            opened = self._with_retries(self._open_stream, messages, tab)
+        except Exception:
+            self._slots.release()
+            self.breaker.record_failure()
+            raise
+        try:
+            yield from opened.chunks()
+        except GeneratorExit:
+            # The reader stopped early; the API itself was fine
+            self.breaker.record_success()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            opened.close()
+            self._slots.release()
+
+
+def create_llm_client(api_key, model, base_url=None, **options):
+    # SDK retries are off because LLMClient retries within the tab deadline
+    import httpx
+    from cerebras.cloud.sdk import Cerebras
+
+    http_client = httpx.Client(limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+    ))
+    client = Cerebras(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client)
+    return LLMClient(client, model, **options)
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmark import GOLD_QUESTIONS_FILE, RESULTS_DIR, git_commit, load_gold_questions, summarize
+from fake_cerebras import FakeCerebrasConfig, FakeCerebrasServer
+
+# Concurrent-user load test of app.py. Each simulated ASHA worker is a Streamlit
+# AppTest session in this process, so sessions share the models, the vector store and
+# the caches exactly as the sessions of one app instance do; Cerebras is replaced by
+# the local fake server. Concurrency steps up level by level until throughput stops
+# growing or the p95 latency goes over budget:
+#   python loadtest.py --users 1,2,4,8,16 --llm-latency-ms 800
+# Results are written like benchmark.py results, so `benchmark.py compare` works on them.
+
+APP_SCRIPT = "app.py"
+# A level whose throughput is less than this much above the previous one is saturated
+SATURATION_GAIN = 0.10
+# Widgets in app.py's page order: the Learning form comes before the Urgent Help form
+FORM_INDEX = {"learning": 0, "urgent": 1}
+
+
+def rss_bytes():
+    # Resident memory of this process; None where /proc is not available
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Session:
+    # One user with their own session state: opens the page, then submits questions
+    # from the mix with a pause between them
+    def __init__(self, questions, urgent_share, think_ms, timeout, seed):
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(APP_SCRIPT, default_timeout=timeout)
+        self.questions = questions
+        self.urgent_share = urgent_share
+        self.think_ms = think_ms
+        self.random = random.Random(seed)
+
+    def open(self):
+        start = time.perf_counter()
+        self.app.run()
+        return time.perf_counter() - start
+
+    def ask(self):
+        # Returns (tab, seconds, ok) for one form submission
+        question = self.random.choice(self.questions)
+        tab = "urgent" if self.random.random() < self.urgent_share else "learning"
+        if self.app.session_state.language != question["language"]:
+            self.app.selectbox[0].set_value(question["language"]).run()
+        self.app.text_input[FORM_INDEX[tab]].input(question["question"])
+        self.app.button[FORM_INDEX[tab]].click()
+        start = time.perf_counter()
+        try:
+            self.app.run()
+        except RuntimeError:
+            # AppTest raises when the script does not finish within the timeout
+            return tab, time.perf_counter() - start, False
+        return tab, time.perf_counter() - start, not self.app.exception
+
+
+def run_level(users, questions, args):
+    # Runs `users` sessions at once, each asking args.questions_per_user questions
+    sessions = [Session(questions, args.urgent_share, args.think_ms, args.timeout, seed=users * 1000 + i)
+                for i in range(users)]
+    rss_before = rss_bytes()
+    answers = {"learning": [], "urgent": []}
+    page_loads = []
+    failures = 0
+    lock = threading.Lock()
+    start_gate = threading.Barrier(users)
+
+    def drive(session):
+        nonlocal failures
+        try:
+            page_load = session.open()
+        except Exception:
+            # Releases the sessions already waiting for this one
+            start_gate.abort()
+            raise
+        start_gate.wait()
+        results = []
+        for i in range(args.questions_per_user):
+            if i and session.think_ms:
+                time.sleep(session.think_ms / 1000.0)
+            results.append(session.ask())
+        with lock:
+            page_loads.append(page_load)
+            for tab, seconds, ok in results:
+                if ok:
+                    answers[tab].append(seconds)
+                else:
+                    failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix="load-session") as pool:
+        for future in [pool.submit(drive, session) for session in sessions]:
+            future.result()
+    seconds = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    completed = len(answers["learning"]) + len(answers["urgent"])
+    result = {
+        "users": users,
+        "seconds": seconds,
+        "answers": completed,
+        "failures": failures,
+        "throughput_per_sec": completed / seconds if seconds else 0.0,
+        "answer": summarize(answers["learning"] + answers["urgent"]),
+        "learning": summarize(answers["learning"]),
+        "urgent": summarize(answers["urgent"]),
+        "page_load": summarize(page_loads),
+    }
+    if rss_before is not None and rss_after is not None:
+        result["rss_mb"] = rss_after / 1e6
+        result["memory_per_session_mb"] = max(0, rss_after - rss_before) / 1e6 / users
+    del sessions
+    return result
+
+
+def saturation_point(levels, max_p95_ms):
+    # The highest concurrency before throughput flattens or p95 goes over budget
+    best = None
+    for previous, level in zip([None] + levels, levels):
+        over_budget = max_p95_ms and level["answer"].get("p95_ms", 0.0) > max_p95_ms
+        flat = previous is not None and (
+            level["throughput_per_sec"] < previous["throughput_per_sec"] * (1 + SATURATION_GAIN))
+        if over_budget or flat:
+            return best, level["users"]
+        best = level["users"]
+    return best, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-user load test of the Streamlit app")
+    parser.add_argument("--users", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--questions-per-user", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=1000.0, help="pause between a user's questions")
+    parser.add_argument("--urgent-share", type=float, default=0.3, help="fraction submitted as Urgent Help")
+    parser.add_argument("--gold", default=GOLD_QUESTIONS_FILE, help="question mix (English and Hindi)")
+    parser.add_argument("--language", choices=["en", "hi"], help="only questions in this language")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="fake Cerebras time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=15.0, help="fake Cerebras delay per token")
+    parser.add_argument("--max-p95-ms", type=float, default=0.0, help="latency budget; 0 uses throughput only")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds one script run may take")
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="use data/answer_cache.sqlite3 and the per-user rate limit as configured")
+    parser.add_argument("--online", action="store_true", help="allow model downloads from the Hugging Face Hub")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<time>-load.json)")
+    args = parser.parse_args()
+
+    levels = [int(users) for users in args.users.split(",") if users.strip()]
+    questions = load_gold_questions(args.gold, args.language)
+    if not levels or not questions:
+        parser.error("need at least one concurrency level and one question")
+
+    if not args.online:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    scratch = tempfile.TemporaryDirectory()
+    if not args.keep_caches:
+        # Fake answers must not be cached for real users, and every simulated user
+        # would otherwise be throttled after a few questions
+        os.environ["ANSWER_CACHE_DB"] = os.path.join(scratch.name, "answer_cache.sqlite3")
+        os.environ["USER_RATE_LIMIT_PER_MINUTE"] = "0"
+    os.environ.pop("SAHAYAK_API_URL", None)
+
+    config = FakeCerebrasConfig(latency_ms=args.llm_latency_ms, token_ms=args.llm_token_ms, seed=0)
+    # Keyed by concurrency, since `benchmark.py compare` only walks dicts
+    results = {"levels": {}}
+    with FakeCerebrasServer(config) as server:
+        # Read when the app first imports backend, which happens in the warm-up session
+        os.environ["CEREBRAS_BASE_URL"] = server.base_url
+        os.environ.setdefault("CEREBRAS_API_KEY", "load-test")
+        warm_up = Session(questions, args.urgent_share, 0.0, args.timeout, seed=0)
+        results["cold_start_seconds"] = warm_up.open()
+        # The models and the vector store load on background threads; one question
+        # waits for them so the first level does not measure start-up
+        warm_up.ask()
+        del warm_up
+        rss = rss_bytes()
+        if rss is not None:
+            results["warm_rss_mb"] = rss / 1e6
+        for users in levels:
+            print(f"Running {users} concurrent sessions...")
+            level = run_level(users, questions, args)
+            results["levels"][f"{users}_users"] = level
+            print(f"{users} users: {level['throughput_per_sec']:.2f} answers/s "
+                  f"p50={level['answer'].get('p50_ms', 0.0):.0f}ms p95={level['answer'].get('p95_ms', 0.0):.0f}ms "
+                  f"failures={level['failures']} memory/session={level.get('memory_per_session_mb', 0.0):.1f}MB")
+        results["llm_requests"] = config.requests
+    scratch.cleanup()
+
+    measured = list(results["levels"].values())
+    results["saturation_users"], results["saturated_at"] = saturation_point(measured, args.max_p95_ms)
+    results["max_throughput_per_sec"] = max(level["throughput_per_sec"] for level in measured)
+    if results["saturated_at"] is None:
+        print(f"No saturation up to {levels[-1]} users; add higher levels to find it")
+    else:
+        print(f"Saturation: {results['saturation_users']} users; throughput flattens or p95 is over budget "
+              f"at {results['saturated_at']}")
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_token_ms": args.llm_token_ms,
+            "questions_per_user": args.questions_per_user,
+            "think_ms": args.think_ms,
+            "urgent_share": args.urgent_share,
+            "gold_questions": args.gold,
+            "language": args.language,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": {"load": results},
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-load.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latest samples kept per stage/tab/language for the percentile estimates
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+# When set, the Streamlit process serves /metrics on this port
+METRICS_PORT = os.getenv("METRICS_PORT")
+QUANTILES = (0.5, 0.95, 0.99)
+
+trace_logger = logging.getLogger("sahayak.trace")
+if not trace_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+_current_trace = contextvars.ContextVar("sahayak_trace", default=None)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestTrace:
+    # Spans of one question: stage name -> seconds, plus flags such as cache hits
+    # and values such as prompt size, which are only logged
+    def __init__(self, tracer, tab, language):
+        self.tracer = tracer
+        self.tab = tab
+        self.language = language
+        self.spans = {}
+        self.flags = {}
+        self.values = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(stage, time.perf_counter() - start)
+
+    def add_span(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def flag(self, name, value):
+        self.flags[name] = value
+
+    def value(self, name, value):
+        self.values[name] = value
+
+    def finish(self):
+        self.add_span("total", time.perf_counter() - self.start)
+        self.tracer.record_trace(self)
+
+
+class Tracer:
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._sums = defaultdict(float)
+        self._flags = defaultdict(int)
+
+    @contextmanager
+    def request(self, tab, language):
+        # Makes the trace current so helpers deeper in the call stack can add spans
+        trace = RequestTrace(self, tab, language)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace.finish()
+
+    def record_span(self, stage, seconds, tab="-", language="-"):
+        key = (stage, tab, language)
+        with self._lock:
+            self._samples[key].append(seconds)
+            self._counts[key] += 1
+            self._sums[key] += seconds
+
+    def record_trace(self, trace):
+        for stage, seconds in trace.spans.items():
+            self.record_span(stage, seconds, trace.tab, trace.language)
+        with self._lock:
+            for name, value in trace.flags.items():
+                self._flags[(name, str(value), trace.tab, trace.language)] += 1
+        trace_logger.info(json.dumps({
+            "event": "request",
+            "ts": time.time(),
+            "tab": trace.tab,
+            "language": trace.language,
+            "flags": trace.flags,
+            "values": trace.values,
+            "spans_ms": {stage: round(seconds * 1000, 2) for stage, seconds in trace.spans.items()},
+        }, ensure_ascii=False))
+
+    def summary(self):
+        # {"stage/tab/language": {"count", "sum", "p50", "p95", "p99"}}
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._samples.items()}
+            counts, sums = dict(self._counts), dict(self._sums)
+            flags = dict(self._flags)
+        stages = {}
+        for key, values in snapshot.items():
+            entry = {"count": counts[key], "sum": sums[key]}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = _percentile(values, q)
+            stages["/".join(key)] = entry
+        return {
+            "stages": stages,
+            "flags": {"/".join(key): count for key, count in flags.items()},
+        }
+
+    def prometheus(self):
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._samples.items()}
+            counts, sums = dict(self._counts), dict(self._sums)
+            flags = dict(self._flags)
+        lines = [
+            "# HELP sahayak_stage_latency_seconds Latency of each request stage.",
+            "# TYPE sahayak_stage_latency_seconds summary",
+        ]
+        for (stage, tab, language), values in sorted(snapshot.items()):
+            labels = f'stage="{_escape(stage)}",tab="{_escape(tab)}",language="{_escape(language)}"'
+            for q in QUANTILES:
+                lines.append(f'sahayak_stage_latency_seconds{{{labels},quantile="{q}"}} {_percentile(values, q):.6f}')
+            lines.append(f"sahayak_stage_latency_seconds_sum{{{labels}}} {sums[(stage, tab, language)]:.6f}")
+            lines.append(f"sahayak_stage_latency_seconds_count{{{labels}}} {counts[(stage, tab, language)]}")
+        lines += [
+            "# HELP sahayak_request_flags_total Requests by flag value, e.g. cache hits and misses.",
+            "# TYPE sahayak_request_flags_total counter",
+        ]
+        for (name, value, tab, language), count in sorted(flags.items()):
+            lines.append(
+                f'sahayak_request_flags_total{{flag="{_escape(name)}",value="{_escape(value)}",'
+                f'tab="{_escape(tab)}",language="{_escape(language)}"}} {count}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+TRACER = Tracer()
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage):
+    # Adds a span to the current request trace, if there is one
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+@contextmanager
+def timed(stage):
+    # Records a span that does not belong to a request, such as a cold start
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        TRACER.record_span(stage, seconds)
+        trace_logger.info(json.dumps({"event": "span", "ts": time.time(), "stage": stage,
+                                      "ms": round(seconds * 1000, 2)}))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(TRACER.summary()).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = TRACER.prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    # Serves /metrics (Prometheus text) and /metrics.json from a daemon thread
+    server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import threading
+
+# Passages the token-sized chunks were cut from. Each is stored once, keyed by its
+# parent_id, instead of in the metadata of every chunk cut from it.
+PARENT_STORE_DB = os.path.join("data", "parents.sqlite3")
+# Ids per SQL statement, below SQLite's bound parameter limit
+LOOKUP_BATCH = 500
+
+
+class ParentStore:
+    def __init__(self, path=PARENT_STORE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS parents (id TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        self._conn.commit()
+
+    def put(self, parents: dict):
+        # parent_id -> passage text; the id is a content hash, so an existing row is kept
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO parents (id, text) VALUES (?, ?)", parents.items())
+            self._conn.commit()
+
+    def get(self, parent_ids):
+        # parent_id -> passage text for the ids that are stored
+        parent_ids = list(dict.fromkeys(parent_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(parent_ids), LOOKUP_BATCH):
+                batch = parent_ids[start:start + LOOKUP_BATCH]
+                found.update(self._conn.execute(
+                    f"SELECT id, text FROM parents WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return found
+
+    def prune(self, keep_ids):
+        # Deletes the passages of chunks no longer in the index; returns how many
+        keep_ids = set(keep_ids)
+        with self._lock:
+            stale = [(row[0],) for row in self._conn.execute("SELECT id FROM parents") if row[0] not in keep_ids]
+            self._conn.executemany("DELETE FROM parents WHERE id = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+
+def attach_parents(hits, lookup):
+    # Fills "parent" into the metadata of hits that name a parent_id, for build_context;
+    # `lookup` maps a list of ids to {id: text}. Hits of stores built when every chunk
+    # carried its passage are returned as they are.
+    wanted = {hit["metadata"].get("parent_id") for query_hits in hits for hit in query_hits
+              if hit["metadata"].get("parent_id") and not hit["metadata"].get("parent")}
+    if not wanted or lookup is None:
+        return hits
+    parents = lookup(sorted(wanted))
+    return [
+        [{**hit, "metadata": {**hit["metadata"], "parent": parents[hit["metadata"]["parent_id"]]}}
+         if hit["metadata"].get("parent_id") in parents and not hit["metadata"].get("parent") else hit
+         for hit in query_hits]
+        for query_hits in hits
+    ]
@@ -0,0 +1,154 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Questions a user may send to Cerebras per minute; answers from the fast path
+# or the answer cache do not count. 0 disables the limit.
+USER_RATE_LIMIT_PER_MINUTE = float(os.getenv("USER_RATE_LIMIT_PER_MINUTE", "10"))
+# Questions a user may send at once before the per-minute rate applies
+USER_RATE_LIMIT_BURST = int(os.getenv("USER_RATE_LIMIT_BURST", "5"))
+# Users whose buckets are remembered; the least recently seen are forgotten first
+RATE_LIMIT_MAX_USERS = 10000
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _SharedStream:
+    # Chunks of one generator, read by every caller from the start at its own pace
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.result = None
+        self.changed = threading.Condition()
+
+    def read(self):
+        index = 0
+        while True:
+            with self.changed:
+                while index >= len(self.chunks) and not self.finished:
+                    self.changed.wait()
+                if index >= len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                chunk = self.chunks[index]
+            index += 1
+            yield chunk
+
+
+class SingleFlight:
+    # Process-wide coalescing: a call whose key is already in flight waits for that
+    # call instead of repeating the work, and every waiter gets the same result.
+    # Results are not kept once the call finishes; caching is left to the callers.
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args):
+        # Returns (result, shared); shared is True when another caller did the work
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stream(self, key, start):
+        # Returns (chunks, state, shared). `start(state)` is called once per key in flight
+        # and must return a generator; it runs on its own thread so a reader that stops
+        # early never stalls the others. `state` is a dict the generator may fill in,
+        # complete once `chunks` is exhausted.
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = _SharedStream()
+                shared.result = {}
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if leader:
+            # The generator runs in the leader's context, so its request trace sees the call
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._drive, key, shared, start), daemon=True).start()
+        return shared.read(), shared.result, not leader
+
+    def _drive(self, key, shared, start):
+        try:
+            for chunk in start(shared.result):
+                with shared.changed:
+                    shared.chunks.append(chunk)
+                    shared.changed.notify_all()
+        except Exception as e:
+            shared.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with shared.changed:
+                shared.finished = True
+                shared.changed.notify_all()
+
+
+class RateLimiter:
+    # Token bucket per user: `burst` questions at once, refilled at `per_minute`
+    def __init__(self, per_minute=USER_RATE_LIMIT_PER_MINUTE, burst=USER_RATE_LIMIT_BURST,
+                 max_users=RATE_LIMIT_MAX_USERS):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_users = max_users
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, user):
+        # Returns 0.0 and takes a token when the user may go ahead, otherwise
+        # the seconds until a token is available
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(user, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+                self.limited += 1
+            self._buckets[user] = (tokens, now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Shared by every session of the Streamlit app or every request of the API server
+FLIGHTS = SingleFlight()
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,135 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# Startup profiling mode: runs the app's startup path in a fresh interpreter with
+# -X importtime and reports where the cold start goes, per phase and per package.
+#   python startup_profile.py
+#   python startup_profile.py --max-shell-seconds 3   # exit 1 when the UI shell is slower
+
+APP_SCRIPT = "app.py"
+
+# Timed in order in the child process. "shell" is everything app.py imports before
+# the page renders, passed in as arguments; the later phases run on background
+# threads in the app.
+CHILD = r"""
+import importlib, json, sys, time
+phases = {}
+start = time.perf_counter()
+import streamlit
+phases["streamlit"] = time.perf_counter() - start
+
+t = time.perf_counter()
+for name in (arg for arg in sys.argv[1:] if not arg.startswith("--")):
+    importlib.import_module(name)
+import backend
+phases["shell"] = time.perf_counter() - t
+
+if "--shell-only" not in sys.argv:
+    t = time.perf_counter()
+    client, embedder = backend.load_models()
+    phases["load_models"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    backend.open_vector_store()
+    phases["open_vector_store"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    if embedder is not None:
+        embedder.encode(["warm up"])
+    phases["first_query_embedding"] = time.perf_counter() - t
+print("PHASES " + json.dumps(phases))
+"""
+
+
+def app_modules(path=APP_SCRIPT):
+    # This repository's modules that app.py imports, in the order it imports them, so
+    # the shell phase follows the app without keeping a list by hand
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    root = os.path.dirname(os.path.abspath(path))
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            if os.path.exists(os.path.join(root, name.split(".")[0] + ".py")) and name not in modules:
+                modules.append(name)
+    return modules
+
+
+def parse_importtime(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, values = line.split(":", 1)
+        self_us, cumulative_us, name = values.split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(self_us) / 1000.0,
+            "cumulative_ms": int(cumulative_us) / 1000.0,
+        })
+    return modules
+
+
+def by_package(modules):
+    totals = defaultdict(float)
+    for module in modules:
+        totals[module["module"].split(".")[0]] += module["self_ms"]
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile Sahayak startup imports and initialization")
+    parser.add_argument("--shell-only", action="store_true", help="only profile the imports before the UI renders")
+    parser.add_argument("--top", type=int, default=15, help="packages and modules to list")
+    parser.add_argument("--json", help="also write the full profile to this file")
+    parser.add_argument("--max-shell-seconds", type=float, help="fail when the shell imports take longer")
+    args = parser.parse_args()
+
+    child_args = ["--shell-only"] if args.shell_only else []
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, *child_args, *app_modules()],
+                            capture_output=True, text=True)
+    phase_lines = [line for line in result.stdout.splitlines() if line.startswith("PHASES ")]
+    if result.returncode != 0 or not phase_lines:
+        print(result.stdout)
+        print("\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:")))
+        return result.returncode or 1
+    phases = json.loads(phase_lines[-1][len("PHASES "):])
+    modules = parse_importtime(result.stderr)
+    packages = by_package(modules)
+
+    print("Phase                     seconds")
+    for phase, seconds in phases.items():
+        print(f"{phase:<25} {seconds:8.3f}")
+    print(f"\nImport time by package (self time, top {args.top})")
+    for package, ms in list(packages.items())[:args.top]:
+        print(f"{package:<35} {ms:9.1f} ms")
+    print(f"\nSlowest top-level imports (cumulative, top {args.top})")
+    top_level = sorted((m for m in modules if m["depth"] == 0), key=lambda m: -m["cumulative_ms"])
+    for module in top_level[:args.top]:
+        print(f"{module['module']:<35} {module['cumulative_ms']:9.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"phases": phases, "packages": packages, "modules": modules}, f, indent=2)
+
+    if args.max_shell_seconds is not None and phases["shell"] > args.max_shell_seconds:
+        print(f"\nShell imports took {phases['shell']:.2f}s, over the {args.max_shell_seconds:.2f}s budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
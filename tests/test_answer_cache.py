@@ -0,0 +1,110 @@
+import types
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache
+
+
+def test_text_entries_are_found_by_text_and_skipped_by_vector_lookup(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+    cache.put("en:learning", "how much ors for a child?", None, "Half a cup after each stool.", ["ORS doc"])
+
+    assert cache.lookup_text("en:learning", "how much ors for a child?") == (
+        "Half a cup after each stool.", ["ORS doc"], 1.0)
+    assert cache.lookup_text("hi:learning", "how much ors for a child?") is None
+    assert cache.lookup("en:learning", np.ones(4)) is None
+
+    cache.put("en:learning", "When is OPV-0 given?", np.ones(4), "At birth.", [])
+    assert cache.lookup("en:learning", np.ones(4))[0] == "At birth."
+    assert cache.stats()["en:learning"]["hits"] == 2
+
+
+def test_clear_drops_every_answer(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+    cache.put("en:learning", "When is OPV-0 given?", np.ones(4), "At birth.", [])
+    cache.put("hi:urgent", "when is opv-0 given?", None, "जन्म के समय।", [])
+
+    assert cache.clear() == 2
+    assert cache.lookup("en:learning", np.ones(4)) is None
+    assert cache.lookup_text("hi:urgent", "when is opv-0 given?") is None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(answer_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_a_similar_question_reuses_the_answer_above_the_threshold(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"), threshold=0.9)
+    cache.put("en:learning", "How much ORS for a child?", unit(1, 0, 0), "Half a cup after each stool.", ["ORS"])
+
+    answer, docs, similarity = cache.lookup("en:learning", unit(0.95, np.sqrt(1 - 0.95 ** 2), 0))
+    assert (answer, docs) == ("Half a cup after each stool.", ["ORS"])
+    assert similarity == pytest.approx(0.95, abs=1e-5)
+    assert cache.lookup("en:learning", unit(0.85, np.sqrt(1 - 0.85 ** 2), 0)) is None
+    # Vectors are normalized, so the scale of the query does not matter
+    assert cache.lookup("en:learning", 10 * unit(1, 0, 0))[0] == "Half a cup after each stool."
+    assert cache.stats()["en:learning"] == {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "entries": 1}
+
+
+def test_namespaces_keep_languages_tabs_and_topics_apart(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+    vector = unit(1, 1, 0)
+    cache.put("en:learning", "When is OPV-0 given?", vector, "At birth.", [])
+    cache.put("en:learning:maternal_child_health", "When is OPV-0 given?", vector, "At birth, with BCG.", [])
+
+    assert cache.lookup("en:learning", vector)[0] == "At birth."
+    assert cache.lookup("en:learning:maternal_child_health", vector)[0] == "At birth, with BCG."
+    assert cache.lookup("hi:learning", vector) is None
+    assert cache.lookup("en:urgent", vector) is None
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"), ttl=3600)
+    cache.put("en:learning", "When is OPV-0 given?", unit(1, 0), "At birth.", [])
+    cache.put("en:learning", "when is opv-0 given?", None, "At birth.", [])
+    clock[0] += 3599
+    assert cache.lookup("en:learning", unit(1, 0)) is not None
+    assert cache.lookup_text("en:learning", "when is opv-0 given?") is not None
+    clock[0] += 2
+    assert cache.lookup("en:learning", unit(1, 0)) is None
+    assert cache.lookup_text("en:learning", "when is opv-0 given?") is None
+
+    # Expired rows are deleted on the next write to the namespace
+    cache.put("en:learning", "What is ORS?", unit(0, 1), "Oral rehydration salts.", [])
+    assert cache.stats()["en:learning"]["entries"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_per_namespace(tmp_path, clock):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"), max_entries=2)
+    for i, question in enumerate(["q0", "q1"]):
+        clock[0] += 1
+        cache.put("en:learning", question, np.eye(3)[i], question.upper(), [])
+    cache.put("hi:learning", "q0", np.eye(3)[0], "Q0", [])
+    clock[0] += 1
+    assert cache.lookup("en:learning", np.eye(3)[0])[0] == "Q0"  # q0 is now the most recently used
+    clock[0] += 1
+    cache.put("en:learning", "q2", np.eye(3)[2], "Q2", [])
+
+    assert cache.lookup("en:learning", np.eye(3)[1]) is None
+    assert cache.lookup("en:learning", np.eye(3)[0])[0] == "Q0"
+    assert cache.lookup("en:learning", np.eye(3)[2])[0] == "Q2"
+    assert cache.lookup("hi:learning", np.eye(3)[0])[0] == "Q0"
+
+
+def test_text_lookup_needs_the_same_question_text(tmp_path, clock):
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+    cache.put("en:learning", "what is ors?", None, "Old answer.", [])
+    clock[0] += 1
+    cache.put("en:learning", "what is ors?", None, "Newer answer.", [])
+    assert cache.lookup_text("en:learning", "what is ors?")[0] == "Newer answer."
+    assert cache.lookup_text("en:learning", "what is ors") is None
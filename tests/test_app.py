@@ -0,0 +1,128 @@
+import os
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import answer_cache
+import backend
+import fast_path
+import index_build
+
+RealAnswerCache = answer_cache.AnswerCache
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+class ReadyBuilder:
+    def ensure_started(self):
+        pass
+
+    def status(self):
+        return {"state": "ready"}
+
+
+class MissingFastPath:
+    vectors = np.ones((1, 4), dtype=np.float32)
+
+    def match_text(self, question, language):
+        return None
+
+    def match(self, question, query_embedding, language):
+        return None
+
+
+class Embedder:
+    def encode(self, texts, convert_to_numpy=True):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def failing_answer_cache():
+    raise OSError("read-only file system")
+
+
+def stream_answer(client, question, context_docs, stats, messages=None, tab="learning"):
+    stats["ok"] = True
+    yield "Give ORS after every loose stool."
+
+
+def load_models(messages, on_error, with_embedder=True):
+    return object(), Embedder() if with_embedder else None
+
+
+def patch_app(monkeypatch, tmp_path):
+    store = tmp_path / "fast_path.json"
+    store.write_text("{}")
+    monkeypatch.delenv("SAHAYAK_API_URL", raising=False)
+    monkeypatch.setattr(fast_path, "FAST_PATH_STORE", str(store))
+    monkeypatch.setattr(fast_path, "FastPath", MissingFastPath)
+    monkeypatch.setattr(index_build, "IndexBuilder", ReadyBuilder)
+    monkeypatch.setattr(backend, "load_models", load_models)
+    monkeypatch.setattr(backend, "open_vector_store", lambda messages, on_error, on_warning: object())
+    monkeypatch.setattr(backend, "needs_query_embeddings", lambda vector_store: False)
+    monkeypatch.setattr(backend, "retrieve_context", lambda *args, **kwargs: [(["ORS prevents dehydration."], {})])
+    monkeypatch.setattr(backend, "stream_cerebras", stream_answer)
+    monkeypatch.setattr(backend, "CEREBRAS_AVAILABLE", True)
+    # Resources cached by an earlier test's run would hide the patches
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+
+def ask(app, question):
+    app.text_input[0].input(question)
+    app.button[0].click()
+    app.run()
+    assert not app.exception
+
+
+def test_answer_without_answer_cache_with_fast_path(monkeypatch, tmp_path):
+    patch_app(monkeypatch, tmp_path)
+    monkeypatch.setattr(answer_cache, "AnswerCache", failing_answer_cache)
+
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=30)
+    app.run()
+    ask(app, "How much ORS for a child with diarrhoea?")
+
+    assert "Give ORS after every loose stool." in [element.value for element in app.markdown]
+
+
+def test_lexical_mode_caches_by_question_text_without_embedding(monkeypatch, tmp_path):
+    patch_app(monkeypatch, tmp_path)
+    monkeypatch.setattr(backend, "RETRIEVAL_MODE", "lexical")
+    monkeypatch.setattr(Embedder, "encode", lambda *args, **kwargs: pytest.fail("question was embedded"))
+    cache_path = str(tmp_path / "answer_cache.sqlite3")
+    monkeypatch.setattr(answer_cache, "AnswerCache", lambda: RealAnswerCache(cache_path))
+    calls = []
+    monkeypatch.setattr(backend, "stream_cerebras", lambda *args: calls.append(args) or stream_answer(*args))
+
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=30)
+    app.run()
+    ask(app, "How much ORS for a child with diarrhoea?")
+    ask(app, "how much ORS  for a child with diarrhoea?")
+
+    assert len(calls) == 1
+    assert "Give ORS after every loose stool." in [element.value for element in app.markdown]
+
+
+def test_a_failed_retrieval_is_retried_on_the_next_ask(monkeypatch, tmp_path):
+    patch_app(monkeypatch, tmp_path)
+    monkeypatch.setattr(answer_cache, "AnswerCache", failing_answer_cache)
+    results = [ConnectionError("Chroma is compacting"), [(["ORS prevents dehydration."], {})]]
+
+    def retrieve_context(*args, **kwargs):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    monkeypatch.setattr(backend, "retrieve_context", retrieve_context)
+
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=30)
+    app.run()
+    ask(app, "How much ORS for a child with diarrhoea?")
+    assert any("Chroma is compacting" in element.value for element in app.warning)
+    ask(app, "How much ORS for a child with diarrhoea?")
+    assert results == []
+    assert any("ORS prevents dehydration." in element.value for element in app.markdown)
@@ -0,0 +1,61 @@
+import numpy as np
+
+from context_builder import build_context, estimate_tokens, select_mmr, truncate_to_tokens
+
+
+def hit(document, embedding, distance=0.2, metadata=None):
+    return {"id": document, "document": document, "metadata": metadata or {}, "distance": distance,
+            "embedding": np.asarray(embedding, dtype=np.float32)}
+
+
+def test_mmr_prefers_a_diverse_second_chunk():
+    query = [1.0, 0.0, 0.0]
+    candidates = [[0.9, 0.1, 0.0], [0.9, 0.12, 0.0], [0.7, 0.0, 0.7]]
+    # Pure relevance takes the two near-identical chunks, MMR the different one
+    assert select_mmr(query, candidates, 2, lambda_mult=1.0, duplicate_similarity=1.1) == [0, 1]
+    assert select_mmr(query, candidates, 2, lambda_mult=0.3, duplicate_similarity=1.1) == [0, 2]
+
+
+def test_mmr_drops_near_duplicates():
+    query = [1.0, 0.0]
+    candidates = [[1.0, 0.0], [1.0, 0.001], [0.0, 1.0]]
+    assert select_mmr(query, candidates, 3, lambda_mult=1.0, duplicate_similarity=0.95) == [0, 2]
+    assert select_mmr(query, [], 3) == [] and select_mmr(query, candidates, 0) == []
+
+
+def test_context_keeps_the_nearest_chunk_and_drops_distant_ones():
+    hits = [hit("far but first", [1.0, 0.0], distance=1.5), hit("near", [0.0, 1.0], distance=0.3),
+            hit("too far", [1.0, 1.0], distance=1.8)]
+    docs, info = build_context(hits, [1.0, 0.0], 3, max_distance=1.2, min_chunks=1)
+    assert docs == ["far but first", "near"]
+    assert info["candidates"] == 3 and info["within_distance"] == 2 and info["chunks"] == 2
+
+
+def test_token_budget_skips_chunks_that_do_not_fit():
+    long_text, short_text = "a" * 400, "b" * 40
+    hits = [hit("c" * 200, [1.0, 0.0, 0.0]), hit(long_text, [0.0, 1.0, 0.0]), hit(short_text, [0.0, 0.0, 1.0])]
+    docs, info = build_context(hits, [1.0, 0.2, 0.1], 3, token_budget=70)
+    # 50 tokens, then the 100-token chunk is over budget but the 10-token one still fits
+    assert docs == ["c" * 200, short_text]
+    assert info["context_tokens"] == 60
+
+
+def test_an_oversized_best_chunk_is_truncated():
+    docs, info = build_context([hit("x" * 1000, [1.0, 0.0])], [1.0, 0.0], 3, token_budget=10)
+    assert docs == ["x" * 40] and info["context_tokens"] == 10
+    assert truncate_to_tokens("नमस्ते", 1) == "न"
+    assert estimate_tokens("") == 1
+
+
+def test_chunks_of_one_passage_send_the_passage_once():
+    parent = {"parent_id": "p1", "parent": "The whole passage on ORS and zinc."}
+    hits = [hit("ORS", [1.0, 0.0], metadata=parent), hit("zinc", [0.6, 0.8], metadata=dict(parent)),
+            hit("Malaria", [0.0, 1.0])]
+    docs, _ = build_context(hits, [1.0, 0.3], 3)
+    assert docs == ["The whole passage on ORS and zinc.", "Malaria"]
+
+
+def test_hits_without_embeddings_keep_their_order():
+    hits = [dict(hit("first", [1.0]), embedding=None, distance=None), dict(hit("second", [1.0]), embedding=None)]
+    docs, info = build_context(hits, None, 2)
+    assert docs == ["first", "second"] and info["after_mmr"] == 2
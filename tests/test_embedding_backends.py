@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from embedding_backends import OnnxEmbedder, sample_shard_texts
+
+
+class FakeShard:
+    def __init__(self, book, rows):
+        self.texts = {f"{book}-{i}": f"{book} chunk {i}" for i in range(rows)}
+
+    def get(self, include, ids=None):
+        ids = list(self.texts) if ids is None else ids
+        return {"ids": ids, "documents": [self.texts[i] for i in ids] if "documents" in include else None}
+
+
+def test_parity_samples_are_spread_over_every_shard():
+    shards = [FakeShard("anc", 100), FakeShard("nutrition", 10), FakeShard("empty", 0)]
+    texts = sample_shard_texts(shards, 9)
+    assert texts == ["anc chunk 0", "anc chunk 33", "anc chunk 66",
+                     "nutrition chunk 0", "nutrition chunk 3", "nutrition chunk 6"]
+    assert len(sample_shard_texts(shards, 300)) == 110
+    assert sample_shard_texts([], 10) == []
+
+
+VOCAB = ["[PAD]", "[UNK]", "give", "ors", "after", "each", "stool", "ओआरएस"]
+
+
+@pytest.fixture
+def onnx_model_dir(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper, numpy_helper
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+    # A lookup table stands in for the transformer: token i's hidden state is row i
+    weights = np.random.RandomState(0).randn(len(VOCAB), 4).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["weights", "input_ids"], ["last_hidden_state"])],
+        "lookup",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 4])],
+        [numpy_helper.from_array(weights, "weights")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / "model_int8.onnx"))
+
+    tokenizer = Tokenizer(models.WordLevel({token: i for i, token in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+    (tmp_path / "meta.json").write_text(json.dumps(
+        {"model": "test/lookup", "dimension": 4, "max_seq_length": 4, "normalize": True}))
+    return str(tmp_path), weights
+
+
+def expected(weights, token_ids):
+    pooled = weights[token_ids].mean(axis=0)
+    return pooled / np.linalg.norm(pooled)
+
+
+def test_onnx_embedder_mean_pools_unpadded_tokens_and_normalizes(onnx_model_dir):
+    model_dir, weights = onnx_model_dir
+    embedder = OnnxEmbedder(model_dir, batch_size=2)
+    texts = ["ORS", "Give ORS after each stool", "ओआरएस after", "give"]
+    vectors = embedder.encode(texts)
+
+    assert vectors.shape == (4, 4) and embedder.model_id == "test/lookup"
+    np.testing.assert_allclose(vectors[0], expected(weights, [3]), atol=1e-6)
+    # Truncated to max_seq_length tokens
+    np.testing.assert_allclose(vectors[1], expected(weights, [2, 3, 4, 5]), atol=1e-6)
+    # Padding in a batch with a longer text does not change a vector
+    np.testing.assert_allclose(vectors[2], expected(weights, [7, 4]), atol=1e-6)
+    np.testing.assert_allclose(vectors[3], expected(weights, [2]), atol=1e-6)
+
+    np.testing.assert_allclose(embedder.encode("ORS"), vectors[0], atol=1e-6)
+    assert embedder.embed_query("ORS") == pytest.approx(vectors[0].tolist(), abs=1e-6)
+    assert np.asarray(embedder.embed_documents(texts)).shape == (4, 4)
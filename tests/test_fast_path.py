@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pytest
+
+from embedding_backends import EMBEDDING_MODEL_ID
+from fast_path import FAST_PATH_THRESHOLD, FastPath, build_fast_answers
+
+VECTORS = {
+    "What are the danger signs during pregnancy?": [1.0, 0.0, 0.0],
+    "pregnant woman is bleeding": [0.8, 0.6, 0.0],
+    "गर्भावस्था के दौरान खतरे के संकेत क्या हैं?": [0.9, 0.0, 0.1],
+    "How do I treat a burn?": [0.0, 0.0, 1.0],
+}
+
+
+def build(tmp_path, model_id=EMBEDDING_MODEL_ID):
+    intents = tmp_path / "intents.json"
+    intents.write_text(json.dumps({"intents": [
+        {"id": "pregnancy_danger_signs", "category": "emergency",
+         "phrasings": {"en": ["What are the danger signs during pregnancy?", "pregnant woman is bleeding"],
+                       "hi": ["गर्भावस्था के दौरान खतरे के संकेत क्या हैं?"]},
+         "answers": {"en": "Refer her to the nearest FRU now."}},
+        {"id": "burns_first_aid", "category": "emergency",
+         "phrasings": {"en": ["How do I treat a burn?"]},
+         "drafts": {"en": "Cool the burn under running water."}},
+    ]}), encoding="utf-8")
+    store = str(tmp_path / "fast_answers.json")
+    build_fast_answers(lambda texts: [VECTORS[text] for text in texts], lambda vector: ["context"], model_id,
+                       intents_path=str(intents), store_path=store)
+    return store
+
+
+def test_exact_text_hit_ignores_case_and_punctuation(tmp_path):
+    fast_path = FastPath(build(tmp_path))
+    answer, docs, intent, score, vetted = fast_path.match_text("  what are the DANGER signs during pregnancy ", "en")
+    assert (answer, docs, intent, score, vetted) == (
+        "Refer her to the nearest FRU now.", ["context"], "pregnancy_danger_signs", 1.0, True)
+    assert fast_path.match_text("What causes malaria?", "en") is None
+
+
+def test_embedding_hit_depends_on_threshold(tmp_path):
+    fast_path = FastPath(build(tmp_path))
+    question = "signs of trouble when expecting a baby"
+    # Cosine 0.9 to the first danger-signs phrasing, at most 0.9 to the others
+    close = [0.9, -float(np.sqrt(1 - 0.9 ** 2)), 0.0]
+    hit = fast_path.match(question, close, "en")
+    assert hit[2] == "pregnancy_danger_signs" and hit[3] == pytest.approx(0.9, abs=1e-5)
+    assert FastPath(str(tmp_path / "fast_answers.json"), threshold=0.95).match(question, close, "en") is None
+    # Cosine 0.6 at best, below FAST_PATH_THRESHOLD
+    assert FAST_PATH_THRESHOLD > 0.6
+    assert fast_path.match(question, [0.0, 1.0, 0.0], "en") is None
+    # A vector from a model of another width is never compared
+    assert fast_path.match(question, [1.0, 0.0], "en") is None
+
+
+def test_falls_back_to_english_answer(tmp_path):
+    fast_path = FastPath(build(tmp_path))
+    hit = fast_path.match_text("गर्भावस्था के दौरान खतरे के संकेत क्या हैं?", "hi")
+    assert hit[0] == "Refer her to the nearest FRU now."
+
+
+def test_drafts_are_served_as_unreviewed_unless_disabled(tmp_path):
+    store = build(tmp_path)
+    assert FastPath(store).match_text("How do I treat a burn?", "en")[4] is False
+    vetted_only = FastPath(store, serve_drafts=False)
+    assert vetted_only.match_text("How do I treat a burn?", "en") is None
+    # Phrasings of an intent with nothing to serve are not indexed at all
+    assert len(vetted_only.vectors) == 3
+
+
+def test_store_from_another_embedding_model_is_refused(tmp_path):
+    store = build(tmp_path, model_id="sentence-transformers/other-model")
+    with pytest.raises(ValueError):
+        FastPath(store)
@@ -0,0 +1,104 @@
+import subprocess
+import types
+
+import pytest
+
+import index_build
+from ingest_manifest import file_sha256, save_manifest
+
+
+@pytest.fixture
+def builds(tmp_path, monkeypatch):
+    # Runs IndexBuilder in tmp_path with a fake vector_embedding.py that records the
+    # books on disk in the manifest and exits with `returncodes[0]`
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(index_build, "DATA_DIR", "data")
+    monkeypatch.setattr(index_build, "BUILD_LOCK_FILE", "data/index_build.lock")
+    monkeypatch.setattr(index_build, "BUILD_STATUS_FILE", "data/index_build_status.json")
+    monkeypatch.setattr(index_build, "VECTOR_FLAG_FILE", "vector_initialized.flag")
+    monkeypatch.setattr(index_build, "MANIFEST_FILE", "data/ingest_manifest.json")
+    monkeypatch.setattr(index_build, "pdf_files", ["book-1.pdf"])
+    monkeypatch.setattr(index_build, "snapshot_usable", lambda: False)
+    monkeypatch.setattr(index_build, "_current", {})
+    (tmp_path / "book-1.pdf").write_bytes(b"ANC")
+
+    runs = types.SimpleNamespace(count=0, returncodes=[0])
+
+    class FakeProcess:
+        def __init__(self, args):
+            runs.count += 1
+            self.returncode = None
+
+        def wait(self, timeout):
+            self.returncode = runs.returncodes[0]
+            if self.returncode == 0:
+                books = [pdf for pdf in index_build.pdf_files if (tmp_path / pdf).exists()]
+                save_manifest({"layout": "sharded", "books": {
+                    pdf: {"sha256": file_sha256(pdf), "topic": index_build.book_topic(pdf)} for pdf in books
+                }}, index_build.MANIFEST_FILE)
+            return self.returncode
+
+    monkeypatch.setattr(index_build, "subprocess",
+                        types.SimpleNamespace(Popen=FakeProcess, TimeoutExpired=subprocess.TimeoutExpired))
+    return runs
+
+
+def build(builder):
+    builder.ensure_started()
+    if builder._thread:
+        builder._thread.join(5)
+
+
+def test_first_build_becomes_ready(builds):
+    builder = index_build.IndexBuilder()
+    assert not builder.is_ready() and builder.needs_build()
+    assert builder.status() == {"state": "pending"}
+
+    build(builder)
+    assert builds.count == 1
+    assert builder.is_ready() and not builder.needs_build()
+    assert builder.status() == {"state": "ready"}
+    # The lock is released again
+    assert index_build.acquire_build_lock()
+
+
+def test_failed_build_is_retried_after_the_wait(builds, monkeypatch):
+    builds.returncodes[0] = 1
+    builder = index_build.IndexBuilder()
+    build(builder)
+    status = builder.status()
+    assert status["state"] == "failed" and "code 1" in status["message"]
+    assert not builder.is_ready()
+
+    build(builder)
+    assert builds.count == 1
+    builds.returncodes[0] = 0
+    monkeypatch.setattr(index_build, "BUILD_RETRY_SECONDS", 0)
+    build(builder)
+    assert builds.count == 2 and builder.status() == {"state": "ready"}
+
+
+def test_books_added_or_changed_after_the_first_build_are_ingested(builds, tmp_path, monkeypatch):
+    builder = index_build.IndexBuilder()
+    build(builder)
+    build(builder)
+    assert builds.count == 1
+
+    monkeypatch.setattr(index_build, "pdf_files", ["book-1.pdf", "book-2.pdf"])
+    (tmp_path / "book-2.pdf").write_bytes(b"Nutrition")
+    # The built shards keep serving while the new book is ingested
+    assert builder.is_ready() and builder.needs_build()
+    build(builder)
+    assert builds.count == 2 and not builder.needs_build()
+
+    (tmp_path / "book-1.pdf").write_bytes(b"ANC, revised")
+    assert builder.needs_build()
+    build(builder)
+    assert builds.count == 3 and not builder.needs_build()
+
+
+def test_books_that_are_not_on_disk_do_not_trigger_a_build(builds, monkeypatch):
+    builder = index_build.IndexBuilder()
+    build(builder)
+    monkeypatch.setattr(index_build, "pdf_files", ["book-1.pdf", "missing.pdf"])
+    assert not builder.needs_build()
@@ -0,0 +1,52 @@
+import sqlite3
+import sys
+from contextlib import closing
+
+import pytest
+
+pytest.importorskip("chromadb")
+import index_build
+import index_maintenance
+
+
+@pytest.fixture
+def build_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_build, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(index_build, "BUILD_LOCK_FILE", str(tmp_path / "index_build.lock"))
+    monkeypatch.setattr(index_build, "BUILD_STATUS_FILE", str(tmp_path / "index_build_status.json"))
+    monkeypatch.setattr(index_maintenance, "PERSIST_DIRECTORY", str(tmp_path / "chroma"))
+    monkeypatch.setattr(index_maintenance, "compact", lambda db, vacuum_sqlite: pytest.fail("compacted"))
+    monkeypatch.setattr(sys, "argv", ["index_maintenance.py", "compact"])
+    return tmp_path
+
+
+def test_compact_refuses_while_a_build_holds_the_lock(build_files):
+    assert index_build.acquire_build_lock()
+    assert index_maintenance.main() == 1
+
+
+def test_compact_refuses_while_the_status_shows_a_build(build_files):
+    index_build.write_status("building", books_done=1, books_total=3)
+    assert index_maintenance.main() == 1
+    # The lock is released again
+    assert index_build.acquire_build_lock()
+
+
+def test_vacuum_is_refused_while_another_connection_reads(tmp_path):
+    path = str(tmp_path / "chroma.sqlite3")
+    with closing(sqlite3.connect(path, isolation_level=None)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE rows (text TEXT)")
+        conn.execute("INSERT INTO rows VALUES ('ORS')")
+    assert not index_maintenance.sqlite_in_use(path)
+
+    with closing(sqlite3.connect(path, isolation_level=None)) as reader:
+        reader.execute("BEGIN")
+        reader.execute("SELECT * FROM rows").fetchall()
+        with closing(sqlite3.connect(path, isolation_level=None)) as writer:
+            writer.execute("INSERT INTO rows VALUES ('zinc')")
+        assert index_maintenance.sqlite_in_use(path)
+        with pytest.raises(sqlite3.OperationalError):
+            index_maintenance.vacuum(path)
+        reader.execute("COMMIT")
+    assert index_maintenance.vacuum(path)[1] > 0
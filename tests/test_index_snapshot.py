@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+import index_build
+import index_snapshot
+from index_snapshot import snapshot_usable, write_snapshot
+
+
+class FakeCollection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, include, limit=None, offset=0):
+        rows = self.rows[offset:offset + limit if limit else None]
+        return {
+            "ids": [row[0] for row in rows],
+            "embeddings": [row[1] for row in rows],
+            "documents": [row[2] for row in rows],
+            "metadatas": [{"topic": "diarrhoea"} for _ in rows],
+        }
+
+
+def make_snapshot(path):
+    rows = [(f"chunk-{i}", np.eye(4, dtype=np.float32)[i], f"ORS passage number {i}") for i in range(4)]
+    write_snapshot([FakeCollection(rows)], str(path), model_id="test-model")
+
+
+def corrupt(path):
+    footer = index_snapshot.read_footer(str(path))
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(footer["sections"]["texts"]["offset"])
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_snapshot_with_a_bad_checksum_is_not_usable(tmp_path):
+    path = tmp_path / "index.snapshot"
+    make_snapshot(path)
+    assert snapshot_usable(str(path), "test-model")
+    assert not snapshot_usable(str(path), "other-model")
+
+    corrupt(path)
+    assert not snapshot_usable(str(path), "test-model")
+
+
+def test_snapshot_verdict_is_cached_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "index.snapshot"
+    make_snapshot(path)
+    calls = []
+    verify = index_snapshot.verify_snapshot
+    monkeypatch.setattr(index_snapshot, "verify_snapshot", lambda *args: calls.append(args) or verify(*args))
+
+    assert snapshot_usable(str(path), "test-model")
+    assert snapshot_usable(str(path), "test-model")
+    assert len(calls) == 1
+
+    corrupt(path)
+    assert not snapshot_usable(str(path), "test-model")
+    assert len(calls) == 2
+
+
+def test_builder_is_not_ready_with_a_corrupt_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / "index.snapshot"
+    make_snapshot(path)
+    corrupt(path)
+    monkeypatch.setattr(index_build, "VECTOR_FLAG_FILE", str(tmp_path / "vector_initialized.flag"))
+    monkeypatch.setattr(index_build, "snapshot_usable", lambda: snapshot_usable(str(path), "test-model"))
+
+    assert not index_build.IndexBuilder().is_ready()
@@ -0,0 +1,51 @@
+from ingest_manifest import (file_sha256, load_manifest, manifest_changes, normalized_text_sha256, save_manifest,
+                             text_sha256)
+
+TOPICS = {"book-1.pdf": "anc", "book-2.pdf": "nutrition"}
+
+
+def book_topic(pdf):
+    return TOPICS.get(pdf, "general")
+
+
+def test_manifest_round_trip_and_unreadable_file(tmp_path):
+    path = str(tmp_path / "data" / "ingest_manifest.json")
+    assert load_manifest(path) == {"layout": "sharded", "books": {}}
+    manifest = {"layout": "sharded", "books": {"book-1.pdf": {"sha256": "a", "topic": "anc"}}}
+    save_manifest(manifest, path)
+    assert load_manifest(path) == manifest
+    with open(path, "w") as f:
+        f.write("{not json")
+    assert load_manifest(path) == {"layout": "sharded", "books": {}}
+
+
+def test_new_changed_and_removed_books(tmp_path):
+    pdf = tmp_path / "book.pdf"
+    pdf.write_bytes(b"%PDF-1.4 one")
+    first = file_sha256(str(pdf))
+    pdf.write_bytes(b"%PDF-1.4 two")
+    assert file_sha256(str(pdf)) != first
+
+    manifest = {"books": {
+        "book-1.pdf": {"sha256": "h1", "topic": "anc", "chunking": "tokens"},
+        "book-2.pdf": {"sha256": "h2", "topic": "nutrition", "chunking": "tokens"},
+        "book-3.pdf": {"sha256": "h3", "topic": "general", "chunking": "tokens"},
+    }}
+    current = {"book-1.pdf": "h1", "book-2.pdf": "changed", "book-4.pdf": "h4"}
+    assert manifest_changes(manifest, current, book_topic, "tokens", "characters") == (
+        ["book-2.pdf", "book-4.pdf"], ["book-3.pdf"])
+    assert manifest_changes(manifest, {"book-1.pdf": "h1"}, book_topic, "tokens", "characters")[0] == []
+
+
+def test_topic_and_chunking_changes_reingest_a_book():
+    manifest = {"books": {"book-1.pdf": {"sha256": "h1", "topic": "general", "chunking": "tokens"},
+                          "book-2.pdf": {"sha256": "h2", "topic": "nutrition"}}}
+    current = {"book-1.pdf": "h1", "book-2.pdf": "h2"}
+    # book-1 moved to "anc"; book-2 predates recorded chunking and counts as "characters"
+    assert manifest_changes(manifest, current, book_topic, "tokens", "characters")[0] == ["book-1.pdf", "book-2.pdf"]
+    assert manifest_changes(manifest, current, book_topic, "characters", "characters")[0] == ["book-1.pdf"]
+
+
+def test_chunk_ids_ignore_case_and_whitespace():
+    assert normalized_text_sha256("Give  ORS\nafter each stool") == normalized_text_sha256("give ors after each stool")
+    assert normalized_text_sha256("Give ORS") != text_sha256("Give ORS")
@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+
+from lexical_index import LexicalIndex, open_lexical_index, tokenize
+from vector_backends import HybridBackend, NumpyBackend, export_numpy_index, fuse_ranks
+
+
+class FakeCollection:
+    def __init__(self, topic, rows):
+        self.metadata = {"topic": topic}
+        self.rows = rows
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, include, limit=None, offset=0):
+        rows = self.rows[offset:offset + limit if limit else None]
+        return {"ids": [chunk_id for chunk_id, _, _ in rows], "embeddings": [vector for _, vector, _ in rows],
+                "documents": [text for _, _, text in rows], "metadatas": [self.metadata for _ in rows]}
+
+
+def hit(chunk_id, distance=None):
+    return {"id": chunk_id, "document": chunk_id, "metadata": {}, "distance": distance, "embedding": None}
+
+
+def test_tokenize_keeps_devanagari_words_and_single_digits():
+    assert tokenize("Give 2 IFA tablets, a day.") == ["give", "2", "ifa", "tablets", "day"]
+    assert tokenize("आयरन की गोली") == ["आयरन", "की", "गोली"]
+
+
+def test_bm25_scores_match_the_formula():
+    # Two documents: "ors ors zinc" (row 0) and "zinc" (row 1)
+    index = LexicalIndex(["ors", "zinc"], np.array([0, 1, 3]), np.array([0, 0, 1]), np.array([2, 1, 1]),
+                         np.array([3, 1]), k1=1.2, b=0.75)
+    scores = index.scores("ORS")
+    idf = math.log(1 + (2 - 1 + 0.5) / (1 + 0.5))
+    norm = 1.2 * (1 - 0.75 + 0.75 * 3 / 2)
+    assert scores[0] == np.float32(idf * 2 * 2.2 / (2 + norm))
+    assert scores[1] == 0.0
+
+
+def test_keyword_search_ranks_the_exact_term_and_honours_the_row_mask(tmp_path):
+    vectors = np.eye(3, dtype=np.float32)
+    rows = [("a", vectors[0], "Misoprostol prevents bleeding after delivery."),
+            ("b", vectors[1], "Bleeding after delivery needs referral; bleeding can kill."),
+            ("c", vectors[2], "Zinc and ORS for diarrhoea.")]
+    index_dir = str(tmp_path / "numpy_index")
+    export_numpy_index([FakeCollection("anc", rows)], index_dir)
+    index = open_lexical_index(index_dir)
+
+    (found, scores), = index.search(["misoprostol dose"], 5)
+    assert found.tolist() == [0] and scores[0] > 0
+    (found, _), = index.search(["bleeding"], 5)
+    assert found.tolist() == [1, 0]
+    (found, _), = index.search(["bleeding"], 5, allowed=np.array([True, False, True]))
+    assert found.tolist() == [0]
+    assert index.search(["malaria"], 5)[0][0].tolist() == []
+
+    # Keyword-only retrieval needs no query vector
+    store = NumpyBackend(index_dir)
+    hybrid = HybridBackend(store, index, store, mode="lexical")
+    assert hybrid.query(None, 1, queries=["misoprostol"]) == [["Misoprostol prevents bleeding after delivery."]]
+
+
+def test_fuse_ranks_favours_chunks_found_by_both_lists():
+    dense = [hit("a", 0.1), hit("b", 0.2), hit("c", 0.3)]
+    sparse = [hit("d"), hit("c"), hit("a")]
+    fused = fuse_ranks([dense, sparse], 3, k=60)
+    assert [h["id"] for h in fused] == ["a", "c", "d"]
+    # A chunk in both lists keeps the vector hit and its distance
+    assert fused[1]["distance"] == 0.3
+    assert [h["id"] for h in fuse_ranks([dense, []], 2)] == ["a", "b"]
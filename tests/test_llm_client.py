@@ -0,0 +1,161 @@
+import threading
+import time
+import types
+
+import pytest
+
+import llm_client
+from llm_client import CircuitBreaker, LLMClient, LLMDeadlineExceeded, LLMUnavailable
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, messages, model, stream=False, timeout=None):
+        self.calls += 1
+        if stream:
+            return iter([types.SimpleNamespace(choices=[])])
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="ok"))])
+
+
+def make_client(completions):
+    breaker = CircuitBreaker(failures=1, reset_seconds=0.0)
+    client = LLMClient(types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)), "model",
+                       deadlines={"learning": 0.05}, breaker=breaker, concurrency=1)
+    return client, breaker
+
+
+@pytest.mark.parametrize("call", ["complete", "stream"])
+def test_half_open_trial_without_a_slot_does_not_wedge_the_breaker(call):
+    completions = FakeCompletions()
+    client, breaker = make_client(completions)
+
+    def run():
+        result = getattr(client, call)([{"role": "user", "content": "hi"}])
+        return list(result) if call == "stream" else result
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # Every slot is busy when the cooldown has passed and the trial call arrives
+    client._slots.acquire()
+    with pytest.raises(LLMUnavailable):
+        run()
+    assert breaker.state != "half_open"
+    assert completions.calls == 0
+
+    client._slots.release()
+    run()
+    assert breaker.state == "closed"
+    assert completions.calls == 1
+
+
+class ScriptedCompletions:
+    # Each call runs the next step: an exception to raise, an Event to wait on, or a reply
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.timeouts = []
+
+    def create(self, messages, model, stream=False, timeout=None):
+        self.timeouts.append(timeout)
+        step = self.steps.pop(0) if len(self.steps) > 1 else self.steps[0]
+        if isinstance(step, threading.Event):
+            step.wait(5)
+            return reply("late")
+        if isinstance(step, Exception):
+            raise step
+        return reply(step)
+
+
+def reply(text):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))])
+
+
+def client_for(completions, **options):
+    options.setdefault("deadlines", {"learning": 5.0})
+    options.setdefault("breaker", CircuitBreaker(failures=5, reset_seconds=60))
+    return LLMClient(types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)), "model",
+                     **options)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # The SDK's error classes are not needed to tell a dropped connection from a bad request
+    monkeypatch.setattr(llm_client, "is_retryable", lambda error: isinstance(error, ConnectionError))
+    monkeypatch.setattr(llm_client, "LLM_RETRY_BASE_SECONDS", 0.001)
+
+
+def text(completion):
+    return completion.choices[0].message.content
+
+
+def test_a_retry_that_succeeds():
+    completions = ScriptedCompletions(ConnectionError("reset"), "ok")
+    client = client_for(completions, max_retries=2)
+    assert text(client.complete([])) == "ok"
+    assert client.retries == 1 and len(completions.timeouts) == 2
+    assert client.breaker.state == "closed" and client.breaker._failures == 0
+
+
+def test_running_out_of_retries_raises_the_last_error():
+    completions = ScriptedCompletions(ConnectionError("reset"))
+    client = client_for(completions, max_retries=2)
+    with pytest.raises(ConnectionError):
+        client.complete([])
+    assert len(completions.timeouts) == 3 and client.retries == 2
+    assert client.breaker._failures == 1
+
+
+def test_errors_that_are_not_retryable_fail_at_once():
+    completions = ScriptedCompletions(ValueError("bad request"))
+    client = client_for(completions, max_retries=2)
+    with pytest.raises(ValueError):
+        client.complete([])
+    assert len(completions.timeouts) == 1 and client.retries == 0
+
+
+def test_a_hedge_wins_when_the_first_request_stalls():
+    stalled = threading.Event()
+    completions = ScriptedCompletions(stalled, "hedge")
+    client = client_for(completions, hedge_after_ms=20)
+    try:
+        assert text(client.complete([])) == "hedge"
+        assert client.hedges == 1 and len(completions.timeouts) == 2
+        # The hedge only gets what is left of the deadline
+        assert completions.timeouts[1] < completions.timeouts[0] <= 5.0
+    finally:
+        stalled.set()
+
+
+def test_the_deadline_expires_when_nothing_answers():
+    stalled = threading.Event()
+    client = client_for(ScriptedCompletions(stalled), deadlines={"learning": 5.0, "urgent": 0.1},
+                        hedge_after_ms=20)
+    try:
+        start = time.monotonic()
+        with pytest.raises(LLMDeadlineExceeded):
+            client.complete([], tab="urgent")
+        assert time.monotonic() - start < 1.0
+        assert client.breaker._failures == 1
+    finally:
+        stalled.set()
+
+
+def test_calls_beyond_the_concurrency_limit_wait_then_give_up():
+    busy = threading.Event()
+    completions = ScriptedCompletions(busy, "ok")
+    client = client_for(completions, deadlines={"learning": 5.0, "urgent": 0.05}, concurrency=1)
+    holder = threading.Thread(target=client.complete, args=([],))
+    holder.start()
+    try:
+        while not completions.timeouts:
+            time.sleep(0.001)
+        with pytest.raises(LLMUnavailable):
+            client.complete([], tab="urgent")
+        assert client.rejected == 1 and len(completions.timeouts) == 1
+    finally:
+        busy.set()
+        holder.join(5)
+    # The slot is free again once the first call has finished
+    assert text(client.complete([])) == "ok"
@@ -0,0 +1,77 @@
+import re
+
+import pytest
+
+from metrics import Tracer, current_trace, span
+
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)\{(?P<labels>.*)\} (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    # {(name, frozenset(labels)): value} plus the declared metric types
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+        elif line and not line.startswith("#"):
+            match = SAMPLE.match(line)
+            assert match, f"not a Prometheus sample: {line!r}"
+            labels = frozenset(LABEL.findall(match["labels"]))
+            samples[(match["name"], labels)] = float(match["value"])
+    return samples, types
+
+
+def test_percentiles_count_and_sum():
+    tracer = Tracer(window=1000)
+    for i in range(1, 101):
+        tracer.record_span("retrieval", i / 100, "learning", "en")
+    entry = tracer.summary()["stages"]["retrieval/learning/en"]
+    assert entry["count"] == 100 and entry["sum"] == pytest.approx(50.5)
+    assert (entry["p50"], entry["p95"], entry["p99"]) == (0.51, 0.95, 0.99)
+
+    tracer.record_span("llm", 2.0, "urgent", "hi")
+    single = tracer.summary()["stages"]["llm/urgent/hi"]
+    assert single["p50"] == single["p99"] == 2.0
+
+
+def test_percentiles_use_the_latest_window_but_totals_count_everything():
+    tracer = Tracer(window=10)
+    for seconds in [100.0] * 10 + [1.0] * 10:
+        tracer.record_span("llm", seconds)
+    entry = tracer.summary()["stages"]["llm/-/-"]
+    assert entry["count"] == 20 and entry["sum"] == pytest.approx(1010.0)
+    assert entry["p99"] == 1.0
+
+
+def test_prometheus_exposition_parses():
+    tracer = Tracer()
+    with tracer.request("urgent", "hi") as trace:
+        assert current_trace() is trace
+        with span("retrieval"):
+            pass
+        trace.add_span("llm", 0.25)
+        trace.flag("answer_cache", "miss")
+        trace.flag("fast_path", 'say "ORS"\n')
+    assert current_trace() is None
+    tracer.record_span("cold_start_embedder", 1.5)
+
+    samples, types = parse(tracer.prometheus())
+    assert types == {"sahayak_stage_latency_seconds": "summary", "sahayak_request_flags_total": "counter"}
+
+    llm = frozenset({("stage", "llm"), ("tab", "urgent"), ("language", "hi")})
+    assert samples[("sahayak_stage_latency_seconds", llm | {("quantile", "0.95")})] == 0.25
+    assert samples[("sahayak_stage_latency_seconds_sum", llm)] == 0.25
+    assert samples[("sahayak_stage_latency_seconds_count", llm)] == 1
+    total = frozenset({("stage", "total"), ("tab", "urgent"), ("language", "hi")})
+    assert samples[("sahayak_stage_latency_seconds_count", total)] == 1
+    cold = frozenset({("stage", "cold_start_embedder"), ("tab", "-"), ("language", "-")})
+    assert samples[("sahayak_stage_latency_seconds", cold | {("quantile", "0.5")})] == 1.5
+
+    flag = frozenset({("flag", "answer_cache"), ("value", "miss"), ("tab", "urgent"), ("language", "hi")})
+    assert samples[("sahayak_request_flags_total", flag)] == 1
+    # Quotes and newlines in label values are escaped
+    escaped = frozenset({("flag", "fast_path"), ("value", 'say \\"ORS\\"\\n'), ("tab", "urgent"),
+                         ("language", "hi")})
+    assert samples[("sahayak_request_flags_total", escaped)] == 1
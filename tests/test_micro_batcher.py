@@ -0,0 +1,79 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+from api_server import MicroBatcher
+
+
+def run_with_batcher(run_batch, scenario, **options):
+    # Runs `scenario(batcher)` while the batcher's loop is running
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = MicroBatcher(run_batch, executor, **options)
+            worker = asyncio.create_task(batcher.run())
+            try:
+                return await asyncio.wait_for(scenario(batcher), 5)
+            finally:
+                worker.cancel()
+    return asyncio.run(main())
+
+
+def test_a_full_batch_is_flushed_without_waiting_for_the_window():
+    batches = []
+
+    def run_batch(items):
+        batches.append(items)
+        return [item.upper() for item in items]
+
+    async def scenario(batcher):
+        return await asyncio.gather(*(batcher.submit(q) for q in ["ors", "zinc", "ifa", "tt"]))
+
+    # A 10 s window would outlast the 5 s test timeout if full batches waited for it
+    results = run_with_batcher(run_batch, scenario, window_ms=10_000, max_batch=2)
+    assert results == ["ORS", "ZINC", "IFA", "TT"]
+    assert batches == [["ors", "zinc"], ["ifa", "tt"]]
+
+
+def test_a_partial_batch_is_flushed_at_the_deadline():
+    batches = []
+
+    def run_batch(items):
+        batches.append(items)
+        return [len(item) for item in items]
+
+    async def scenario(batcher):
+        start = time.monotonic()
+        first = asyncio.ensure_future(batcher.submit("ors"))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.submit("zinc"))
+        results = await asyncio.gather(first, second)
+        return results, time.monotonic() - start
+
+    results, seconds = run_with_batcher(run_batch, scenario, window_ms=100, max_batch=32)
+    assert results == [3, 4]
+    # Both arrived within one window, so they shared a batch flushed once it closed
+    assert batches == [["ors", "zinc"]]
+    assert 0.09 <= seconds < 2
+
+
+def test_an_error_reaches_every_submission_and_the_batcher_keeps_going():
+    calls = []
+
+    def run_batch(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise ConnectionError("Chroma unavailable")
+        return items
+
+    async def scenario(batcher):
+        results = await asyncio.gather(batcher.submit("ors"), batcher.submit("zinc"), return_exceptions=True)
+        return results, await batcher.submit("ifa")
+
+    results, after = run_with_batcher(run_batch, scenario, window_ms=50, max_batch=32)
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+    assert results[0] is results[1]
+    assert after == "ifa"
@@ -0,0 +1,48 @@
+import numpy as np
+
+from index_snapshot import SnapshotBackend, write_snapshot
+from parent_store import ParentStore, attach_parents
+
+
+def hit(chunk_id, metadata):
+    return {"id": chunk_id, "document": chunk_id, "metadata": metadata, "distance": 0.1, "embedding": None}
+
+
+def test_passages_are_stored_once_and_attached_after_retrieval(tmp_path):
+    store = ParentStore(str(tmp_path / "parents.sqlite3"))
+    store.put({"p1": "Full passage on ORS."})
+    store.put({"p1": "ignored", "p2": "Full passage on zinc."})
+    assert store.get(["p1", "p2", "p3"]) == {"p1": "Full passage on ORS.", "p2": "Full passage on zinc."}
+
+    shared = {"parent_id": "p1", "topic": "diarrhoea"}
+    hits = [[hit("a", shared), hit("b", {"parent_id": "p1"}), hit("c", {})],
+            [hit("d", {"parent_id": "p9"}), hit("e", {"parent_id": "p2", "parent": "stored in the chunk"})]]
+    attached = attach_parents(hits, store.get)
+    assert [h["metadata"].get("parent") for h in attached[0]] == ["Full passage on ORS.", "Full passage on ORS.", None]
+    assert [h["metadata"].get("parent") for h in attached[1]] == [None, "stored in the chunk"]
+    # Metadata shared with the store's cache is not modified
+    assert "parent" not in shared
+
+    assert store.prune(["p2"]) == 1
+    assert store.get(["p1", "p2"]) == {"p2": "Full passage on zinc."}
+
+
+class FakeCollection:
+    metadata = {"topic": "diarrhoea"}
+
+    def count(self):
+        return 1
+
+    def get(self, include, limit=None, offset=0):
+        return {"ids": ["a"], "embeddings": [np.ones(3, dtype=np.float32)], "documents": ["ORS chunk"],
+                "metadatas": [{"topic": "diarrhoea", "parent_id": "p1"}]}
+
+
+def test_snapshot_carries_the_passages_of_its_chunks(tmp_path):
+    parents_path = str(tmp_path / "parents.sqlite3")
+    ParentStore(parents_path).put({"p1": "Full passage on ORS.", "p2": "Passage of a removed book."})
+    path = str(tmp_path / "index.snapshot")
+    write_snapshot([FakeCollection()], path, model_id="test-model", parents_path=parents_path)
+
+    snapshot = SnapshotBackend(path, model_id="test-model")
+    assert snapshot.parent_texts(["p1", "p2"]) == {"p1": "Full passage on ORS."}
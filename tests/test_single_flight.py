@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+import types
+
+import pytest
+
+import single_flight
+from single_flight import RateLimiter, SingleFlight
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work(question):
+        calls.append(question)
+        release.wait(5)
+        return f"answer to {question}"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", work, "ORS")))
+               for _ in range(3)]
+    threads[0].start()
+    wait_until(lambda: calls)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flights.shared == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["ORS"]
+    assert sorted(results, key=lambda r: r[1]) == [("answer to ORS", False)] + [("answer to ORS", True)] * 2
+    # Nothing is kept once the call has finished
+    assert flights.do("key", lambda: "again") == ("again", False)
+
+
+def test_an_exception_reaches_every_waiter():
+    flights = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise TimeoutError("Cerebras timed out")
+
+    errors = []
+
+    def call():
+        try:
+            flights.do("key", fail)
+        except TimeoutError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flights.shared == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3 and len({id(e) for e in errors}) == 1
+
+
+def test_a_stream_replays_to_late_joiners():
+    flights = SingleFlight()
+    tokens = queue.Queue()
+    starts = []
+
+    def start(state):
+        starts.append(state)
+
+        def generate():
+            while (token := tokens.get(timeout=5)) is not None:
+                yield token
+            state["ok"] = True
+        return generate()
+
+    chunks, state, shared = flights.stream("key", start)
+    assert not shared
+    tokens.put("Give ")
+    assert next(chunks) == "Give "
+    tokens.put("ORS")
+    assert next(chunks) == "ORS"
+
+    # A session asking the same question now still reads the answer from the start
+    late_chunks, late_state, late_shared = flights.stream("key", start)
+    assert late_shared and late_state is state
+    tokens.put(None)
+    assert list(chunks) == []
+    assert list(late_chunks) == ["Give ", "ORS"]
+    assert state == {"ok": True} and len(starts) == 1
+
+
+def test_a_stream_error_reaches_every_reader():
+    flights = SingleFlight()
+
+    def start(state):
+        yield "Give "
+        raise ConnectionError("stream dropped")
+
+    chunks, _, _ = flights.stream("key", start)
+    with pytest.raises(ConnectionError):
+        list(chunks)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(single_flight, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_token_bucket_allows_a_burst_then_refills(clock):
+    limiter = RateLimiter(per_minute=6, burst=2)
+    assert limiter.acquire("asha-1") == 0.0
+    assert limiter.acquire("asha-1") == 0.0
+    # One token every 10 seconds
+    assert limiter.acquire("asha-1") == pytest.approx(10.0)
+    assert limiter.acquire("asha-2") == 0.0
+    clock[0] += 4.0
+    assert limiter.acquire("asha-1") == pytest.approx(6.0)
+    clock[0] += 6.0
+    assert limiter.acquire("asha-1") == 0.0
+    assert limiter.limited == 2
+
+
+def test_rate_limit_zero_disables_it(clock):
+    limiter = RateLimiter(per_minute=0, burst=1)
+    assert all(limiter.acquire("asha-1") == 0.0 for _ in range(100))
+    assert limiter.limited == 0
+
+
+def test_least_recently_seen_users_are_forgotten(clock):
+    limiter = RateLimiter(per_minute=6, burst=1, max_users=2)
+    limiter.acquire("asha-1")
+    limiter.acquire("asha-2")
+    limiter.acquire("asha-3")
+    # asha-1 was forgotten, so starts again with a full bucket
+    assert limiter.acquire("asha-1") == 0.0
+    assert limiter.acquire("asha-3") > 0.0
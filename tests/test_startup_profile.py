@@ -0,0 +1,11 @@
+import os
+
+import startup_profile
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def test_shell_phase_imports_every_local_module_app_imports():
+    modules = startup_profile.app_modules(APP_SCRIPT)
+    assert {"backend", "fast_path", "single_flight", "answer_cache", "index_build"} <= set(modules)
+    assert "streamlit" not in modules and "dotenv" not in modules
@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pytest
+
+import vector_backends
+
+from vector_backends import (NumpyBackend, QuantizedBackend, ShardedChromaBackend, export_numpy_index,
+                             export_quantized_index)
+
+
+class FakeShard:
+    def __init__(self, document, topic, distance=0.1):
+        self.document = document
+        self.metadata = {"topic": topic}
+        self.distance = distance
+        self.dropped = False
+
+    def query(self, query_embeddings, n_results, include, where):
+        if self.dropped:
+            raise ValueError("Collection does not exist")
+        return {"ids": [[self.document]], "documents": [[self.document]], "metadatas": [[self.metadata]],
+                "distances": [[self.distance]]}
+
+
+def test_shards_are_reopened_after_a_book_is_reingested(tmp_path):
+    manifest = tmp_path / "ingest_manifest.json"
+    manifest.write_text("{}")
+    shards = {"anc": FakeShard("old ANC passage", "anc"), "nutrition": FakeShard("nutrition passage", "nutrition")}
+    store = ShardedChromaBackend(list(shards.values()), reopen=lambda: list(shards.values()), manifest=str(manifest))
+    assert store.query([[1.0]], 1, topics=["anc"]) == [["old ANC passage"]]
+
+    # swap_shard drops the old collection and renames the staging one, then saves the manifest
+    shards["anc"].dropped = True
+    shards["anc"] = FakeShard("new ANC passage", "anc")
+    manifest.write_text('{"books": {}}')
+    os.utime(manifest, ns=(0, os.stat(manifest).st_mtime_ns + 1_000_000))
+    assert store.query([[1.0]], 1, topics=["anc"]) == [["new ANC passage"]]
+
+
+def test_a_shard_dropped_before_the_manifest_is_saved_is_reopened(tmp_path):
+    manifest = tmp_path / "ingest_manifest.json"
+    manifest.write_text("{}")
+    shards = {"anc": FakeShard("old ANC passage", "anc")}
+    store = ShardedChromaBackend(list(shards.values()), reopen=lambda: list(shards.values()), manifest=str(manifest))
+
+    shards["anc"].dropped = True
+    shards["anc"] = FakeShard("new ANC passage", "anc")
+    assert store.query([[1.0]], 1) == [["new ANC passage"]]
+
+
+class FakeCollection:
+    def __init__(self, topic, rows):
+        self.metadata = {"topic": topic}
+        self.rows = rows
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, include, limit=None, offset=0):
+        rows = self.rows[offset:offset + limit if limit else None]
+        return {"ids": [chunk_id for chunk_id, _, _ in rows], "embeddings": [vector for _, vector, _ in rows],
+                "documents": [text for _, _, text in rows], "metadatas": [self.metadata for _ in rows]}
+
+
+def test_chunk_shared_by_two_books_is_found_under_both_topics(tmp_path):
+    vectors = np.eye(3, dtype=np.float32)
+    anc = FakeCollection("anc", [("iron", vectors[0], "Give IFA tablets daily."), ("tt", vectors[1], "TT injection")])
+    nutrition = FakeCollection("nutrition", [("iron", vectors[0], "Give IFA tablets daily."),
+                                             ("millet", vectors[2], "Millets are rich in iron.")])
+    numpy_dir, quantized_dir = str(tmp_path / "numpy_index"), str(tmp_path / "quantized_index")
+    assert export_numpy_index([anc, nutrition], numpy_dir) == 3
+    export_quantized_index(numpy_dir, quantized_dir)
+
+    for store in (NumpyBackend(numpy_dir), QuantizedBackend(quantized_dir, source_dir=numpy_dir)):
+        assert store.query([vectors[0]], 1, topics=["anc"]) == [["Give IFA tablets daily."]]
+        assert store.query([vectors[0]], 1, topics=["nutrition"]) == [["Give IFA tablets daily."]]
+        assert store.query([vectors[0]], 3, topics=["nutrition"])[0][1:] == ["Millets are rich in iron."]
+
+
+def test_quantized_index_refuses_a_changed_numpy_index(tmp_path):
+    vectors = np.eye(3, dtype=np.float32)
+    rows = [("iron", vectors[0], "Give IFA tablets daily."), ("tt", vectors[1], "TT injection")]
+    numpy_dir, quantized_dir = str(tmp_path / "numpy_index"), str(tmp_path / "quantized_index")
+    export_numpy_index([FakeCollection("anc", rows)], numpy_dir)
+    export_quantized_index(numpy_dir, quantized_dir)
+    QuantizedBackend(quantized_dir, source_dir=numpy_dir)
+
+    # Re-exporting the same chunks keeps the fingerprint
+    export_numpy_index([FakeCollection("anc", rows)], numpy_dir)
+    QuantizedBackend(quantized_dir, source_dir=numpy_dir)
+
+    export_numpy_index([FakeCollection("anc", rows + [("ors", vectors[2], "ORS")])], numpy_dir)
+    with pytest.raises(ValueError):
+        QuantizedBackend(quantized_dir, source_dir=numpy_dir)
+    export_quantized_index(numpy_dir, quantized_dir)
+    assert len(QuantizedBackend(quantized_dir, source_dir=numpy_dir)) == 3
+
+
+def test_quantized_search_finds_the_exact_neighbors(tmp_path, monkeypatch):
+    # Small blocks so the running top candidates are merged across many of them
+    monkeypatch.setattr(vector_backends, "NUMPY_SEARCH_BLOCK", 64)
+    vectors = np.random.RandomState(0).randn(600, 32).astype(np.float32)
+    rows = [(f"chunk-{i}", vector, f"passage {i}") for i, vector in enumerate(vectors)]
+    numpy_dir, quantized_dir = str(tmp_path / "numpy_index"), str(tmp_path / "quantized_index")
+    export_numpy_index([FakeCollection("anc", rows[:300]), FakeCollection("nutrition", rows[300:])], numpy_dir)
+    export_quantized_index(numpy_dir, quantized_dir)
+    assert not os.path.exists(os.path.join(quantized_dir, "vectors.npy"))
+
+    exact, quantized = NumpyBackend(numpy_dir), QuantizedBackend(quantized_dir, source_dir=numpy_dir)
+    queries = np.random.RandomState(1).randn(20, 32).astype(np.float32)
+    for topics in (None, ["nutrition"]):
+        exact_rows, exact_scores = exact.search(queries, 10, topics)
+        rows, scores = quantized.search(queries, 10, topics)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(exact_rows, rows)])
+        assert recall >= 0.95
+        # Rescored against the same float16 vectors, so shared hits score the same
+        np.testing.assert_allclose(scores[:, 0], exact_scores[:, 0], atol=1e-5)
+        if topics:
+            assert (rows >= 300).all()
+
+
+def test_quantized_index_needs_its_numpy_index(tmp_path):
+    rows = [("iron", np.eye(2, dtype=np.float32)[0], "Give IFA tablets daily.")]
+    numpy_dir, quantized_dir = str(tmp_path / "numpy_index"), str(tmp_path / "quantized_index")
+    export_numpy_index([FakeCollection("anc", rows)], numpy_dir)
+    export_quantized_index(numpy_dir, quantized_dir)
+    with pytest.raises(ValueError):
+        QuantizedBackend(quantized_dir, source_dir=str(tmp_path / "missing"))
@@ -0,0 +1,580 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from lexical_index import write_lexical_index
+
+# "chroma" queries the Chroma collection; "numpy" searches the exported memory-mapped index;
+# "quantized" searches int8 codes of it and rescores the best candidates
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIR = os.path.join("data", "numpy_index")
+QUANTIZED_INDEX_DIR = os.path.join("data", "quantized_index")
+# Rows scored per step, bounding the float32 scratch space of a search
+NUMPY_SEARCH_BLOCK = 16384
+# Candidates per requested hit that the quantized search rescores in full precision
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+# Files of a NumPy index hashed into its fingerprint, which the quantized index built
+# from it records; rows of the two must line up for the BM25 postings to apply
+FINGERPRINT_FILES = ("ids.json", "offsets.npy", "texts.bin", "vectors.npy", "metadatas.json")
+# Chunks compressed together in the quantized index's text store, and decompressed
+# blocks kept in memory per process
+CHUNK_STORE_BLOCK = 32
+CHUNK_STORE_CACHE = int(os.getenv("CHUNK_STORE_CACHE", "256"))
+# Collections holding one book each are named SHARD_PREFIX + book name
+SHARD_PREFIX = "shard-"
+# Rewritten by vector_embedding.py after every shard it swaps in or drops
+SHARD_MANIFEST = os.path.join("data", "ingest_manifest.json")
+# Threads querying the per-book shards of a sharded index at once
+SHARD_QUERY_WORKERS = int(os.getenv("SHARD_QUERY_WORKERS", "8"))
+# "vector" ranks by embedding only; "hybrid" fuses it with BM25 keyword matches;
+# "lexical" uses BM25 alone, so questions are answered without embedding them
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Reciprocal-rank fusion constant: a hit at rank r in one list scores 1 / (RRF_K + r)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def row_topics(metadata):
+    # Topics a row of an exported index is filed under: a chunk that several books
+    # share is exported once with all their topics in "topics"
+    metadata = metadata or {}
+    return metadata.get("topics") or [metadata.get("topic")]
+
+
+def topic_filter(topics):
+    # Chroma `where` clause keeping only chunks whose "topic" metadata is one of `topics`
+    if not topics:
+        return None
+    topics = list(topics)
+    return {"topic": topics[0]} if len(topics) == 1 else {"topic": {"$in": topics}}
+
+
+class ChromaBackend:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query_hits(self, query_embeddings: list, top_k: int, include_embeddings: bool = False, topics=None):
+        # One Chroma query for a whole batch of question vectors; returns, per query,
+        # hits {"id", "document", "metadata", "distance"} best first, plus "embedding" if asked.
+        # With `topics`, only chunks of books filed under one of them are searched.
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        results = self.collection.query(
+            query_embeddings=query_embeddings, n_results=top_k, include=include, where=topic_filter(topics)
+        )
+        hits = []
+        for i in range(len(query_embeddings)):
+            ids = results["ids"][i] if results.get("ids") else []
+            docs = results["documents"][i] if results.get("documents") else [None] * len(ids)
+            metas = results["metadatas"][i] if results.get("metadatas") else [None] * len(ids)
+            dists = results["distances"][i] if results.get("distances") else [None] * len(ids)
+            embeddings = results["embeddings"][i] if include_embeddings else [None] * len(ids)
+            hits.append([
+                {"id": chunk_id, "document": doc, "metadata": meta or {}, "distance": dist, "embedding": embedding}
+                for chunk_id, doc, meta, dist, embedding in zip(ids, docs, metas, dists, embeddings)
+                if doc and isinstance(doc, str)
+            ])
+        return hits
+
+    def query(self, query_embeddings: list, top_k: int, topics=None):
+        return [[hit["document"] for hit in hits] for hits in self.query_hits(query_embeddings, top_k, topics=topics)]
+
+
+class ShardedChromaBackend:
+    # One Chroma collection per book. A query fans out to the shards in parallel and
+    # the per-shard top-k lists are merged by distance. Shards whose book is not filed
+    # under the requested topics are skipped without being queried.
+    # Re-ingesting a book swaps in a new collection under the shard's name, so with
+    # `reopen` the shards are opened again by name whenever the ingest manifest changes,
+    # and once more when a query fails on a shard dropped before the manifest was saved.
+    _pool = None
+
+    def __init__(self, collections, reopen=None, manifest=SHARD_MANIFEST):
+        self.reopen = reopen
+        self.manifest = manifest
+        self._manifest_mtime = self._read_mtime()
+        self._lock = threading.Lock()
+        self._set_shards(collections)
+
+    def _set_shards(self, collections):
+        self.shards = [(collection, (collection.metadata or {}).get("topic")) for collection in collections]
+
+    def _read_mtime(self):
+        try:
+            return os.stat(self.manifest).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self, force=False):
+        if self.reopen is None:
+            return
+        mtime = self._read_mtime()
+        if mtime == self._manifest_mtime and not force:
+            return
+        with self._lock:
+            if mtime == self._manifest_mtime and not force:
+                return
+            self._set_shards(self.reopen())
+            self._manifest_mtime = mtime
+
+    @classmethod
+    def pool(cls):
+        if cls._pool is None:
+            cls._pool = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard-query")
+        return cls._pool
+
+    def __len__(self):
+        return len(self.shards)
+
+    def query_hits(self, query_embeddings: list, top_k: int, include_embeddings: bool = False, topics=None):
+        self.refresh()
+        try:
+            return self._query_hits(query_embeddings, top_k, include_embeddings, topics)
+        except Exception:
+            if self.reopen is None:
+                raise
+            self.refresh(force=True)
+            return self._query_hits(query_embeddings, top_k, include_embeddings, topics)
+
+    def _query_hits(self, query_embeddings, top_k, include_embeddings, topics):
+        shards = [ChromaBackend(collection) for collection, topic in self.shards
+                  if not topics or topic in topics]
+        if not shards:
+            return [[] for _ in query_embeddings]
+        if len(shards) == 1:
+            return shards[0].query_hits(query_embeddings, top_k, include_embeddings)
+        futures = [self.pool().submit(shard.query_hits, query_embeddings, top_k, include_embeddings)
+                   for shard in shards]
+        per_shard = [future.result() for future in futures]
+        merged = []
+        for i in range(len(query_embeddings)):
+            hits = sorted((hit for shard_hits in per_shard for hit in shard_hits[i]), key=lambda hit: hit["distance"])
+            # A passage printed in two books is stored in both shards; keep its closest copy
+            best = {}
+            for hit in hits:
+                best.setdefault(hit["id"], hit)
+            merged.append(list(best.values())[:top_k])
+        return merged
+
+    def query(self, query_embeddings: list, top_k: int, topics=None):
+        return [[hit["document"] for hit in hits] for hits in self.query_hits(query_embeddings, top_k, topics=topics)]
+
+
+class NumpyBackend:
+    # Exact cosine search over L2-normalized float16 vectors in a memory-mapped .npy.
+    # Chunk texts sit in a flat UTF-8 file indexed by an offsets array, also memory-mapped,
+    # so every worker process shares the same page cache instead of its own copy.
+    def __init__(self, index_dir=NUMPY_INDEX_DIR):
+        self.index_dir = index_dir
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(index_dir, "offsets.npy"), mmap_mode="r")
+        texts_path = os.path.join(index_dir, "texts.bin")
+        self.texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else b""
+        with open(os.path.join(index_dir, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self._metadatas = None
+        self._topic_rows = {}
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def document(self, row: int):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self.texts[start:end]).decode("utf-8")
+
+    def metadatas(self):
+        # Metadata is not needed for plain document queries, so it is loaded on first use
+        if self._metadatas is None:
+            with open(os.path.join(self.index_dir, "metadatas.json"), "r", encoding="utf-8") as f:
+                self._metadatas = json.load(f)
+        return self._metadatas
+
+    def metadata(self, row: int):
+        return self.metadatas()[row]
+
+    def topic_rows(self, topics):
+        # Boolean mask of the rows filed under one of `topics`, cached per topic set
+        key = frozenset(topics)
+        if key not in self._topic_rows:
+            self._topic_rows[key] = np.fromiter(
+                (not key.isdisjoint(row_topics(meta)) for meta in self.metadatas()), dtype=bool, count=len(self)
+            )
+        return self._topic_rows[key]
+
+    def search(self, query_embeddings: list, top_k: int, topics=None):
+        # Returns (rows, scores) arrays of shape (queries, k), best match first
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        count = len(self)
+        allowed = self.topic_rows(topics) if topics else None
+        k = min(top_k, count if allowed is None else int(allowed.sum()))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, NUMPY_SEARCH_BLOCK):
+            block = np.asarray(self.vectors[start:start + NUMPY_SEARCH_BLOCK], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if allowed is not None:
+            scores[:, ~allowed] = -np.inf
+
+        rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def query_hits(self, query_embeddings: list, top_k: int, include_embeddings: bool = False, topics=None):
+        # Same shape as ChromaBackend.query_hits; distance is squared L2 between
+        # unit vectors (2 - 2 * cosine), matching Chroma's default space
+        rows, scores = self.search(query_embeddings, top_k, topics)
+        return [
+            [
+                {"id": self.ids[int(row)], "document": self.document(int(row)),
+                 "metadata": self.metadata(int(row)), "distance": float(2.0 - 2.0 * score),
+                 "embedding": np.asarray(self.vectors[int(row)], dtype=np.float32) if include_embeddings else None}
+                for row, score in zip(query_rows, query_scores)
+            ]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+
+    def query(self, query_embeddings: list, top_k: int, topics=None):
+        rows, _ = self.search(query_embeddings, top_k, topics)
+        return [[self.document(int(row)) for row in query_rows] for query_rows in rows]
+
+
+def export_numpy_index(collections, index_dir=NUMPY_INDEX_DIR, page_size=1000):
+    # Dumps Chroma collections (the shards of a sharded index, or a single collection)
+    # into the files NumpyBackend memory-maps; a chunk stored in several shards is
+    # exported once, with the topics of all of them. The new index is written beside
+    # the old one and swapped in at the end.
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    owner = {}
+    topics = {}
+    for position, collection in enumerate(collections):
+        page = collection.get(include=["metadatas"])
+        for chunk_id, meta in zip(page["ids"], page["metadatas"] or [None] * len(page["ids"])):
+            owner.setdefault(chunk_id, position)
+            chunk_topics = topics.setdefault(chunk_id, [])
+            for topic in row_topics(meta):
+                if topic not in chunk_topics:
+                    chunk_topics.append(topic)
+    total = len(owner)
+    dim = None
+    vectors = None
+    ids, metadatas, offsets = [], [], [0]
+    with open(os.path.join(tmp_dir, "texts.bin"), "wb") as texts:
+        for position, collection in enumerate(collections):
+            for offset in range(0, collection.count(), page_size):
+                page = collection.get(
+                    limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"]
+                )
+                keep = [i for i, chunk_id in enumerate(page["ids"]) if owner[chunk_id] == position]
+                if not keep:
+                    continue
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)[keep]
+                if vectors is None:
+                    dim = embeddings.shape[1]
+                    vectors = np.lib.format.open_memmap(
+                        os.path.join(tmp_dir, "vectors.npy"), mode="w+", dtype=np.float16, shape=(total, dim)
+                    )
+                embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+                vectors[len(ids):len(ids) + len(embeddings)] = embeddings.astype(np.float16)
+                page_metadatas = page["metadatas"] or [{} for _ in page["ids"]]
+                for i in keep:
+                    encoded = (page["documents"][i] or "").encode("utf-8")
+                    texts.write(encoded)
+                    offsets.append(offsets[-1] + len(encoded))
+                    ids.append(page["ids"][i])
+                    metadata = page_metadatas[i] or {}
+                    if len(topics[page["ids"][i]]) > 1:
+                        metadata = {**metadata, "topics": topics[page["ids"][i]]}
+                    metadatas.append(metadata)
+
+    if vectors is None:
+        np.save(os.path.join(tmp_dir, "vectors.npy"), np.empty((0, 0), dtype=np.float16))
+    else:
+        vectors.flush()
+        del vectors
+    np.save(os.path.join(tmp_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(os.path.join(tmp_dir, "metadatas.json"), "w", encoding="utf-8") as f:
+        json.dump(metadatas, f, ensure_ascii=False)
+    write_lexical_index(tmp_dir)
+    write_fingerprint(tmp_dir)
+
+    old_dir = index_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(ids)
+
+
+def write_fingerprint(index_dir):
+    digest = hashlib.sha256()
+    for name in FINGERPRINT_FILES:
+        with open(os.path.join(index_dir, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    with open(os.path.join(index_dir, "fingerprint.json"), "w", encoding="utf-8") as f:
+        json.dump({"sha256": digest.hexdigest()}, f)
+    return digest.hexdigest()
+
+
+def index_fingerprint(index_dir=NUMPY_INDEX_DIR):
+    # Fingerprint of a NumPy index; one exported before fingerprints existed gets one now
+    try:
+        with open(os.path.join(index_dir, "fingerprint.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["sha256"]
+    except (OSError, ValueError, KeyError):
+        return write_fingerprint(index_dir)
+
+
+class QuantizedBackend:
+    # Exact-ish search for corpora too large to keep float16 vectors and chunk texts in
+    # RAM. Only one int8 code per dimension (scaled per dimension) and a topic code per
+    # chunk are scanned; the top QUANTIZED_RESCORE_FACTOR * k candidates are rescored
+    # against the float16 vectors of the NumPy index in source_dir, memory-mapped and
+    # paged in for those rows only, so they are not stored twice. Chunk texts, ids and
+    # metadata sit in zlib-compressed blocks that are decompressed just for the final
+    # hits. Raises ValueError when source_dir is missing or no longer the NumPy index it
+    # was built from.
+    def __init__(self, index_dir=QUANTIZED_INDEX_DIR, rescore_factor=QUANTIZED_RESCORE_FACTOR,
+                 cache_blocks=CHUNK_STORE_CACHE, source_dir=NUMPY_INDEX_DIR):
+        self.index_dir = index_dir
+        try:
+            with open(os.path.join(index_dir, "source.json"), "r", encoding="utf-8") as f:
+                self.source_fingerprint = json.load(f)["fingerprint"]
+        except (OSError, ValueError, KeyError):
+            raise ValueError(f"{index_dir} does not record the NumPy index it was built from; "
+                             "run vector_embedding.py to rebuild it")
+        if not os.path.exists(os.path.join(source_dir, "vectors.npy")):
+            raise ValueError(f"{index_dir} rescores against {source_dir}, which is missing; "
+                             "run vector_embedding.py to rebuild it")
+        if index_fingerprint(source_dir) != self.source_fingerprint:
+            raise ValueError(f"{index_dir} was built from an older version of {source_dir}; "
+                             "run vector_embedding.py to rebuild it")
+        self.codes = np.load(os.path.join(index_dir, "codes.npy"), mmap_mode="r")
+        self.scale = np.load(os.path.join(index_dir, "scale.npy"))
+        self.vectors = np.load(os.path.join(source_dir, "vectors.npy"), mmap_mode="r")
+        self.topic_codes = np.load(os.path.join(index_dir, "topic_codes.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "topics.json"), "r", encoding="utf-8") as f:
+            self.topics = json.load(f)
+        self.block_offsets = np.load(os.path.join(index_dir, "chunk_blocks.npy"))
+        self.chunk_store = np.memmap(os.path.join(index_dir, "chunks.bin"), dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(index_dir, "chunks.bin")) else b""
+        self.rescore_factor = max(1, rescore_factor)
+        self._block = lru_cache(maxsize=cache_blocks)(self._read_block)
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def _read_block(self, block: int):
+        start, end = int(self.block_offsets[block]), int(self.block_offsets[block + 1])
+        return json.loads(zlib.decompress(bytes(self.chunk_store[start:end])).decode("utf-8"))
+
+    def chunk(self, row: int):
+        # (id, document, metadata) of one row
+        return self._block(row // CHUNK_STORE_BLOCK)[row % CHUNK_STORE_BLOCK]
+
+    def topic_rows(self, topics):
+        # topics.json lists the distinct topic sets; each row has the code of its set
+        wanted = set(topics)
+        return np.isin(self.topic_codes,
+                       [i for i, topic_set in enumerate(self.topics) if not wanted.isdisjoint(topic_set)])
+
+    def search(self, query_embeddings: list, top_k: int, topics=None):
+        # Returns (rows, scores) like NumpyBackend.search; scores are float16-vector cosines
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        count = len(self)
+        allowed = self.topic_rows(topics) if topics else None
+        available = count if allowed is None else int(allowed.sum())
+        k = min(top_k, available)
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        # Dequantizing the codes is folded into the query: q . (codes * scale) = (q * scale) . codes.
+        # Only the best `candidates` approximate scores so far are kept per query, so memory
+        # grows with the block size rather than the corpus.
+        scaled = queries * self.scale
+        candidates = min(available, k * self.rescore_factor)
+        rows = np.empty((len(queries), 0), dtype=np.int64)
+        approximate = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, count, NUMPY_SEARCH_BLOCK):
+            block = np.asarray(self.codes[start:start + NUMPY_SEARCH_BLOCK], dtype=np.float32)
+            scores = scaled @ block.T
+            if allowed is not None:
+                scores[:, ~allowed[start:start + len(block)]] = -np.inf
+            block_rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            rows = np.concatenate([rows, block_rows], axis=1)
+            approximate = np.concatenate([approximate, scores], axis=1)
+            if approximate.shape[1] > candidates:
+                keep = np.argpartition(-approximate, candidates - 1, axis=1)[:, :candidates]
+                rows = np.take_along_axis(rows, keep, axis=1)
+                approximate = np.take_along_axis(approximate, keep, axis=1)
+
+        exact = np.empty(rows.shape, dtype=np.float32)
+        for i, query_rows in enumerate(rows):
+            order = np.argsort(query_rows)
+            vectors = np.asarray(self.vectors[query_rows[order]], dtype=np.float32)
+            exact[i, order] = vectors @ queries[i]
+        best = np.argsort(-exact, axis=1)[:, :k]
+        return np.take_along_axis(rows, best, axis=1), np.take_along_axis(exact, best, axis=1)
+
+    def query_hits(self, query_embeddings: list, top_k: int, include_embeddings: bool = False, topics=None):
+        rows, scores = self.search(query_embeddings, top_k, topics)
+        hits = []
+        for query_rows, query_scores in zip(rows, scores):
+            query_hits = []
+            for row, score in zip(query_rows, query_scores):
+                chunk_id, document, metadata = self.chunk(int(row))
+                query_hits.append({
+                    "id": chunk_id, "document": document, "metadata": metadata,
+                    "distance": float(2.0 - 2.0 * score),
+                    "embedding": np.asarray(self.vectors[int(row)], dtype=np.float32) if include_embeddings else None,
+                })
+            hits.append(query_hits)
+        return hits
+
+    def query(self, query_embeddings: list, top_k: int, topics=None):
+        rows, _ = self.search(query_embeddings, top_k, topics)
+        return [[self.chunk(int(row))[1] for row in query_rows] for query_rows in rows]
+
+
+def export_quantized_index(source_dir=NUMPY_INDEX_DIR, index_dir=QUANTIZED_INDEX_DIR):
+    # Builds the QuantizedBackend files from an exported NumPy index, with the same row
+    # order, so the BM25 postings of the NumPy index apply to it too. Returns the row count.
+    source = NumpyBackend(source_dir)
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    count = len(source)
+    dim = source.vectors.shape[1] if source.vectors.ndim == 2 else 0
+    # Symmetric per-dimension scale: the largest magnitude of a dimension maps to 127
+    peak = np.zeros(dim, dtype=np.float32)
+    for start in range(0, count, NUMPY_SEARCH_BLOCK):
+        block = np.asarray(source.vectors[start:start + NUMPY_SEARCH_BLOCK], dtype=np.float32)
+        peak = np.maximum(peak, np.abs(block).max(axis=0))
+    scale = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    if count:
+        codes = np.lib.format.open_memmap(os.path.join(tmp_dir, "codes.npy"), mode="w+", dtype=np.int8,
+                                          shape=(count, dim))
+        for start in range(0, count, NUMPY_SEARCH_BLOCK):
+            block = np.asarray(source.vectors[start:start + NUMPY_SEARCH_BLOCK], dtype=np.float32)
+            codes[start:start + len(block)] = np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+        codes.flush()
+        del codes
+    else:
+        np.save(os.path.join(tmp_dir, "codes.npy"), np.empty((0, dim), dtype=np.int8))
+    np.save(os.path.join(tmp_dir, "scale.npy"), scale)
+
+    metadatas = source.metadatas()
+    row_topic_sets = [tuple(sorted(topic or "" for topic in row_topics(meta))) for meta in metadatas]
+    topic_sets = sorted(set(row_topic_sets))
+    codes_by_set = {topic_set: i for i, topic_set in enumerate(topic_sets)}
+    np.save(os.path.join(tmp_dir, "topic_codes.npy"),
+            np.asarray([codes_by_set[topic_set] for topic_set in row_topic_sets], dtype=np.uint16))
+    with open(os.path.join(tmp_dir, "topics.json"), "w", encoding="utf-8") as f:
+        json.dump([list(topic_set) for topic_set in topic_sets], f, ensure_ascii=False)
+
+    block_offsets = [0]
+    with open(os.path.join(tmp_dir, "chunks.bin"), "wb") as chunks:
+        for start in range(0, count, CHUNK_STORE_BLOCK):
+            rows = range(start, min(count, start + CHUNK_STORE_BLOCK))
+            block = [[source.ids[row], source.document(row), metadatas[row]] for row in rows]
+            encoded = zlib.compress(json.dumps(block, ensure_ascii=False).encode("utf-8"), 6)
+            chunks.write(encoded)
+            block_offsets.append(block_offsets[-1] + len(encoded))
+    np.save(os.path.join(tmp_dir, "chunk_blocks.npy"), np.asarray(block_offsets, dtype=np.int64))
+    with open(os.path.join(tmp_dir, "source.json"), "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": index_fingerprint(source_dir)}, f)
+    del source
+
+    old_dir = index_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return count
+
+
+def resident_bytes(vector_store):
+    # Bytes a search keeps hot in memory, scanned or loaded for every query
+    def size(*names):
+        return sum(os.path.getsize(os.path.join(vector_store.index_dir, name)) for name in names)
+
+    if isinstance(vector_store, QuantizedBackend):
+        # The NumPy index's float16 vectors and the chunk store are read for the final rows only
+        return size("codes.npy", "scale.npy", "topic_codes.npy", "chunk_blocks.npy")
+    return size("vectors.npy", "offsets.npy", "texts.bin", "ids.json", "metadatas.json")
+
+
+class HybridBackend:
+    # Adds BM25 keyword search to a vector backend. `rows` is the NumpyBackend (or
+    # snapshot) whose rows the lexical index was built over; it supplies the texts,
+    # metadata and vectors of keyword matches. Both rankings are fused by reciprocal
+    # rank, so an exact drug or scheme name finds its passage even when the embedding
+    # ranks it low, without having to compare BM25 scores and distances.
+    def __init__(self, store, lexical, rows, mode=RETRIEVAL_MODE):
+        self.store = store
+        self.lexical = lexical
+        self.rows = rows
+        self.mode = mode
+
+    def __len__(self):
+        return len(self.store)
+
+    def lexical_hits(self, queries: list, top_k: int, include_embeddings: bool = False, topics=None):
+        # Same shape as query_hits; distance is None as BM25 scores are not distances
+        allowed = self.rows.topic_rows(topics) if topics else None
+        return [
+            [
+                {"id": self.rows.ids[int(row)], "document": self.rows.document(int(row)),
+                 "metadata": self.rows.metadata(int(row)), "distance": None, "score": float(score),
+                 "embedding": np.asarray(self.rows.vectors[int(row)], dtype=np.float32)
+                 if include_embeddings else None}
+                for row, score in zip(rows, scores)
+            ]
+            for rows, scores in self.lexical.search(queries, top_k, allowed)
+        ]
+
+    def query_hits(self, query_embeddings: list, top_k: int, include_embeddings: bool = False, topics=None,
+                   queries=None):
+        # Without the question texts only the vector backend can be asked
+        if queries is None:
+            return self.store.query_hits(query_embeddings, top_k, include_embeddings, topics)
+        if self.mode == "lexical":
+            # No query vector to rank against, so MMR is skipped and hits carry no embedding
+            return self.lexical_hits(queries, top_k, topics=topics)
+        vector_hits = self.store.query_hits(query_embeddings, top_k, include_embeddings, topics)
+        keyword_hits = self.lexical_hits(queries, top_k, include_embeddings, topics)
+        return [fuse_ranks([dense, sparse], top_k) for dense, sparse in zip(vector_hits, keyword_hits)]
+
+    def query(self, query_embeddings: list, top_k: int, topics=None, queries=None):
+        return [[hit["document"] for hit in hits]
+                for hits in self.query_hits(query_embeddings, top_k, topics=topics, queries=queries)]
+
+
+def fuse_ranks(rankings, top_k, k=RRF_K):
+    # Reciprocal-rank fusion of hit lists, best first; a chunk found by several lists
+    # keeps the hit of the first list that has it, so vector distances are preserved
+    scores, hits = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(hit["id"], hit)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [hits[chunk_id] for chunk_id in best]